@@ -17,6 +17,7 @@ class LoginRequiredMiddleware:
             '/admin/',  # Manter acesso ao admin
             '/static/',
             '/api/',    # API usa autenticação via API Key
+            '/webhooks/',  # Webhooks do n8n usam autenticação via API Key
         ]
         
         # Verifica se a URL atual está nas exceções
@@ -6,6 +6,7 @@ app_name = 'admin_panel'
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('webhook-queue/', views.webhook_queue_stats, name='webhook_queue_stats'),
     
     # Padarias CRUD
     path('padarias/', views.padarias_list, name='padarias_list'),
@@ -2,54 +2,70 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.http import JsonResponse
 from django.db.models import Count, Q
-from django.core.paginator import Paginator
+from django.utils import timezone
+from datetime import timedelta, timezone as dt_timezone
 
+from core.pagination import KeysetPaginator
 from core.permissions import require_admin_master
 from organizations.models import Padaria, PadariaUser, ApiKey
 from agents.models import Agent
 from audit.models import AuditLog
+from audit.queries import recent_activity
+from audit.rollups import activity_by_day, summarize
+from webhooks.queue import webhook_queue, queue_enabled
 
 
 @login_required
 @require_admin_master
 def dashboard(request):
     """Dashboard do admin master com métricas globais."""
-    # Métricas
-    total_padarias = Padaria.objects.count()
-    padarias_ativas = Padaria.objects.filter(is_active=True).count()
-    total_agents = Agent.objects.count()
-    agents_ativos = Agent.objects.filter(status='ativo').count()
+    # Métricas (uma consulta por tabela)
+    padarias_stats = Padaria.objects.aggregate(
+        total=Count('id', distinct=True),
+        ativas=Count('id', filter=Q(is_active=True), distinct=True),
+        sem_agente=Count('id', filter=Q(is_active=True, agents__isnull=True), distinct=True),
+    )
+    agents_stats = Agent.objects.aggregate(
+        total=Count('id'),
+        ativos=Count('id', filter=Q(status='ativo')),
+    )
     total_users = User.objects.filter(is_superuser=False).count()
     
+    # Atividade dos últimos 7 dias (resumos de atividade)
+    hoje = timezone.now().astimezone(dt_timezone.utc).date()
+    atividade = summarize(activity_by_day(hoje - timedelta(days=6)), hoje, chart_days=7)
+    
     # Padarias recentes
     padarias_recentes = Padaria.objects.select_related('owner').order_by('-created_at')[:5]
     
     # Agentes recentes
     agents_recentes = Agent.objects.select_related('padaria').order_by('-created_at')[:5]
     
-    # Logs recentes
-    logs_recentes = AuditLog.objects.select_related('padaria', 'actor').order_by('-created_at')[:10]
-    
-    # Padarias sem agente
-    padarias_sem_agente = Padaria.objects.annotate(
-        num_agents=Count('agents')
-    ).filter(num_agents=0, is_active=True).count()
-    
     context = {
-        'total_padarias': total_padarias,
-        'padarias_ativas': padarias_ativas,
-        'total_agents': total_agents,
-        'agents_ativos': agents_ativos,
+        'total_padarias': padarias_stats['total'],
+        'padarias_ativas': padarias_stats['ativas'],
+        'total_agents': agents_stats['total'],
+        'agents_ativos': agents_stats['ativos'],
         'total_users': total_users,
+        'api_calls_7_dias': atividade['api_calls'],
         'padarias_recentes': padarias_recentes,
         'agents_recentes': agents_recentes,
-        'logs_recentes': logs_recentes,
-        'padarias_sem_agente': padarias_sem_agente,
+        'padarias_sem_agente': padarias_stats['sem_agente'],
     }
     return render(request, 'admin_panel/dashboard.html', context)
 
 
+@login_required
+@require_admin_master
+def webhook_queue_stats(request):
+    """Métricas da fila local dos webhooks (modo WEBHOOK_ASYNC), em JSON."""
+    if not queue_enabled():
+        return JsonResponse({"enabled": False})
+    return JsonResponse({"enabled": True, **webhook_queue.stats()})
+
+
 @login_required
 @require_admin_master
 def padarias_list(request):
@@ -60,7 +76,7 @@ def padarias_list(request):
     padarias = Padaria.objects.select_related('owner').annotate(
         num_agents=Count('agents'),
         num_members=Count('members')
-    ).order_by('-created_at')
+    )
     
     if search:
         padarias = padarias.filter(
@@ -76,10 +92,8 @@ def padarias_list(request):
     elif status_filter == 'sem_agente':
         padarias = padarias.filter(num_agents=0)
     
-    # Paginação
-    paginator = Paginator(padarias, 20)
-    page = request.GET.get('page')
-    padarias = paginator.get_page(page)
+    # Paginação por cursor (sem OFFSET); total estimado
+    padarias = KeysetPaginator(padarias, 20, count="estimate").get_page(request.GET.get('cursor'))
     
     context = {
         'padarias': padarias,
@@ -202,7 +216,7 @@ def padaria_detail(request, slug):
     api_keys = padaria.api_keys.order_by('-created_at')
     
     # Logs recentes
-    logs = AuditLog.objects.filter(padaria=padaria).order_by('-created_at')[:10]
+    logs = recent_activity(limit=10, padaria=padaria)
     
     context = {
         'padaria': padaria,
@@ -399,7 +413,7 @@ def agents_list(request):
     search = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
     
-    agents = Agent.objects.select_related('padaria').order_by('-created_at')
+    agents = Agent.objects.select_related('padaria')
     
     if search:
         agents = agents.filter(
@@ -411,10 +425,8 @@ def agents_list(request):
     if status_filter:
         agents = agents.filter(status=status_filter)
     
-    # Paginação
-    paginator = Paginator(agents, 20)
-    page = request.GET.get('page')
-    agents = paginator.get_page(page)
+    # Paginação por cursor (sem OFFSET); total estimado
+    agents = KeysetPaginator(agents, 20, count="estimate").get_page(request.GET.get('cursor'))
     
     context = {
         'agents': agents,
@@ -441,7 +453,7 @@ def agent_detail(request, slug):
 def padaria_apikey(request, slug):
     """Gerenciar API Keys da padaria."""
     padaria = get_object_or_404(Padaria, slug=slug)
-    api_keys = padaria.api_keys.order_by('-created_at')
+    api_keys = KeysetPaginator(padaria.api_keys.all(), 50, count=None).get_page(request.GET.get('cursor'))
     
     context = {
         'padaria': padaria,
@@ -485,7 +497,7 @@ def users_list(request):
     """Lista todos os usuarios do sistema."""
     search = request.GET.get('search', '')
     
-    users = User.objects.filter(is_superuser=False).order_by('username')
+    users = User.objects.filter(is_superuser=False)
     
     if search:
         users = users.filter(
@@ -495,10 +507,10 @@ def users_list(request):
             Q(last_name__icontains=search)
         )
     
-    # Paginacao
-    paginator = Paginator(users, 20)
-    page = request.GET.get('page')
-    users = paginator.get_page(page)
+    # Paginacao por cursor (sem OFFSET); total estimado
+    users = KeysetPaginator(users, 20, ordering=('username', 'id'), count="estimate").get_page(
+        request.GET.get('cursor')
+    )
     
     context = {
         'users': users,
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Agent
+from .models import Agent, KnowledgeChunk
 
 
 @admin.register(Agent)
@@ -8,7 +8,7 @@ class AgentAdmin(admin.ModelAdmin):
     search_fields = ("name", "slug", "padaria__name", "role", "sector")
     list_filter = ("status", "personality", "role", "sector", "created_at")
     prepopulated_fields = {"slug": ("name",)}
-    readonly_fields = ("knowledge_updated_at", "created_at", "updated_at")
+    readonly_fields = ("knowledge_updated_at", "version", "created_at", "updated_at")
     autocomplete_fields = ("padaria",)
     
     fieldsets = (
@@ -44,7 +44,15 @@ class AgentAdmin(admin.ModelAdmin):
             "classes": ("collapse",)
         }),
         ("Metadados", {
-            "fields": ("created_at", "updated_at"),
+            "fields": ("version", "created_at", "updated_at"),
             "classes": ("collapse",)
         }),
     )
+
+
+@admin.register(KnowledgeChunk)
+class KnowledgeChunkAdmin(admin.ModelAdmin):
+    list_display = ("agent", "position", "source", "title", "size", "chunk_id")
+    search_fields = ("agent__slug", "title", "chunk_id")
+    list_filter = ("source",)
+    readonly_fields = ("agent", "chunk_id", "source", "position", "title", "text", "start", "end", "size", "created_at")
@@ -0,0 +1,100 @@
+"""
+Montagem do contexto de prompt do agente dentro de um orçamento de tokens.
+
+O contexto é formado pela persona do agente (função, personalidade,
+diretrizes, regra de escalonamento e saudação renderizada) seguida dos
+trechos de conhecimento mais relevantes para a mensagem do cliente (busca
+BM25) que couberem no orçamento. A contagem de tokens de cada trecho é
+calculada na escrita (KnowledgeChunk.tokens) e fica no índice em memória.
+"""
+import math
+from .models import KnowledgeChunk
+from .search import search_chunks
+
+# Estimativa simples: ~4 caracteres por token (bom o suficiente para orçamento)
+CHARS_PER_TOKEN = 4
+
+KNOWLEDGE_HEADER = "## Base de conhecimento"
+
+
+def estimate_tokens(text):
+    """Estimativa do número de tokens de um texto."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def format_passage(title, text):
+    """Trecho como aparece no contexto (título como subtítulo Markdown)."""
+    return f"### {title}\n{text}" if title else text
+
+
+def build_persona(agent, cliente_nome="Cliente"):
+    """Campos de persona do agente, com a saudação já renderizada."""
+    return {
+        "name": agent.name,
+        "padaria": agent.padaria.name,
+        "role": agent.get_role_display(),
+        "personality": agent.get_personality_display(),
+        "style_guidelines": agent.style_guidelines,
+        "escalation_rule": agent.escalation_rule,
+        "greeting": agent.render_greeting(cliente_nome=cliente_nome),
+    }
+
+
+def render_persona(persona):
+    """Bloco de texto da persona (início do system prompt)."""
+    return "\n\n".join([
+        f"Você é {persona['name']}, {persona['role']} da {persona['padaria']}.",
+        f"Personalidade: {persona['personality']}",
+        f"Diretrizes de estilo:\n{persona['style_guidelines']}",
+        f"Regra de escalonamento:\n{persona['escalation_rule']}",
+        f"Saudação: {persona['greeting']}",
+    ])
+
+
+def assemble_context(agent, message, budget, cliente_nome="Cliente", max_passages=20):
+    """
+    Monta o contexto para a mensagem dentro do orçamento de tokens.
+    Os trechos são escolhidos por relevância; um trecho que não cabe é
+    pulado e o próximo (menor) ainda pode entrar.
+    Retorna dict com persona, passages, context (texto pronto) e tokens usados.
+    """
+    persona = build_persona(agent, cliente_nome)
+    persona_text = render_persona(persona)
+    used = estimate_tokens(persona_text)
+    # Separador + cabeçalho da seção de conhecimento
+    overhead = estimate_tokens(f"\n\n{KNOWLEDGE_HEADER}\n\n")
+
+    def pick(index):
+        selected = []
+        remaining = budget - used - overhead
+        for pk, score in index.search(message, max_passages):
+            tokens = index.tokens_for(pk) + 1  # separador entre trechos
+            if tokens <= remaining:
+                selected.append((pk, score))
+                remaining -= tokens
+        return selected
+
+    queryset = KnowledgeChunk.objects.only("chunk_id", "source", "title", "text", "tokens")
+    passages = [
+        {
+            "chunk_id": chunk.chunk_id,
+            "source": chunk.source,
+            "title": chunk.title,
+            "score": round(score, 4),
+            "tokens": chunk.tokens,
+            "text": chunk.text,
+        }
+        for chunk, score in search_chunks(agent.id, agent.knowledge_updated_at, pick, queryset)
+    ]
+
+    context = persona_text
+    if passages:
+        blocks = "\n\n".join(format_passage(p["title"], p["text"]) for p in passages)
+        context = f"{persona_text}\n\n{KNOWLEDGE_HEADER}\n\n{blocks}"
+
+    return {
+        "persona": persona,
+        "passages": passages,
+        "context": context,
+        "tokens": estimate_tokens(context),
+    }
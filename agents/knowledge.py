@@ -0,0 +1,195 @@
+"""
+Divisão da base de conhecimento dos agentes em chunks estáveis.
+
+O Markdown (knowledge_base) é dividido por seção (cabeçalhos #) e o texto
+extraído do PDF por parágrafos agrupados. Cada chunk tem um ID derivado do
+seu conteúdo (sha256), então o mesmo trecho mantém o mesmo ID entre
+reprocessamentos e o cliente pode cachear chunks por ID.
+"""
+import hashlib
+import re
+
+# Tamanho alvo (em caracteres) de um chunk
+CHUNK_MAX_CHARS = 2000
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+
+
+def make_chunk_id(source, text):
+    """ID estável (endereçado por conteúdo) de um chunk."""
+    return hashlib.sha256(f"{source}\n{text}".encode("utf-8")).hexdigest()[:24]
+
+
+def _paragraph_spans(text, offset=0):
+    """Retorna (start, end) de cada parágrafo não vazio do texto."""
+    spans = []
+    start = 0
+    for match in PARAGRAPH_BREAK_RE.finditer(text):
+        if text[start:match.start()].strip():
+            spans.append((offset + start, offset + match.start()))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((offset + start, offset + len(text)))
+    return spans
+
+
+def _split_long_span(text, start, end, max_chars):
+    """Quebra um parágrafo maior que max_chars em quebras de linha/espaço."""
+    pieces = []
+    while end - start > max_chars:
+        cut = max(text.rfind("\n", start, start + max_chars), text.rfind(" ", start, start + max_chars))
+        if cut <= start:
+            cut = start + max_chars
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def _group_spans(text, spans, max_chars=CHUNK_MAX_CHARS):
+    """Agrupa parágrafos consecutivos em blocos de até max_chars."""
+    groups = []
+    bounded = []
+    for start, end in spans:
+        bounded.extend(_split_long_span(text, start, end, max_chars))
+    for start, end in bounded:
+        if groups and end - groups[-1][0] <= max_chars:
+            groups[-1] = (groups[-1][0], end)
+        else:
+            groups.append((start, end))
+    return groups
+
+
+def split_markdown(text, max_chars=CHUNK_MAX_CHARS):
+    """
+    Divide o Markdown por seção. O título de cada chunk é o caminho dos
+    cabeçalhos (ex.: "Produtos da Padaria > Pães"). Seções grandes são
+    subdivididas por parágrafo.
+    Retorna lista de dicts {title, start, end}.
+    """
+    sections = []
+    stack = []
+    section_start = body_start = 0
+    section_title = ""
+    position = 0
+    for line in text.splitlines(keepends=True):
+        match = HEADING_RE.match(line.rstrip("\n"))
+        if match:
+            # Seções só com o cabeçalho não viram chunk (o título vai nos filhos)
+            if text[body_start:position].strip():
+                sections.append((section_title, section_start, position))
+            level = len(match.group(1))
+            stack = [(lvl, title) for lvl, title in stack if lvl < level]
+            stack.append((level, match.group(2)))
+            section_title = " > ".join(title for _, title in stack)
+            section_start = position
+            body_start = position + len(line)
+        position += len(line)
+    if text[body_start:].strip():
+        sections.append((section_title, section_start, len(text)))
+
+    chunks = []
+    for title, start, end in sections:
+        if end - start <= max_chars:
+            chunks.append({"title": title, "start": start, "end": end})
+            continue
+        spans = _paragraph_spans(text[start:end], start)
+        for group_start, group_end in _group_spans(text, spans, max_chars):
+            chunks.append({"title": title, "start": group_start, "end": group_end})
+    return chunks
+
+
+def split_plain_text(text, max_chars=CHUNK_MAX_CHARS):
+    """Divide texto corrido (PDF) em grupos de parágrafos."""
+    return [
+        {"title": f"PDF - parte {index}", "start": start, "end": end}
+        for index, (start, end) in enumerate(_group_spans(text, _paragraph_spans(text), max_chars), start=1)
+    ]
+
+
+def build_chunks(agent):
+    """
+    Gera a lista ordenada de chunks do agente (sem gravar).
+    Trechos idênticos (mesmo ID) aparecem uma única vez.
+    """
+    sources = [("base", agent.knowledge_base or "", split_markdown)]
+    if agent.knowledge_pdf and agent.knowledge_pdf_text:
+        sources.append(("pdf", agent.knowledge_pdf_text, split_plain_text))
+
+    chunks = []
+    seen = set()
+    for source, text, splitter in sources:
+        for piece in splitter(text):
+            raw = text[piece["start"]:piece["end"]]
+            chunk_text = raw.strip()
+            if not chunk_text:
+                continue
+            start = piece["start"] + len(raw) - len(raw.lstrip())
+            chunk_id = make_chunk_id(source, chunk_text)
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            chunks.append({
+                "chunk_id": chunk_id,
+                "source": source,
+                "title": piece["title"][:200],
+                "text": chunk_text,
+                "start": start,
+                "end": start + len(chunk_text),
+                "size": len(chunk_text.encode("utf-8")),
+            })
+    return chunks
+
+
+def rebuild_chunks(agent, force=False):
+    """
+    Sincroniza os KnowledgeChunk do agente com o conteúdo atual.
+    Chunks inalterados mantêm a linha (apenas posição/offsets são
+    atualizados); novos são inseridos (já com os termos do índice de busca
+    e a contagem de tokens) e os removidos, apagados. force=True recalcula
+    termos e tokens de todos, mantendo as linhas (os pks ficam válidos nos
+    índices em cache dos workers). Retorna a quantidade de chunks do agente.
+    """
+    from .context import estimate_tokens, format_passage
+    from .models import KnowledgeChunk
+    from .search import index_terms
+
+    chunks = build_chunks(agent)
+    existing = {
+        chunk.chunk_id: chunk
+        for chunk in KnowledgeChunk.objects.filter(agent=agent).defer("text", "terms")
+    }
+
+    to_create = []
+    to_update = []
+    for position, data in enumerate(chunks):
+        current = existing.pop(data["chunk_id"], None)
+        if current is None:
+            terms, length = index_terms(f"{data['title']}\n{data['text']}")
+            tokens = estimate_tokens(format_passage(data["title"], data["text"]))
+            to_create.append(KnowledgeChunk(
+                agent=agent, position=position, terms=terms, length=length, tokens=tokens, **data
+            ))
+        elif force or (current.position, current.start, current.end, current.title) != (
+            position, data["start"], data["end"], data["title"]
+        ):
+            if force or current.title != data["title"]:
+                # O título entra no índice de busca
+                current.terms, current.length = index_terms(f"{data['title']}\n{data['text']}")
+                current.tokens = estimate_tokens(format_passage(data["title"], data["text"]))
+            current.position = position
+            current.start = data["start"]
+            current.end = data["end"]
+            current.title = data["title"]
+            to_update.append(current)
+
+    if existing:
+        KnowledgeChunk.objects.filter(pk__in=[chunk.pk for chunk in existing.values()]).delete()
+    if to_update:
+        KnowledgeChunk.objects.bulk_update(
+            to_update, ["position", "start", "end", "title", "terms", "length", "tokens"], batch_size=500
+        )
+    if to_create:
+        KnowledgeChunk.objects.bulk_create(to_create, batch_size=500)
+    return len(chunks)
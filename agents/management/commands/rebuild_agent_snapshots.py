@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from agents.models import Agent
+from agents.snapshots import rebuild_snapshots, invalidate_snapshots
+
+
+class Command(BaseCommand):
+    help = "Reconstrói os snapshots (config e conhecimento) servidos pela API do n8n."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--slug",
+            action="append",
+            dest="slugs",
+            help="Reconstruir apenas o agente com este slug (pode repetir)",
+        )
+
+    def handle(self, *args, **options):
+        agents = Agent.objects.select_related("padaria").order_by("id")
+        if options["slugs"]:
+            agents = agents.filter(slug__in=options["slugs"])
+
+        # Agentes inativos apenas têm seus snapshots removidos
+        for slug in agents.filter(is_active=False).values_list("slug", flat=True):
+            invalidate_snapshots(slug)
+
+        total = rebuild_snapshots(agents.filter(is_active=True).iterator(chunk_size=200))
+        self.stdout.write(self.style.SUCCESS(f"{total} agente(s) com snapshots reconstruídos."))
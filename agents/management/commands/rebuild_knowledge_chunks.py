@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from agents.knowledge import rebuild_chunks
+from agents.models import Agent
+
+
+class Command(BaseCommand):
+    help = (
+        "Redivide a base de conhecimento (Markdown + PDF) dos agentes em chunks e recalcula os termos da busca. "
+        "As linhas existentes são mantidas; os workers usam os termos novos quando remontam o índice do agente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--slug",
+            action="append",
+            dest="slugs",
+            help="Processar apenas o agente com este slug (pode repetir)",
+        )
+
+    def handle(self, *args, **options):
+        agents = Agent.objects.order_by("id")
+        if options["slugs"]:
+            agents = agents.filter(slug__in=options["slugs"])
+
+        total_agents = 0
+        total_chunks = 0
+        for agent in agents.iterator(chunk_size=50):
+            total_chunks += rebuild_chunks(agent, force=True)
+            total_agents += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_chunks} chunk(s) gerados para {total_agents} agente(s)."
+        ))
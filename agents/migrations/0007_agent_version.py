@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_add_agent_to_apikey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Incrementada a cada alteração do agente', verbose_name='Versão'),
+        ),
+    ]
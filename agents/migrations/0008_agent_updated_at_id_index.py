@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0007_agent_version'),
+        ('organizations', '0002_add_agent_to_apikey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['updated_at', 'id'], name='agents_agen_updated_9da9a7_idx'),
+        ),
+    ]
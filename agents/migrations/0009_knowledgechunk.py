@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0008_agent_updated_at_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_id', models.CharField(max_length=64, verbose_name='ID do Chunk')),
+                ('source', models.CharField(choices=[('base', 'Base de Conhecimento'), ('pdf', 'PDF')], max_length=10, verbose_name='Origem')),
+                ('position', models.PositiveIntegerField(verbose_name='Posição')),
+                ('title', models.CharField(blank=True, max_length=200, verbose_name='Título')),
+                ('text', models.TextField(verbose_name='Texto')),
+                ('start', models.PositiveIntegerField(help_text='Offset inicial no texto de origem', verbose_name='Início')),
+                ('end', models.PositiveIntegerField(help_text='Offset final no texto de origem', verbose_name='Fim')),
+                ('size', models.PositiveIntegerField(verbose_name='Tamanho (bytes)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='knowledge_chunks', to='agents.agent', verbose_name='Agente')),
+            ],
+            options={
+                'verbose_name': 'Chunk de Conhecimento',
+                'verbose_name_plural': 'Chunks de Conhecimento',
+                'ordering': ['agent', 'position'],
+                'indexes': [models.Index(fields=['agent', 'position'], name='agents_know_agent_i_da45da_idx')],
+                'unique_together': {('agent', 'chunk_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0009_knowledgechunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgechunk',
+            name='length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Tamanho (termos)'),
+        ),
+        migrations.AddField(
+            model_name='knowledgechunk',
+            name='terms',
+            field=models.JSONField(blank=True, default=dict, help_text='Frequência dos termos normalizados (índice de busca BM25)', verbose_name='Termos'),
+        ),
+    ]
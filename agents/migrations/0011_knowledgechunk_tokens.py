@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0010_knowledgechunk_search_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgechunk',
+            name='tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Estimativa de tokens do trecho formatado (montagem de contexto)', verbose_name='Tokens'),
+        ),
+    ]
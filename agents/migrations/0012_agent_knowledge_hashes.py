@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+def fill_knowledge_hashes(apps, schema_editor):
+    """Calcula os hashes dos agentes existentes (evita reenviar tudo ao n8n no próximo save)."""
+    from agents.utils import content_hash, file_hash
+
+    Agent = apps.get_model('agents', 'Agent')
+    for agent in Agent.objects.exclude(knowledge_pdf='', knowledge_pdf_text='').iterator():
+        agent.knowledge_pdf_hash = file_hash(agent.knowledge_pdf)
+        agent.knowledge_pdf_text_hash = content_hash(agent.knowledge_pdf_text)
+        agent.save(update_fields=['knowledge_pdf_hash', 'knowledge_pdf_text_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0011_knowledgechunk_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='knowledge_pdf_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Hash do PDF'),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='knowledge_pdf_text_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Hash do Texto do PDF'),
+        ),
+        migrations.RunPython(fill_knowledge_hashes, migrations.RunPython.noop),
+    ]
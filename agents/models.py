@@ -1,5 +1,5 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
 from organizations.models import Padaria
@@ -237,6 +237,21 @@ class Agent(models.Model):
         verbose_name="Texto Extraído do PDF",
         help_text="Texto extraído automaticamente do PDF para busca e preview"
     )
+    # Hashes do conteúdo (SHA-256): notificações ao n8n só quando o conhecimento muda
+    knowledge_pdf_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Hash do PDF"
+    )
+    knowledge_pdf_text_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Hash do Texto do PDF"
+    )
     knowledge_pdf_category = models.CharField(
         max_length=50,
         blank=True,
@@ -272,6 +287,14 @@ class Agent(models.Model):
         help_text="URL do webhook do N8N para notificar atualizações (ex: quando PDF é upado)"
     )
     
+    # Versão monotônica (incrementada a cada save) usada nos snapshots da API
+    version = models.PositiveBigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Versão",
+        help_text="Incrementada a cada alteração do agente"
+    )
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
@@ -281,6 +304,10 @@ class Agent(models.Model):
         verbose_name_plural = "Agentes"
         ordering = ["-created_at"]
         unique_together = [("padaria", "slug")]
+        indexes = [
+            # Feed de alterações (keyset em updated_at, id)
+            models.Index(fields=["updated_at", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.padaria.name})"
@@ -295,6 +322,13 @@ class Agent(models.Model):
                 )
 
     def save(self, *args, **kwargs):
+        # A linha fica travada (select_for_update) do cálculo da versão até o
+        # UPDATE: saves concorrentes e o incremento da renomeação da padaria
+        # (F("version") + 1) não fazem a versão voltar nem se repetir.
+        with transaction.atomic():
+            self._save_locked(*args, **kwargs)
+
+    def _save_locked(self, *args, **kwargs):
         from django.utils import timezone
         
         # Validar limite de 1 agente por padaria
@@ -309,19 +343,48 @@ class Agent(models.Model):
         if not self.business_hours:
             self.business_hours = DEFAULT_BUSINESS_HOURS
         
-        # Atualizar knowledge_updated_at se PDF ou knowledge_base mudou
+        # Atualizar knowledge_updated_at se PDF, texto do PDF ou knowledge_base mudou
+        # (_knowledge_changed é usado pelo signal que reconstrói os chunks;
+        # _pdf_changed/_pdf_text_changed, pelas notificações ao n8n). PDF e
+        # texto são comparados pelos hashes, sem reler o texto antigo do banco.
+        from .utils import content_hash, file_hash
+        
+        self._knowledge_changed = False
+        self.knowledge_pdf_text_hash = content_hash(self.knowledge_pdf_text)
+        old_knowledge = None
         if self.pk:
-            try:
-                old_instance = Agent.objects.get(pk=self.pk)
-                if (old_instance.knowledge_pdf != self.knowledge_pdf or 
-                    old_instance.knowledge_base != self.knowledge_base):
-                    self.knowledge_updated_at = timezone.now()
-            except Agent.DoesNotExist:
-                pass
+            old_knowledge = Agent.objects.select_for_update().filter(pk=self.pk).values(
+                "knowledge_pdf", "knowledge_base", "knowledge_pdf_hash", "knowledge_pdf_text_hash", "version"
+            ).first()
+        if old_knowledge is None:
+            # Novo agente (ou removido do banco)
+            self.knowledge_pdf_hash = file_hash(self.knowledge_pdf)
+            self._pdf_changed = bool(self.knowledge_pdf_hash)
+            self._pdf_text_changed = bool(self.knowledge_pdf_text_hash)
+            self._knowledge_changed = True
+            if not self.pk and (self.knowledge_pdf or self.knowledge_base != DEFAULT_KNOWLEDGE_BASE):
+                self.knowledge_updated_at = timezone.now()
         else:
-            # Novo agente
-            if self.knowledge_pdf or self.knowledge_base != DEFAULT_KNOWLEDGE_BASE:
+            pdf_renamed = (old_knowledge["knowledge_pdf"] or "") != (self.knowledge_pdf.name or "")
+            if pdf_renamed or not getattr(self.knowledge_pdf, "_committed", True):
+                self.knowledge_pdf_hash = file_hash(self.knowledge_pdf)
+            self._pdf_changed = old_knowledge["knowledge_pdf_hash"] != self.knowledge_pdf_hash
+            self._pdf_text_changed = old_knowledge["knowledge_pdf_text_hash"] != self.knowledge_pdf_text_hash
+            if (pdf_renamed or self._pdf_changed or self._pdf_text_changed or
+                    old_knowledge["knowledge_base"] != self.knowledge_base):
+                self._knowledge_changed = True
                 self.knowledge_updated_at = timezone.now()
+        
+        # Incrementar versão (usada nos snapshots da API) a partir da gravada,
+        # não da desta instância, que pode estar desatualizada
+        self.version = (old_knowledge["version"] if old_knowledge else 0) + 1
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"version", "updated_at"}
+            if {"knowledge_pdf", "knowledge_pdf_text"} & kwargs["update_fields"]:
+                kwargs["update_fields"] |= {"knowledge_pdf_hash", "knowledge_pdf_text_hash", "knowledge_updated_at"}
+            if "knowledge_base" in kwargs["update_fields"]:
+                kwargs["update_fields"] |= {"knowledge_updated_at"}
             
         super().save(*args, **kwargs)
 
@@ -345,5 +408,57 @@ class Agent(models.Model):
         return dict(TONE_CHOICES).get(self.tone, self.tone)
 
 
+class KnowledgeChunk(models.Model):
+    """
+    Trecho da base de conhecimento de um agente (seção do Markdown ou
+    grupo de parágrafos do PDF), gerado na escrita por agents.knowledge.
+    O chunk_id é derivado do conteúdo e permanece estável entre reprocessamentos.
+    """
+    SOURCE_CHOICES = [
+        ('base', 'Base de Conhecimento'),
+        ('pdf', 'PDF'),
+    ]
+    
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name="knowledge_chunks",
+        verbose_name="Agente"
+    )
+    chunk_id = models.CharField(max_length=64, verbose_name="ID do Chunk")
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, verbose_name="Origem")
+    position = models.PositiveIntegerField(verbose_name="Posição")
+    title = models.CharField(max_length=200, blank=True, verbose_name="Título")
+    text = models.TextField(verbose_name="Texto")
+    start = models.PositiveIntegerField(verbose_name="Início", help_text="Offset inicial no texto de origem")
+    end = models.PositiveIntegerField(verbose_name="Fim", help_text="Offset final no texto de origem")
+    size = models.PositiveIntegerField(verbose_name="Tamanho (bytes)")
+    terms = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Termos",
+        help_text="Frequência dos termos normalizados (índice de busca BM25)"
+    )
+    length = models.PositiveIntegerField(default=0, verbose_name="Tamanho (termos)")
+    tokens = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Tokens",
+        help_text="Estimativa de tokens do trecho formatado (montagem de contexto)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    
+    class Meta:
+        verbose_name = "Chunk de Conhecimento"
+        verbose_name_plural = "Chunks de Conhecimento"
+        ordering = ["agent", "position"]
+        unique_together = [("agent", "chunk_id")]
+        indexes = [
+            models.Index(fields=["agent", "position"]),
+        ]
+    
+    def __str__(self):
+        return f"{self.agent.slug} #{self.position} ({self.chunk_id})"
+
+
 # Alias para compatibilidade
 Organization = Padaria
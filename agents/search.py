@@ -0,0 +1,168 @@
+"""
+Busca BM25 na base de conhecimento dos agentes (em processo, sem serviço externo).
+
+Na escrita (rebuild dos chunks) cada chunk recebe as frequências dos seus
+termos já normalizados (minúsculas, sem acento, sem stopwords, com stemming
+leve para português). Na consulta, o índice invertido do agente é montado a
+partir desses termos uma vez e fica em um cache LRU do processo, indexado
+pela versão do agente. `search_chunks` carrega os chunks dos resultados e
+remonta o índice se algum não existir mais (linhas recriadas).
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from django.conf import settings
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Parâmetros BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era essa essas esse esses esta estas este estes eu
+foi for ha isso isto ja la lhe lhes mais mas me mesmo meu minha muito na nas nem no nos nossa
+nosso num numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu seus
+so sua suas tambem te tem tu tua um uma umas uns voce voces vos
+""".split())
+
+# Sufixos removidos em ordem (após remover acentos); (sufixo, substituto, tamanho mínimo do radical)
+PLURAL_RULES = [
+    ("amos", "", 2), ("emos", "", 2), ("imos", "", 2), ("oes", "ao", 1), ("aes", "ao", 1), ("ais", "al", 1), ("eis", "el", 2), ("ois", "ol", 1),
+    ("ns", "m", 1), ("res", "r", 2), ("s", "", 2),
+]
+SUFFIX_RULES = [
+    ("amente", "", 3), ("mente", "", 3), ("zinho", "", 2), ("zinha", "", 2), ("inho", "", 3),
+    ("inha", "", 3), ("idade", "", 3), ("ismo", "", 3), ("ista", "", 3), ("avel", "", 3),
+    ("ivel", "", 3), ("cao", "", 3), ("ando", "", 2), ("endo", "", 2), ("indo", "", 2),
+    ("aram", "", 2), ("eram", "", 2), ("iram", "", 2), ("ava", "", 2), ("ado", "", 2), ("ada", "", 2), ("ido", "", 2),
+    ("ida", "", 2), ("ar", "", 2), ("er", "", 2), ("ir", "", 2), ("ou", "", 2),
+]
+
+
+def fold_accents(text):
+    """Remove acentos: "Pão de Açúcar" -> "Pao de Acucar"."""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in normalized if not unicodedata.combining(char))
+
+
+def _apply_first(word, rules):
+    for suffix, replacement, min_stem in rules:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def stem(word):
+    """Stemming leve para português (plural, sufixos comuns, vogal temática)."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    word = _apply_first(word, PLURAL_RULES)
+    word = _apply_first(word, SUFFIX_RULES)
+    if len(word) > 3 and word[-1] in "aeo":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Texto -> lista de termos normalizados."""
+    words = TOKEN_RE.findall(fold_accents(text.lower()))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+def index_terms(text):
+    """Frequência dos termos de um chunk e seu tamanho (em termos)."""
+    tokens = tokenize(text)
+    return dict(Counter(tokens)), len(tokens)
+
+
+class KnowledgeIndex:
+    """Índice invertido BM25 dos chunks de um agente."""
+
+    def __init__(self, rows):
+        # rows: iterável de (pk, terms, length, tokens)
+        self.doc_ids = []
+        self.lengths = []
+        self.tokens = {}
+        self.postings = {}
+        for position, (pk, terms, length, tokens) in enumerate(rows):
+            self.doc_ids.append(pk)
+            self.lengths.append(length)
+            self.tokens[pk] = tokens
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+        total = len(self.doc_ids)
+        self.avg_length = (sum(self.lengths) / total) if total else 0
+
+    def tokens_for(self, pk):
+        """Tokens (estimados) do chunk, pré-calculados na escrita."""
+        return self.tokens.get(pk, 0)
+
+    def search(self, query, k=5):
+        """Retorna [(pk, score)] dos k chunks mais relevantes."""
+        total = len(self.doc_ids)
+        if not total:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / (self.avg_length or 1))
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[position], score) for position, score in best]
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_index(agent_id, version, refresh=False):
+    """
+    Índice do agente, do cache LRU do processo ou montado a partir dos
+    termos gravados nos chunks. version deve mudar quando o conhecimento muda;
+    refresh=True ignora o cache (ex.: chunks recriados pelo comando de rebuild).
+    """
+    from .models import KnowledgeChunk
+
+    key = (agent_id, version)
+    with _index_lock:
+        if key in _index_cache and not refresh:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    rows = KnowledgeChunk.objects.filter(agent_id=agent_id).values_list("pk", "terms", "length", "tokens")
+    index = KnowledgeIndex(rows.iterator(chunk_size=500))
+
+    with _index_lock:
+        # Descartar versões antigas do mesmo agente
+        for stale in [cached for cached in _index_cache if cached[0] == agent_id]:
+            del _index_cache[stale]
+        _index_cache[key] = index
+        while len(_index_cache) > getattr(settings, "KNOWLEDGE_SEARCH_CACHE_SIZE", 128):
+            _index_cache.popitem(last=False)
+    return index
+
+
+def search_chunks(agent_id, version, pick, queryset=None):
+    """
+    Roda pick(index) -> [(pk, score)] no índice do agente e carrega os
+    chunks. Se algum pk não existe mais (chunks recriados sem mudar a
+    versão), remonta o índice e escolhe de novo. Retorna [(chunk, score)].
+    """
+    from .models import KnowledgeChunk
+
+    queryset = queryset if queryset is not None else KnowledgeChunk.objects.all()
+    hits = pick(get_index(agent_id, version))
+    chunks = queryset.in_bulk([pk for pk, _ in hits])
+    if len(chunks) < len(hits):
+        hits = pick(get_index(agent_id, version, refresh=True))
+        chunks = queryset.in_bulk([pk for pk, _ in hits])
+    return [(chunks[pk], score) for pk, score in hits if pk in chunks]
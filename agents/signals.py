@@ -1,19 +1,83 @@
 """
 Signals para o app agents.
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
+from organizations.models import Padaria
 from .models import Agent
-import requests
+from .knowledge import rebuild_chunks
+from .snapshots import store_snapshots, invalidate_snapshots, rebuild_snapshots
+from integrations.models import OutboundDelivery
+from integrations.outbox import enqueue
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@receiver(post_save, sender=Agent)
+def refresh_agent_snapshots(sender, instance, **kwargs):
+    """
+    Invalida os snapshots da API imediatamente e os reconstrói após o commit.
+    """
+    invalidate_snapshots(instance.slug)
+    transaction.on_commit(lambda: store_snapshots(instance))
+
+
+@receiver(post_save, sender=Agent)
+def rebuild_agent_knowledge_chunks(sender, instance, **kwargs):
+    """
+    Redivide a base de conhecimento em chunks quando ela muda
+    (mesma transação do save).
+    """
+    if getattr(instance, "_knowledge_changed", False):
+        rebuild_chunks(instance)
+
+
+@receiver(post_delete, sender=Agent)
+def drop_agent_snapshots(sender, instance, **kwargs):
+    """Remove os snapshots de um agente deletado."""
+    invalidate_snapshots(instance.slug)
+
+
+@receiver(pre_save, sender=Padaria)
+def remember_padaria_identity(sender, instance, **kwargs):
+    """Guarda nome/slug anteriores para detectar renomeação."""
+    if instance.pk:
+        instance._previous_identity = Padaria.objects.filter(
+            pk=instance.pk
+        ).values_list("name", "slug").first()
+
+
+@receiver(post_save, sender=Padaria)
+def refresh_snapshots_on_padaria_rename(sender, instance, created, **kwargs):
+    """
+    Quando a padaria é renomeada, a configuração dos agentes muda
+    (ela inclui nome/slug da padaria): incrementa a versão dos agentes
+    e reconstrói os snapshots.
+    """
+    previous = getattr(instance, "_previous_identity", None)
+    if created or previous is None or previous == (instance.name, instance.slug):
+        return
+    
+    agents = Agent.objects.filter(padaria=instance)
+    agents.update(version=F("version") + 1, updated_at=timezone.now())
+    for slug in agents.values_list("slug", flat=True):
+        invalidate_snapshots(slug)
+    transaction.on_commit(
+        lambda: rebuild_snapshots(Agent.objects.filter(padaria=instance).select_related("padaria"))
+    )
+
+
 @receiver(post_save, sender=Agent)
 def notify_n8n_on_update(sender, instance, created, **kwargs):
     """
-    Envia o arquivo PDF para o N8N quando um agente é atualizado.
+    Agenda o envio do arquivo PDF para o N8N quando o PDF do agente muda
+    (outbox: a entrega é feita pelo comando run_outbox, fora do request).
+    Saves que não mudam o conteúdo do PDF (hash) não disparam o envio, e
+    saves repetidos dentro de OUTBOX_COALESCE_SECONDS viram uma só entrega.
     """
     # Só notificar se o agente tem webhook configurado
     if not instance.n8n_webhook_url:
@@ -24,33 +88,13 @@ def notify_n8n_on_update(sender, instance, created, **kwargs):
         logger.info(f"Agente {instance.slug} não tem PDF, webhook não disparado")
         return
     
-    # Disparar webhook em background (não bloquear salvamento)
-    try:
-        # Abrir e enviar o arquivo PDF
-        with instance.knowledge_pdf.open('rb') as pdf_file:
-            files = {
-                'file': (instance.knowledge_pdf.name, pdf_file, 'application/pdf')
-            }
-            
-            # Enviar dados básicos como form data
-            data = {
-                'agent_slug': instance.slug,
-                'agent_name': instance.name,
-            }
-            
-            response = requests.post(
-                instance.n8n_webhook_url,
-                files=files,
-                data=data,
-                timeout=10
-            )
-        
-        if response.status_code == 200:
-            logger.info(f"PDF enviado com sucesso para N8N - agente {instance.slug}")
-        else:
-            logger.warning(f"Webhook N8N retornou status {response.status_code} para agente {instance.slug}")
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao enviar PDF para N8N - agente {instance.slug}: {str(e)}")
-    except Exception as e:
-        logger.error(f"Erro inesperado ao processar PDF para N8N - agente {instance.slug}: {str(e)}")
+    if not getattr(instance, "_pdf_changed", True):
+        return
+    
+    enqueue(
+        instance.n8n_webhook_url,
+        {"agent_id": instance.pk, "agent_slug": instance.slug},
+        kind=OutboundDelivery.KIND_AGENT_PDF,
+        padaria_id=instance.padaria_id,
+        coalesce_key=f"agent_pdf:{instance.pk}",
+    )
@@ -0,0 +1,176 @@
+"""
+Snapshots pré-renderizados das respostas da API do n8n.
+
+A configuração e o conhecimento de cada agente são serializados uma única vez
+(no save do agente ou no rename da padaria) e guardados no cache como bytes
+JSON, marcados com a versão do agente e o ETag. As views da API servem esses
+bytes diretamente, sem consultar o ORM.
+
+Em produção o cache padrão deve ser compartilhado entre os workers
+(ver CACHE_BACKEND em settings), caso contrário cada worker mantém a sua
+própria cópia até o TTL expirar; com CACHE_REQUIRE_SHARED (padrão com
+DEBUG=0) o processo não sobe com um cache local (core.utils.ensure_shared_cache).
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+SNAPSHOT_KINDS = ("config", "knowledge")
+
+
+def snapshot_cache_key(kind, slug):
+    return f"agent_snapshot:{kind}:{slug}"
+
+
+def get_snapshot_ttl():
+    return getattr(settings, "AGENT_SNAPSHOT_TTL", 300)
+
+
+def serialize_config(agent):
+    """Configuração do agente (sem knowledge_base para manter leve)."""
+    return {
+        "name": agent.name,
+        "slug": agent.slug,
+        "role": agent.role,
+        "sector": agent.sector,
+        "language": agent.language,
+        "greeting": agent.greeting,
+        "tone": agent.tone,
+        "personality": agent.personality,
+        "style_guidelines": agent.style_guidelines,
+        "business_hours": agent.business_hours,
+        "fallback_message": agent.fallback_message,
+        "escalation_rule": agent.escalation_rule,
+        "padaria": {
+            "name": agent.padaria.name,
+            "slug": agent.padaria.slug,
+        },
+        "updated_at": agent.updated_at.isoformat(),
+    }
+
+
+def serialize_knowledge(agent):
+    """Base de conhecimento do agente (texto + PDF extraído)."""
+    return {
+        "slug": agent.slug,
+        "knowledge_base": agent.knowledge_base,
+        "has_pdf": bool(agent.knowledge_pdf),
+        "pdf_text": agent.knowledge_pdf_text if agent.knowledge_pdf else None,
+        "updated_at": agent.updated_at.isoformat(),
+    }
+
+
+def compute_etag(kind, versions):
+    """
+    Gera um ETag forte a partir dos carimbos de versão do agente: a versão
+    (incrementada em todo save e na renomeação da padaria, mesmo dentro da
+    resolução dos timestamps), as datas e, no conhecimento, o hash do texto
+    do PDF. Qualquer alteração no agente (ou na padaria) muda o hash.
+    versions: dict com ETAG_FIELDS (Agent.values() ou montado da instância).
+    """
+    parts = [
+        kind,
+        str(versions["id"]),
+        str(versions["version"]),
+        versions["updated_at"].isoformat(),
+        versions["knowledge_updated_at"].isoformat() if versions["knowledge_updated_at"] else "",
+        versions["padaria__updated_at"].isoformat(),
+    ]
+    if kind == "knowledge":
+        parts.append(versions["knowledge_pdf_text_hash"])
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+# Campos (Agent.values) usados por compute_etag
+ETAG_FIELDS = (
+    "id", "version", "updated_at", "knowledge_updated_at", "padaria__updated_at", "knowledge_pdf_text_hash",
+)
+
+
+SERIALIZERS = {
+    "config": serialize_config,
+    "knowledge": serialize_knowledge,
+}
+
+
+def render_snapshot(kind, agent):
+    """Renderiza o snapshot (bytes JSON + metadados) de um agente."""
+    versions = {
+        "id": agent.id,
+        "version": agent.version,
+        "updated_at": agent.updated_at,
+        "knowledge_updated_at": agent.knowledge_updated_at,
+        "padaria__updated_at": agent.padaria.updated_at,
+        "knowledge_pdf_text_hash": agent.knowledge_pdf_text_hash,
+    }
+    if kind == "config":
+        last_modified = max(agent.updated_at, agent.padaria.updated_at)
+    else:
+        last_modified = max(filter(None, [agent.updated_at, agent.knowledge_updated_at]))
+
+    body = json.dumps(SERIALIZERS[kind](agent), cls=DjangoJSONEncoder).encode("utf-8")
+    return {
+        "version": agent.version,
+        "etag": compute_etag(kind, versions),
+        "last_modified": last_modified,
+        "agent_id": agent.id,
+        "padaria_id": agent.padaria_id,
+        "body": body,
+    }
+
+
+def store_snapshots(agent):
+    """
+    Renderiza e grava os snapshots do agente no cache.
+    Não sobrescreve um snapshot de versão mais nova já presente.
+    Agentes inativos não têm snapshot.
+    Retorna um dict {kind: snapshot} com os snapshots renderizados.
+    """
+    if not agent.is_active:
+        invalidate_snapshots(agent.slug)
+        return {}
+
+    snapshots = {}
+    for kind in SNAPSHOT_KINDS:
+        snapshots[kind] = render_snapshot(kind, agent)
+        key = snapshot_cache_key(kind, agent.slug)
+        current = cache.get(key)
+        if current and current["version"] > agent.version:
+            continue
+        cache.set(key, snapshots[kind], get_snapshot_ttl())
+    return snapshots
+
+
+def get_snapshot(kind, slug):
+    """Retorna o snapshot em cache ou None."""
+    return cache.get(snapshot_cache_key(kind, slug))
+
+
+def get_snapshots(kind, slugs):
+    """Busca vários snapshots de uma vez. Retorna {slug: snapshot} só com os presentes."""
+    keys = {snapshot_cache_key(kind, slug): slug for slug in slugs}
+    found = cache.get_many(list(keys))
+    return {keys[key]: snapshot for key, snapshot in found.items()}
+
+
+def invalidate_snapshots(slug):
+    """Remove os snapshots de um agente do cache."""
+    cache.delete_many([snapshot_cache_key(kind, slug) for kind in SNAPSHOT_KINDS])
+
+
+def snapshot_in_scope(snapshot, api_key):
+    """Verifica se o snapshot pertence ao escopo da API key."""
+    if snapshot["padaria_id"] != api_key.padaria_id:
+        return False
+    return not api_key.agent_id or api_key.agent_id == snapshot["agent_id"]
+
+
+def rebuild_snapshots(agents):
+    """Reconstrói os snapshots de uma coleção de agentes. Retorna o total."""
+    total = 0
+    for agent in agents:
+        store_snapshots(agent)
+        total += 1
+    return total
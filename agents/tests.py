@@ -1,7 +1,12 @@
+from django.db.models import F
 from django.test import TestCase
 from django.contrib.auth.models import User
 from organizations.models import Organization
-from .models import Agent
+from .context import assemble_context
+from .knowledge import split_markdown, build_chunks, rebuild_chunks
+from .models import Agent, KnowledgeChunk
+from .search import tokenize
+from .utils import content_hash
 
 
 class AgentModelTest(TestCase):
@@ -14,7 +19,7 @@ class AgentModelTest(TestCase):
     def test_create_agent(self):
         """Testa criação de agente."""
         agent = Agent.objects.create(
-            organization=self.organization,
+            padaria=self.organization,
             name="Ana"
         )
         self.assertIsNotNone(agent.slug)
@@ -23,18 +28,124 @@ class AgentModelTest(TestCase):
     
     def test_agent_slug_unique(self):
         """Testa que slug é único."""
-        Agent.objects.create(organization=self.organization, name="Ana")
+        Agent.objects.create(padaria=self.organization, name="Ana")
         # Segundo agente com mesmo nome deve ter slug diferente ou erro
         with self.assertRaises(Exception):
-            Agent.objects.create(organization=self.organization, name="Ana")
+            Agent.objects.create(padaria=self.organization, name="Ana")
     
     def test_render_greeting(self):
         """Testa renderização da saudação."""
         agent = Agent.objects.create(
-            organization=self.organization,
+            padaria=self.organization,
             name="Ana",
             greeting="Olá {{cliente_nome}}! Sou {{agente_nome}}."
         )
         rendered = agent.render_greeting(cliente_nome="João")
         self.assertIn("João", rendered)
         self.assertIn("Ana", rendered)
+    
+    def test_version_bumps_from_stored_value(self):
+        """Testa que o save de uma instância desatualizada não reduz a versão."""
+        agent = Agent.objects.create(padaria=self.organization, name="Ana")
+        stale = Agent.objects.get(pk=agent.pk)
+        agent.greeting = "Oi!"
+        agent.save()
+        Agent.objects.filter(pk=agent.pk).update(version=F("version") + 1)
+        
+        stale.tone = "descontraído"
+        stale.save()
+        self.assertEqual(stale.version, 4)
+        self.assertEqual(Agent.objects.get(pk=agent.pk).version, 4)
+    
+    def test_knowledge_updated_at_saved_with_update_fields(self):
+        """Testa que save(update_fields=["knowledge_base"]) grava o knowledge_updated_at novo."""
+        agent = Agent.objects.create(padaria=self.organization, name="Ana")
+        before = Agent.objects.get(pk=agent.pk).knowledge_updated_at
+        agent.knowledge_base = "## Novo conhecimento"
+        agent.save(update_fields=["knowledge_base"])
+        stored = Agent.objects.get(pk=agent.pk).knowledge_updated_at
+        self.assertEqual(stored, agent.knowledge_updated_at)
+        self.assertNotEqual(stored, before)
+    
+    def test_knowledge_hashes_track_changes(self):
+        """Testa que os hashes do texto do PDF só mudam quando o conteúdo muda."""
+        agent = Agent.objects.create(
+            padaria=self.organization,
+            name="Ana",
+            knowledge_pdf_text="Pão francês: R$ 1,00"
+        )
+        self.assertEqual(agent.knowledge_pdf_text_hash, content_hash("Pão francês: R$ 1,00"))
+        self.assertEqual(agent.knowledge_pdf_hash, "")
+        
+        agent.greeting = "Olá!"
+        agent.save()
+        self.assertFalse(agent._pdf_text_changed)
+        self.assertFalse(agent._knowledge_changed)
+        
+        agent.knowledge_pdf_text = "Pão francês: R$ 1,20"
+        agent.save(update_fields=["knowledge_pdf_text"])
+        self.assertTrue(agent._pdf_text_changed)
+        agent.refresh_from_db()
+        self.assertEqual(agent.knowledge_pdf_text_hash, content_hash("Pão francês: R$ 1,20"))
+
+
+class KnowledgeChunkTest(TestCase):
+    """Testes para a divisão da base de conhecimento em chunks."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+    
+    def test_split_markdown_by_section(self):
+        """Testa que o Markdown é dividido por seção com caminho dos cabeçalhos."""
+        text = "## Produtos\n\n### Pães\n- Pão francês\n\n### Doces\n- Sonho\n"
+        titles = [chunk["title"] for chunk in split_markdown(text)]
+        self.assertEqual(titles, ["Produtos > Pães", "Produtos > Doces"])
+    
+    def test_chunks_built_on_save_with_stable_ids(self):
+        """Testa que os chunks são gerados no save e mantêm o ID quando inalterados."""
+        agent = Agent.objects.create(
+            padaria=self.padaria,
+            name="Ana",
+            knowledge_base="## Pães\nPão francês\n\n## Doces\nSonho\n"
+        )
+        chunks = list(KnowledgeChunk.objects.filter(agent=agent))
+        self.assertEqual(len(chunks), 2)
+        paes_id = chunks[0].chunk_id
+        
+        agent.knowledge_base = "## Pães\nPão francês\n\n## Doces\nSonho e brigadeiro\n"
+        agent.save()
+        chunk_ids = list(KnowledgeChunk.objects.filter(agent=agent).values_list("chunk_id", flat=True))
+        self.assertEqual(chunk_ids[0], paes_id)
+        self.assertNotIn(chunks[1].chunk_id, chunk_ids)
+    
+    def test_large_section_is_bounded(self):
+        """Testa que seções grandes são subdivididas."""
+        agent = Agent(padaria=self.padaria, name="Ana", knowledge_base="## Grande\n" + ("palavra " * 1000))
+        chunks = build_chunks(agent)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk["text"]) <= 2000 for chunk in chunks))
+    
+    def test_tokenize_normalizes_portuguese(self):
+        """Testa que a busca ignora acentos, stopwords e flexões comuns."""
+        self.assertEqual(tokenize("Pães"), tokenize("pao"))
+        self.assertEqual(tokenize("entregas"), tokenize("entregamos"))
+        self.assertEqual(tokenize("o pão de queijo"), tokenize("pão queijo"))
+    
+    def test_context_survives_recreated_chunks(self):
+        """Testa que o contexto remonta o índice em cache quando os chunks são recriados."""
+        agent = Agent.objects.create(
+            padaria=self.padaria,
+            name="Ana",
+            knowledge_base="## Entregas\nEntregamos no bairro.\n\n## Pães\nPão francês\n"
+        )
+        self.assertEqual(assemble_context(agent, "entrega", 1000)["passages"][0]["title"], "Entregas")
+        pks = set(KnowledgeChunk.objects.filter(agent=agent).values_list("pk", flat=True))
+        
+        # force recalcula os termos sem trocar as linhas
+        rebuild_chunks(agent, force=True)
+        self.assertEqual(set(KnowledgeChunk.objects.filter(agent=agent).values_list("pk", flat=True)), pks)
+        
+        KnowledgeChunk.objects.filter(agent=agent).delete()
+        rebuild_chunks(agent)
+        self.assertEqual(assemble_context(agent, "entrega", 1000)["passages"][0]["title"], "Entregas")
@@ -1,9 +1,13 @@
 """
 Utilitários para o app agents.
 """
+import hashlib
+import logging
 import PyPDF2
 from io import BytesIO
 
+logger = logging.getLogger(__name__)
+
 
 def extract_text_from_pdf(pdf_file):
     """
@@ -42,3 +46,31 @@ def extract_text_from_pdf(pdf_file):
         
     except Exception as e:
         raise ValueError(f"Erro ao extrair texto do PDF: {str(e)}")
+
+
+def content_hash(text):
+    """SHA-256 (hex) de um texto; "" para texto vazio."""
+    if not text:
+        return ""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(field_file):
+    """
+    SHA-256 (hex) do conteúdo de um arquivo (FieldFile recém-enviado ou já
+    gravado), lido em blocos; "" sem arquivo ou se ele não puder ser lido.
+    """
+    if not field_file:
+        return ""
+    digest = hashlib.sha256()
+    committed = getattr(field_file, "_committed", True)
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    except OSError as e:
+        logger.warning(f"Não foi possível ler {field_file.name} para o hash: {str(e)}")
+        return ""
+    finally:
+        if committed:
+            field_file.close()
+    return digest.hexdigest()
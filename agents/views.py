@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
+from django.db import transaction
 from .models import Agent
 from .utils import extract_text_from_pdf
 from .forms import AgentSimpleForm
@@ -8,10 +10,35 @@ from .presets import get_preset_defaults, AGENT_PRESETS
 from organizations.models import Padaria, PadariaUser
 from core.permissions import get_user_padaria, get_user_role
 from audit.models import AuditLog
-import requests
+from integrations.outbox import enqueue
 import json
 
 
+def enqueue_memory_update(agent, user, pdf_filename, extracted_text, action=None):
+    """
+    Agenda o envio do texto do PDF para o webhook de memória do n8n
+    (N8N_MEMORY_WEBHOOK_URL). Chamar na transação do save do agente.
+    Envios repetidos do mesmo agente dentro de OUTBOX_COALESCE_SECONDS viram
+    uma única entrega, com o texto mais recente.
+    """
+    payload = {
+        "agent_id": agent.id,
+        "agent_name": agent.name,
+        "agent_slug": agent.slug,
+        "pdf_filename": pdf_filename,
+        "pdf_category": agent.knowledge_pdf_category or "Sem categoria",
+        "extracted_text": extracted_text,
+        "text_length": len(extracted_text),
+        "padaria": agent.padaria.name,
+        "uploaded_by": user.email
+    }
+    if action:
+        payload["action"] = action
+    return enqueue(
+        settings.N8N_MEMORY_WEBHOOK_URL, payload, padaria_id=agent.padaria_id, coalesce_key=f"memory:{agent.id}"
+    )
+
+
 def get_user_padarias(user):
     """Retorna padarias que o usuário pode acessar."""
     if user.is_superuser:
@@ -112,50 +139,24 @@ def agent_create(request):
                 if not agent.tone:
                     agent.tone = defaults.get('tone', 'profissional')
             
-            agent.save()
-            
-            # Processar PDF se enviado
-            if 'knowledge_pdf' in request.FILES:
+            # Processar PDF se enviado: o texto é extraído antes do save,
+            # que grava agente, PDF e texto de uma vez
+            pdf_file = request.FILES.get('knowledge_pdf')
+            if pdf_file:
                 try:
-                    pdf_file = request.FILES['knowledge_pdf']
-                    extracted_text = extract_text_from_pdf(pdf_file)
-                    agent.knowledge_pdf_text = extracted_text
-                    agent.save()
-                    
-                    # Enviar para n8n
-                    try:
-                        webhook_url = "https://n8n.newcouros.com.br/webhook/memoria"
-                        payload = {
-                            "agent_id": agent.id,
-                            "agent_name": agent.name,
-                            "agent_slug": agent.slug,
-                            "pdf_filename": pdf_file.name,
-                            "pdf_category": agent.knowledge_pdf_category or "Sem categoria",
-                            "extracted_text": extracted_text,
-                            "text_length": len(extracted_text),
-                            "padaria": agent.padaria.name,
-                            "uploaded_by": request.user.email
-                        }
-                        
-                        response = requests.post(
-                            webhook_url,
-                            json=payload,
-                            headers={'Content-Type': 'application/json'},
-                            timeout=10
-                        )
-                        
-                        if response.status_code == 200:
-                            messages.success(request, f"PDF processado e enviado para n8n! {len(extracted_text)} caracteres extraídos.")
-                        else:
-                            messages.success(request, f"PDF processado! {len(extracted_text)} caracteres extraídos.")
-                            messages.warning(request, f"Webhook n8n retornou status {response.status_code}")
-                    except requests.exceptions.RequestException as webhook_error:
-                        messages.success(request, f"PDF processado! {len(extracted_text)} caracteres extraídos.")
-                        messages.warning(request, f"Erro ao enviar para n8n: {str(webhook_error)}")
-                        
+                    agent.knowledge_pdf_text = extract_text_from_pdf(pdf_file)
                 except Exception as e:
                     messages.warning(request, f"Erro ao processar PDF: {str(e)}")
             
+            # Agente e notificação ao n8n na mesma transação
+            with transaction.atomic():
+                agent.save()
+                
+                if pdf_file and agent.knowledge_pdf_text:
+                    # Enviar para n8n (outbox: entregue pelo run_outbox)
+                    enqueue_memory_update(agent, request.user, pdf_file.name, agent.knowledge_pdf_text)
+                    messages.success(request, f"PDF processado! {len(agent.knowledge_pdf_text)} caracteres extraídos. Envio para o n8n agendado.")
+            
             AuditLog.log(
                 action="create",
                 entity="Agent",
@@ -236,61 +237,37 @@ def agent_edit(request, slug):
         if form.is_valid():
             agent = form.save(commit=False)
             agent.status = form.cleaned_data.get('status', agent.status)
-            agent.save()
             
-            pdf_updated = False
-            extracted_text = None
-            pdf_filename = None
-            
-            # Processar PDF se enviado (novo upload)
-            if 'knowledge_pdf' in request.FILES:
+            # Processar PDF se enviado (novo upload): o texto é extraído antes
+            # do save, que grava agente, PDF e texto de uma vez
+            pdf_file = request.FILES.get('knowledge_pdf')
+            if pdf_file:
                 try:
-                    pdf_file = request.FILES['knowledge_pdf']
-                    extracted_text = extract_text_from_pdf(pdf_file)
-                    agent.knowledge_pdf_text = extracted_text
-                    agent.save()
-                    pdf_updated = True
-                    pdf_filename = pdf_file.name
+                    agent.knowledge_pdf_text = extract_text_from_pdf(pdf_file)
                 except Exception as e:
                     messages.warning(request, f"Erro ao processar PDF: {str(e)}")
             
-            # Se tem PDF (novo ou existente), enviar para n8n
-            if agent.knowledge_pdf and agent.knowledge_pdf_text:
-                try:
-                    webhook_url = "https://n8n.newcouros.com.br/webhook/memoria"
-                    payload = {
-                        "agent_id": agent.id,
-                        "agent_name": agent.name,
-                        "agent_slug": agent.slug,
-                        "pdf_filename": pdf_filename or agent.knowledge_pdf.name,
-                        "pdf_category": agent.knowledge_pdf_category or "Sem categoria",
-                        "extracted_text": extracted_text or agent.knowledge_pdf_text,
-                        "text_length": len(extracted_text or agent.knowledge_pdf_text),
-                        "padaria": agent.padaria.name,
-                        "uploaded_by": request.user.email,
-                        "action": "new_upload" if pdf_updated else "update"
-                    }
-                    
-                    response = requests.post(
-                        webhook_url,
-                        json=payload,
-                        headers={'Content-Type': 'application/json'},
-                        timeout=10
+            # Agente e notificação ao n8n na mesma transação
+            with transaction.atomic():
+                agent.save()
+                
+                # Só notificar o n8n se o PDF ou o texto mudou (comparação pelos hashes;
+                # outbox: entregue pelo run_outbox)
+                knowledge_changed = agent._pdf_changed or agent._pdf_text_changed
+                if agent.knowledge_pdf and agent.knowledge_pdf_text and knowledge_changed:
+                    enqueue_memory_update(
+                        agent,
+                        request.user,
+                        pdf_file.name if pdf_file else agent.knowledge_pdf.name,
+                        agent.knowledge_pdf_text,
+                        action="new_upload" if pdf_file else "update",
                     )
-                    
-                    if response.status_code == 200:
-                        if pdf_updated:
-                            messages.success(request, f"PDF atualizado e enviado para n8n! {len(extracted_text)} caracteres extraídos.")
-                        else:
-                            messages.success(request, "Agente e conhecimento atualizados no n8n! ✨")
+                    if pdf_file:
+                        messages.success(request, f"PDF atualizado! {len(agent.knowledge_pdf_text)} caracteres extraídos. Envio para o n8n agendado.")
                     else:
-                        if pdf_updated:
-                            messages.success(request, f"PDF atualizado! {len(extracted_text)} caracteres extraídos.")
-                        messages.warning(request, f"Webhook n8n retornou status {response.status_code}")
-                except requests.exceptions.RequestException as webhook_error:
-                    if pdf_updated:
-                        messages.success(request, f"PDF atualizado! {len(extracted_text)} caracteres extraídos.")
-                    messages.warning(request, f"Erro ao enviar para n8n: {str(webhook_error)}")
+                        messages.info(request, "Atualização do conhecimento agendada para envio ao n8n.")
+                elif pdf_file and agent.knowledge_pdf_text:
+                    messages.info(request, "O PDF enviado é igual ao atual: nada a enviar para o n8n.")
             
             AuditLog.log(
                 action="update",
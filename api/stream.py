@@ -0,0 +1,197 @@
+"""
+Stream de alterações de agentes para o n8n (SSE com fallback de long-poll).
+
+Cada processo ASGI mantém um único poller (ChangeBroadcaster) que consulta o
+feed de alterações a cada AGENT_STREAM_POLL_SECONDS e distribui os eventos
+para todos os ouvintes conectados, filtrando pelo escopo de cada API key.
+Assim o custo no banco é de uma query por intervalo, independente de
+quantas conexões estão abertas. O poller relê a janela de
+AGENT_CHANGES_OVERLAP_SECONDS (transações que fazem commit depois do
+cursor, ver api.utils.changes_cursor) e só repassa versões novas.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from agents.models import Agent
+from core.pagination import keyset_page, encode_cursor
+from .utils import CHANGE_FIELDS, changes_cursor, serialize_change
+
+logger = logging.getLogger(__name__)
+
+CHANGE_ORDERING = ("updated_at", "id")
+
+
+def get_stream_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def row_cursor(row):
+    """Cursor (mesmo formato do feed de alterações) apontando para a linha."""
+    return encode_cursor([row["updated_at"], row["id"]])
+
+
+def scoped_agents(padaria_id=None, agent_id=None):
+    """Queryset de alterações, opcionalmente restrito ao escopo de uma API key."""
+    agents = Agent.objects.all()
+    if padaria_id is not None:
+        agents = agents.filter(padaria_id=padaria_id)
+    if agent_id:
+        agents = agents.filter(pk=agent_id)
+    return agents.values(*CHANGE_FIELDS)
+
+
+def fetch_changes(cursor, padaria_id=None, agent_id=None):
+    """Todas as alterações depois do cursor. Retorna (linhas, cursor)."""
+    rows = []
+    has_more = True
+    while has_more:
+        page, cursor, has_more = keyset_page(
+            scoped_agents(padaria_id, agent_id), CHANGE_ORDERING, cursor=cursor, limit=500
+        )
+        rows.extend(page)
+    return rows, cursor
+
+
+def latest_cursor():
+    """Cursor da alteração mais recente (ponto de partida "a partir de agora")."""
+    row = Agent.objects.order_by("-updated_at", "-id").values("updated_at", "id").first()
+    return encode_cursor([row["updated_at"], row["id"]]) if row else None
+
+
+class Subscriber:
+    """Ouvinte conectado: fila limitada de alterações no escopo da API key."""
+
+    def __init__(self, padaria_id, agent_id, maxsize=100):
+        self.padaria_id = padaria_id
+        self.agent_id = agent_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def accepts(self, row):
+        if row["padaria_id"] != self.padaria_id:
+            return False
+        return not self.agent_id or row["id"] == self.agent_id
+
+    def push(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Cliente lento: avisar que precisa ressincronizar pelo feed
+            self.overflowed = True
+
+
+class ChangeBroadcaster:
+    """Um único poller por event loop distribui as alterações a todos os ouvintes."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.cursor = None
+        # {id do agente: (version, updated_at)} já repassados na janela de sobreposição
+        self.delivered = {}
+        self._task = None
+
+    def subscribe(self, padaria_id, agent_id):
+        subscriber = Subscriber(padaria_id, agent_id)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.cursor = None
+            self.delivered = {}
+
+    async def _run(self):
+        # O poller sobrevive ao request que o criou: usa threads próprias
+        # (thread_sensitive=False) em vez do executor do request
+        interval = get_stream_setting("AGENT_STREAM_POLL_SECONDS", 2)
+        if self.cursor is None:
+            self.cursor = await sync_to_async(latest_cursor, thread_sensitive=False)()
+        while self.subscribers:
+            await asyncio.sleep(interval)
+            try:
+                rows, cursor = await sync_to_async(fetch_changes, thread_sensitive=False)(self.cursor)
+            except Exception as e:
+                logger.error(f"Erro ao consultar alterações de agentes para o stream: {str(e)}")
+                continue
+            self.cursor = changes_cursor(rows, cursor, False)
+            for row in self.new_rows(rows):
+                for subscriber in list(self.subscribers):
+                    if subscriber.accepts(row):
+                        subscriber.push(row)
+
+    def new_rows(self, rows):
+        """Filtra as linhas relidas na janela de sobreposição que já foram repassadas."""
+        fresh = []
+        for row in rows:
+            if self.delivered.get(row["id"], (None,))[0] == row["version"]:
+                continue
+            self.delivered[row["id"]] = (row["version"], row["updated_at"])
+            fresh.append(row)
+        horizon = timezone.now() - timedelta(seconds=2 * get_stream_setting("AGENT_CHANGES_OVERLAP_SECONDS", 5))
+        self.delivered = {pk: seen for pk, seen in self.delivered.items() if seen[1] >= horizon}
+        return fresh
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    """Broadcaster do event loop atual."""
+    loop = asyncio.get_running_loop()
+    if loop not in _broadcasters:
+        _broadcasters[loop] = ChangeBroadcaster()
+    return _broadcasters[loop]
+
+
+def format_sse(row):
+    """Formata uma alteração como evento SSE (id = cursor para Last-Event-ID)."""
+    data = json.dumps(serialize_change(row))
+    return f"id: {row_cursor(row)}\nevent: agent\ndata: {data}\n\n"
+
+
+async def sse_events(broadcaster, subscriber, backlog):
+    """Gerador assíncrono do corpo text/event-stream."""
+    heartbeat = get_stream_setting("AGENT_STREAM_HEARTBEAT_SECONDS", 15)
+    max_seconds = get_stream_setting("AGENT_STREAM_MAX_SECONDS", 3600)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    try:
+        yield "retry: 3000\n\n"
+        for row in backlog:
+            yield format_sse(row)
+        while loop.time() < deadline:
+            try:
+                row = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                yield "event: resync\ndata: {}\n\n"
+            yield format_sse(row)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+async def wait_for_changes(broadcaster, subscriber, timeout):
+    """Long-poll: espera a primeira alteração (ou o timeout) e drena a fila."""
+    try:
+        try:
+            rows = [await asyncio.wait_for(subscriber.queue.get(), timeout=timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not subscriber.queue.empty():
+            rows.append(subscriber.queue.get_nowait())
+        return rows
+    finally:
+        broadcaster.unsubscribe(subscriber)
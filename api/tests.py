@@ -1,18 +1,26 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from organizations.models import Organization, ApiKey
 from agents.models import Agent
+from agents.snapshots import ETAG_FIELDS, compute_etag
+from audit.models import AccessLog
+from core.pagination import encode_cursor
+from .stream import ChangeBroadcaster
+from .utils import CHANGE_FIELDS
 
 
+@override_settings(API_KEY_USAGE_FLUSH_SECONDS=0)
 class ApiEndpointTest(TestCase):
     """Testes para os endpoints da API."""
     
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="12345")
         self.organization = Organization.objects.create(name="Test Org", owner=self.user)
-        self.api_key = ApiKey.objects.create(organization=self.organization)
+        self.api_key = ApiKey.objects.create(padaria=self.organization)
         self.agent = Agent.objects.create(
-            organization=self.organization,
+            padaria=self.organization,
             name="Test Agent"
         )
     
@@ -47,3 +55,327 @@ class ApiEndpointTest(TestCase):
             HTTP_X_API_KEY=self.api_key.key
         )
         self.assertEqual(response.status_code, 404)
+
+    def test_get_agent_config_etag_not_modified(self):
+        """Testa que If-None-Match com o ETag atual retorna 304."""
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        etag = response["ETag"]
+        self.assertTrue(etag)
+        
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+    
+    def test_get_agent_config_etag_changes_on_update(self):
+        """Testa que o ETag muda quando o agente é alterado."""
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        etag = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)["ETag"]
+        
+        self.agent.greeting = "Olá de novo!"
+        self.agent.save()
+        
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+    
+    def test_get_agent_knowledge_etag_not_modified(self):
+        """Testa GET condicional no endpoint de conhecimento."""
+        url = f"/api/n8n/agents/{self.agent.slug}/knowledge"
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        
+        # 304 também é registrado no log de acesso
+        log = AccessLog.objects.order_by("-id").first()
+        self.assertEqual(log.get_endpoint_display(), "get_agent_knowledge")
+        self.assertEqual(log.extra, {"not_modified": True})
+        self.assertEqual(AccessLog.objects.count(), 2)
+    
+    def test_etag_changes_with_same_timestamps(self):
+        """Testa que o ETag muda com a versão ou o texto do PDF, mesmo com as mesmas datas."""
+        versions = Agent.objects.filter(pk=self.agent.pk).values(*ETAG_FIELDS).get()
+        bumped = dict(versions, version=versions["version"] + 1)
+        self.assertNotEqual(compute_etag("config", versions), compute_etag("config", bumped))
+        other_text = dict(versions, knowledge_pdf_text_hash="outro")
+        self.assertNotEqual(compute_etag("knowledge", versions), compute_etag("knowledge", other_text))
+    
+    def test_get_agent_config_served_from_snapshot(self):
+        """Testa que a segunda chamada usa o snapshot em cache (sem buscar o agente)."""
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        
+        # Log de acesso + resumo de atividade (numa transação: 2 de savepoint)
+        # + uso da API key (gravação imediata nos testes; API key vem do cache)
+        with self.assertNumQueries(5):
+            response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "Test Agent")
+    
+    def test_get_agent_config_reflects_padaria_rename(self):
+        """Testa que renomear a padaria atualiza o snapshot da configuração."""
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        
+        self.organization.name = "Padaria Renomeada"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.save()
+        
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.json()["padaria"]["name"], "Padaria Renomeada")
+        self.agent.refresh_from_db()
+        self.assertEqual(self.agent.version, 2)
+    
+    def test_get_agent_config_batch(self):
+        """Testa busca em lote com itens encontrados, inexistentes e não modificados."""
+        url = "/api/n8n/agents/config:batch"
+        response = self.client.post(
+            url,
+            data=json.dumps({"slugs": [self.agent.slug, "nonexistent-agent"]}),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        self.assertEqual(response.status_code, 200)
+        agents = response.json()["agents"]
+        self.assertEqual(agents[self.agent.slug]["status"], 200)
+        self.assertEqual(agents[self.agent.slug]["config"]["name"], "Test Agent")
+        self.assertEqual(agents["nonexistent-agent"]["status"], 404)
+        
+        etag = agents[self.agent.slug]["etag"]
+        response = self.client.post(
+            url,
+            data=json.dumps({"slugs": [self.agent.slug], "etags": {self.agent.slug: etag}}),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        item = response.json()["agents"][self.agent.slug]
+        self.assertEqual(item["status"], 304)
+        self.assertNotIn("config", item)
+    
+    def test_get_agent_config_batch_rejects_non_object_body(self):
+        """Testa que corpo JSON que não é objeto dá 400."""
+        for body in ([self.agent.slug], "texto", 1):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    "/api/n8n/agents/config:batch",
+                    data=json.dumps(body),
+                    content_type="application/json",
+                    HTTP_X_API_KEY=self.api_key.key
+                )
+                self.assertEqual(response.status_code, 400)
+    
+    def test_get_agent_config_batch_get_respects_key_scope(self):
+        """Testa que uma API key vinculada a outro agente recebe 403 por item."""
+        other_org = Organization.objects.create(name="Other Org", owner=self.user)
+        other_agent = Agent.objects.create(padaria=other_org, name="Other Agent")
+        scoped_key = ApiKey.objects.create(padaria=self.organization, agent=other_agent)
+        
+        response = self.client.get(
+            f"/api/n8n/agents/config:batch?slugs={self.agent.slug}",
+            HTTP_X_API_KEY=scoped_key.key
+        )
+        self.assertEqual(response.json()["agents"][self.agent.slug]["status"], 403)
+    
+    @override_settings(AGENT_CHANGES_OVERLAP_SECONDS=0)
+    def test_get_agent_changes_cursor(self):
+        """Testa o feed de alterações com cursor."""
+        url = "/api/n8n/agents/changes"
+        data = self.client.get(url, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual([c["slug"] for c in data["changes"]], [self.agent.slug])
+        self.assertFalse(data["has_more"])
+        cursor = data["cursor"]
+        
+        # Nada mudou: lista vazia e mesmo cursor
+        data = self.client.get(url, {"since": cursor}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(data["changes"], [])
+        self.assertEqual(data["cursor"], cursor)
+        
+        self.agent.knowledge_base = "## Novo conhecimento"
+        self.agent.save()
+        data = self.client.get(url, {"since": cursor}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(len(data["changes"]), 1)
+        self.assertEqual(data["changes"][0]["version"], self.agent.version)
+    
+    def test_get_agent_changes_rereads_overlap_window(self):
+        """Testa que um save com commit tardio (updated_at anterior ao cursor) ainda aparece no feed."""
+        url = "/api/n8n/agents/changes"
+        data = self.client.get(url, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertFalse(data["has_more"])
+        
+        # Save gravado com data anterior ao cursor já entregue, mas só visível agora
+        Agent.objects.filter(pk=self.agent.pk).update(
+            version=self.agent.version + 1, updated_at=self.agent.updated_at - timedelta(seconds=1)
+        )
+        data = self.client.get(url, {"since": data["cursor"]}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual([c["version"] for c in data["changes"]], [self.agent.version + 1])
+        
+        # A janela devolve o agente de novo, com a mesma versão
+        data = self.client.get(url, {"since": data["cursor"]}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual([c["version"] for c in data["changes"]], [self.agent.version + 1])
+    
+    def test_stream_skips_reread_versions(self):
+        """Testa que o poller do stream não repassa de novo as versões relidas na janela."""
+        broadcaster = ChangeBroadcaster()
+        row = Agent.objects.filter(pk=self.agent.pk).values(*CHANGE_FIELDS).get()
+        self.assertEqual(broadcaster.new_rows([row]), [row])
+        self.assertEqual(broadcaster.new_rows([row]), [])
+        bumped = dict(row, version=row["version"] + 1)
+        self.assertEqual(broadcaster.new_rows([bumped]), [bumped])
+    
+    def test_get_agent_changes_invalid_cursor(self):
+        """Testa cursor inválido."""
+        response = self.client.get(
+            "/api/n8n/agents/changes", {"since": "not-a-cursor"}, HTTP_X_API_KEY=self.api_key.key
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_tampered_cursors_return_400(self):
+        """Testa que cursores com valores de tipo errado dão 400, não erro do ORM."""
+        def cursor(values):
+            return encode_cursor(values)
+        
+        cases = [
+            ("/api/n8n/agents/changes", "since", ["2026-01-01T00:00:00", "x"]),
+            ("/api/n8n/agents/changes", "since", ["2026-01-01T00:00:00", [1]]),
+            ("/api/n8n/agents/changes", "since", [1, 2]),
+            (f"/api/n8n/agents/{self.agent.slug}/knowledge/chunks", "cursor", ["abc"]),
+            ("/api/n8n/sessions/s1/events", "cursor", ["2026-01-01T00:00:00", "abc"]),
+        ]
+        for url, param, values in cases:
+            with self.subTest(url=url, values=values):
+                response = self.client.get(url, {param: cursor(values)}, HTTP_X_API_KEY=self.api_key.key)
+                self.assertEqual(response.status_code, 400)
+    
+    def test_agent_stream_long_poll(self):
+        """Testa o fallback de long-poll do stream de alterações."""
+        url = "/api/n8n/agents/stream"
+        data = self.client.get(
+            url, {"mode": "poll", "timeout": "0.05"}, HTTP_X_API_KEY=self.api_key.key
+        ).json()
+        self.assertEqual(data["changes"], [])
+        cursor = data["cursor"]
+        
+        self.agent.greeting = "Nova saudação"
+        self.agent.save()
+        data = self.client.get(
+            url, {"mode": "poll", "since": cursor, "timeout": "0.05"}, HTTP_X_API_KEY=self.api_key.key
+        ).json()
+        self.assertEqual([c["slug"] for c in data["changes"]], [self.agent.slug])
+        self.assertNotEqual(data["cursor"], cursor)
+    
+    def test_knowledge_chunks_list_and_fetch(self):
+        """Testa listagem paginada de chunks e busca por ID."""
+        url = f"/api/n8n/agents/{self.agent.slug}/knowledge/chunks"
+        data = self.client.get(url, {"limit": 2}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(len(data["chunks"]), 2)
+        self.assertTrue(data["has_more"])
+        self.assertNotIn("text", data["chunks"][0])
+        
+        next_page = self.client.get(
+            url, {"limit": 2, "cursor": data["cursor"]}, HTTP_X_API_KEY=self.api_key.key
+        ).json()
+        self.assertGreater(next_page["chunks"][0]["position"], data["chunks"][-1]["position"])
+        
+        chunk_id = data["chunks"][0]["chunk_id"]
+        response = self.client.get(f"{url}/{chunk_id}", HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["text"])
+        
+        etag = response["ETag"]
+        response = self.client.get(f"{url}/{chunk_id}", HTTP_X_API_KEY=self.api_key.key, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+    
+    def test_knowledge_chunk_etag_changes_when_chunk_moves(self):
+        """Testa que o ETag do chunk muda quando o rebuild move o chunk (mesmo chunk_id)."""
+        self.agent.knowledge_base = "## Preços\nPão francês a R$ 1,00.\n"
+        self.agent.save()
+        url = f"/api/n8n/agents/{self.agent.slug}/knowledge/chunks"
+        chunk = self.client.get(url, HTTP_X_API_KEY=self.api_key.key).json()["chunks"][0]
+        response = self.client.get(f"{url}/{chunk['chunk_id']}", HTTP_X_API_KEY=self.api_key.key)
+        etag = response["ETag"]
+        
+        self.agent.knowledge_base = "## Horários\nAbrimos às 6h.\n\n" + self.agent.knowledge_base
+        self.agent.save()
+        response = self.client.get(
+            f"{url}/{chunk['chunk_id']}", HTTP_X_API_KEY=self.api_key.key, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()["position"], chunk["position"])
+        self.assertGreater(response.json()["start"], chunk["start"])
+    
+    def test_knowledge_search(self):
+        """Testa busca BM25 nos chunks de conhecimento."""
+        self.agent.knowledge_base = (
+            "## Pães\nPão francês e pão de queijo saem às 6h.\n\n"
+            "## Entregas\nEntregamos no bairro com pedido mínimo de R$ 30.\n"
+        )
+        self.agent.save()
+        url = f"/api/n8n/agents/{self.agent.slug}/knowledge/search"
+        
+        data = self.client.get(url, {"q": "vocês fazem entrega?", "k": 1}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(len(data["results"]), 1)
+        self.assertEqual(data["results"][0]["title"], "Entregas")
+        self.assertIn("pedido mínimo", data["results"][0]["text"])
+        
+        data = self.client.get(url, {"q": "PAES"}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(data["results"][0]["title"], "Pães")
+        
+        response = self.client.get(url, HTTP_X_API_KEY=self.api_key.key)
+        self.assertEqual(response.status_code, 400)
+    
+    def test_agent_context_fits_budget(self):
+        """Testa montagem do contexto com persona e trechos dentro do orçamento."""
+        url = f"/api/n8n/agents/{self.agent.slug}/context"
+        response = self.client.post(
+            url,
+            data=json.dumps({"message": "Qual a taxa de entrega?", "budget": 400, "cliente_nome": "Maria"}),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertLessEqual(data["tokens"], 400)
+        self.assertIn(self.organization.name, data["persona"]["greeting"])
+        self.assertEqual(data["passages"][0]["title"], "Políticas > Entregas")
+        self.assertIn("Taxa de entrega", data["context"])
+        
+        # Orçamento que só comporta a persona
+        data = self.client.get(
+            url, {"message": "Qual a taxa de entrega?", "budget": 10}, HTTP_X_API_KEY=self.api_key.key
+        ).json()
+        self.assertEqual(data["passages"], [])
+    
+    def test_session_events_timeline(self):
+        """Testa a linha do tempo da sessão: ordem por ts, filtros e paginação."""
+        events = [
+            {"type": "message", "agent_slug": self.agent.slug, "session_id": "s1", "ts": "2026-01-01T10:00:02Z"},
+            {"type": "handoff", "agent_slug": self.agent.slug, "session_id": "s1", "ts": "2026-01-01T10:00:01Z"},
+            {"type": "message", "agent_slug": self.agent.slug, "session_id": "s1", "ts": "2026-01-01T10:00:03Z"},
+            {"type": "message", "agent_slug": self.agent.slug, "session_id": "s2"},
+        ]
+        self.client.post(
+            "/webhooks/n8n/events/batch",
+            data=json.dumps(events),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        url = "/api/n8n/sessions/s1/events"
+        data = self.client.get(url, {"limit": 2}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual([event["type"] for event in data["events"]], ["handoff", "message"])
+        self.assertTrue(data["has_more"])
+        
+        data = self.client.get(url, {"cursor": data["cursor"]}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual([event["ts"] for event in data["events"]], ["2026-01-01T10:00:03+00:00"])
+        self.assertFalse(data["has_more"])
+        
+        data = self.client.get(url, {"type": "message"}, HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(len(data["events"]), 2)
+        
+        # Outra padaria não vê a sessão
+        other = Organization.objects.create(name="Other Org", owner=self.user)
+        other_key = ApiKey.objects.create(padaria=other)
+        data = self.client.get(url, HTTP_X_API_KEY=other_key.key).json()
+        self.assertEqual(data["events"], [])
@@ -5,6 +5,14 @@ app_name = "api"
 
 urlpatterns = [
     path("docs/", views.api_docs, name="docs"),
+    path("n8n/agents/changes", views.get_agent_changes, name="agent_changes"),
+    path("n8n/agents/stream", views.agent_stream, name="agent_stream"),
+    path("n8n/agents/config:batch", views.get_agent_config_batch, name="agent_config_batch"),
     path("n8n/agents/<slug:slug>/config", views.get_agent_config, name="agent_config"),
+    path("n8n/agents/<slug:slug>/context", views.get_agent_context, name="agent_context"),
     path("n8n/agents/<slug:slug>/knowledge", views.get_agent_knowledge, name="agent_knowledge"),
+    path("n8n/agents/<slug:slug>/knowledge/search", views.search_knowledge, name="knowledge_search"),
+    path("n8n/agents/<slug:slug>/knowledge/chunks", views.list_knowledge_chunks, name="knowledge_chunks"),
+    path("n8n/agents/<slug:slug>/knowledge/chunks/<slug:chunk_id>", views.get_knowledge_chunk, name="knowledge_chunk"),
+    path("n8n/sessions/<str:session_id>/events", views.get_session_events, name="session_events"),
 ]
@@ -0,0 +1,164 @@
+"""
+Utilitários para os endpoints da API (n8n).
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.utils import timezone
+from agents.models import Agent, KnowledgeChunk
+from agents.snapshots import ETAG_FIELDS, compute_etag, get_snapshot, snapshot_in_scope
+from audit.models import AccessLog
+from core.pagination import encode_cursor
+from core.utils import get_client_ip
+
+
+def get_agent_versions(request, slug):
+    """
+    Busca apenas os carimbos de versão do agente (sem carregar os textos).
+    Respeita o escopo da API key. Retorna None se o agente não estiver
+    acessível; nesse caso a view segue o fluxo normal (404/403).
+    O resultado é memorizado no request para evitar consultas repetidas.
+    """
+    if not hasattr(request, "_agent_versions"):
+        api_key = request.api_key
+        queryset = Agent.objects.filter(slug=slug, padaria=api_key.padaria, is_active=True)
+        if api_key.agent_id:
+            queryset = queryset.filter(pk=api_key.agent_id)
+        request._agent_versions = queryset.values(*ETAG_FIELDS).first()
+    return request._agent_versions
+
+
+def get_scoped_snapshot(request, kind, slug):
+    """
+    Retorna o snapshot em cache se pertencer ao escopo da API key.
+    Memorizado no request (o decorator condition e a view consultam o mesmo).
+    """
+    attr = f"_agent_snapshot_{kind}"
+    if not hasattr(request, attr):
+        snapshot = get_snapshot(kind, slug)
+        if snapshot and not snapshot_in_scope(snapshot, request.api_key):
+            snapshot = None
+        setattr(request, attr, snapshot)
+    return getattr(request, attr)
+
+
+def config_etag(request, slug):
+    """etag_func para o endpoint de configuração."""
+    snapshot = get_scoped_snapshot(request, "config", slug)
+    if snapshot:
+        return snapshot["etag"]
+    versions = get_agent_versions(request, slug)
+    return compute_etag("config", versions) if versions else None
+
+
+def config_last_modified(request, slug):
+    """last_modified_func para o endpoint de configuração."""
+    snapshot = get_scoped_snapshot(request, "config", slug)
+    if snapshot:
+        return snapshot["last_modified"]
+    versions = get_agent_versions(request, slug)
+    if not versions:
+        return None
+    return max(versions["updated_at"], versions["padaria__updated_at"])
+
+
+def knowledge_etag(request, slug):
+    """etag_func para o endpoint de conhecimento."""
+    snapshot = get_scoped_snapshot(request, "knowledge", slug)
+    if snapshot:
+        return snapshot["etag"]
+    versions = get_agent_versions(request, slug)
+    return compute_etag("knowledge", versions) if versions else None
+
+
+def knowledge_last_modified(request, slug):
+    """last_modified_func para o endpoint de conhecimento."""
+    snapshot = get_scoped_snapshot(request, "knowledge", slug)
+    if snapshot:
+        return snapshot["last_modified"]
+    versions = get_agent_versions(request, slug)
+    if not versions:
+        return None
+    return max(filter(None, [versions["updated_at"], versions["knowledge_updated_at"]]))
+
+
+def log_not_modified(endpoint):
+    """
+    Registra no AccessLog as respostas 304 do GET condicional, que o
+    decorator condition devolve sem chamar a view (e o log dela). Aplicar
+    por fora do condition.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, slug, **kwargs):
+            response = view_func(request, slug, **kwargs)
+            if response.status_code == 304:
+                snapshot = getattr(request, "_agent_snapshot_config", None) or getattr(
+                    request, "_agent_snapshot_knowledge", None
+                )
+                versions = getattr(request, "_agent_versions", None)
+                agent_id = snapshot["agent_id"] if snapshot else (versions["id"] if versions else None)
+                AccessLog.log(
+                    endpoint,
+                    api_key=request.api_key,
+                    agent_id=agent_id,
+                    ref=slug,
+                    extra={"not_modified": True, **kwargs},
+                    ip=get_client_ip(request),
+                    user_agent=request.META.get("HTTP_USER_AGENT", "")
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def chunk_etag(request, slug, chunk_id):
+    """
+    etag_func para um chunk, desde que ele exista no agente acessível pela
+    API key. O chunk_id só cobre o texto: o rebuild mantém o id e atualiza
+    posição, offsets e título, que também vão na resposta e entram no hash.
+    """
+    versions = get_agent_versions(request, slug)
+    if not versions:
+        return None
+    row = KnowledgeChunk.objects.filter(agent_id=versions["id"], chunk_id=chunk_id).values_list(
+        "position", "start", "end", "title"
+    ).first()
+    if row is None:
+        return None
+    parts = [chunk_id, *(str(value) for value in row)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+# Campos lidos pelo feed/stream de alterações (sem carregar os textos)
+CHANGE_FIELDS = ("slug", "is_active", "padaria_id") + ETAG_FIELDS
+
+
+def changes_cursor(rows, cursor, has_more):
+    """
+    Cursor devolvido pelo feed de alterações. updated_at é gravado no save,
+    antes do commit: uma transação mais lenta pode aparecer depois com data
+    anterior à de um cursor já entregue. Ao alcançar o fim do feed, o cursor
+    não passa de agora - AGENT_CHANGES_OVERLAP_SECONDS; as alterações dessa
+    janela voltam na leitura seguinte (o cliente descarta pela version).
+    """
+    if has_more or not rows:
+        return cursor
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, "AGENT_CHANGES_OVERLAP_SECONDS", 5))
+    if rows[-1]["updated_at"] < horizon:
+        return cursor
+    return encode_cursor([horizon, 0])
+
+
+def serialize_change(row):
+    """Item do feed de alterações a partir de uma linha de Agent.values(*CHANGE_FIELDS)."""
+    return {
+        "slug": row["slug"],
+        "version": row["version"],
+        "is_active": row["is_active"],
+        "updated_at": row["updated_at"].isoformat(),
+        "knowledge_updated_at": row["knowledge_updated_at"].isoformat() if row["knowledge_updated_at"] else None,
+        "config_etag": compute_etag("config", row),
+        "knowledge_etag": compute_etag("knowledge", row),
+    }
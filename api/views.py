@@ -1,9 +1,24 @@
-from django.http import JsonResponse
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.views.decorators.http import require_http_methods
-from agents.models import Agent
-from audit.models import AuditLog
-from core.utils import require_api_key, rate_limited, get_client_ip
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, condition
+from agents.models import Agent, KnowledgeChunk
+from agents.context import assemble_context
+from agents.search import search_chunks
+from agents.snapshots import store_snapshots, get_snapshots, snapshot_in_scope
+from audit.models import AccessLog
+from core.pagination import keyset_page, InvalidCursor
+from core.utils import require_api_key, authenticate_api_key, get_client_ip
+from webhooks.models import ConversationEvent
+from . import stream
+from .utils import (
+    config_etag, config_last_modified, knowledge_etag, knowledge_last_modified,
+    get_scoped_snapshot, serialize_change, changes_cursor, CHANGE_FIELDS, chunk_etag, log_not_modified,
+)
 
 
 def api_docs(request):
@@ -13,25 +28,20 @@ def api_docs(request):
     return render(request, "api/docs.html")
 
 
-@require_http_methods(["GET"])
-@require_api_key
-def get_agent_config(request, slug):
+def _fetch_agent(request, slug, light=False):
     """
-    Retorna configuração de um agente para o n8n.
-    Requer autenticação via API key.
+    Busca o agente no escopo da API key.
+    light=True não carrega os textos de conhecimento.
+    Retorna (agent, None) ou (None, JsonResponse de erro 404/403).
     """
-    # Rate limiting
     padaria = request.api_key.padaria
-    cache_key = f"api_rate_{padaria.id}_{get_client_ip(request)}"
-    
-    if not rate_limited(cache_key, limit=60, window_seconds=60):
-        return JsonResponse({"error": "Rate limit exceeded"}, status=429)
-    
-    # Buscar agente
+    agents = Agent.objects.select_related("padaria")
+    if light:
+        agents = agents.defer("knowledge_base", "knowledge_pdf_text")
     try:
-        agent = Agent.objects.get(slug=slug, padaria=padaria, is_active=True)
+        agent = agents.get(slug=slug, padaria=padaria, is_active=True)
     except Agent.DoesNotExist:
-        return JsonResponse({
+        return None, JsonResponse({
             "error": "Agent not found",
             "details": {
                 "slug": slug,
@@ -42,7 +52,7 @@ def get_agent_config(request, slug):
     
     # Verificar se a API Key tem acesso a este agente
     if not request.api_key.has_access_to_agent(agent):
-        return JsonResponse({
+        return None, JsonResponse({
             "error": "Access denied",
             "details": {
                 "message": "Esta API Key não tem permissão para acessar este agente",
@@ -51,102 +61,558 @@ def get_agent_config(request, slug):
             }
         }, status=403)
     
+    return agent, None
+
+
+@require_http_methods(["GET"])
+@require_api_key
+@log_not_modified("get_agent_config")
+@condition(etag_func=config_etag, last_modified_func=config_last_modified)
+def get_agent_config(request, slug):
+    """
+    Retorna configuração de um agente para o n8n.
+    Requer autenticação via API key.
+    Suporta GET condicional (If-None-Match / If-Modified-Since -> 304).
+    """
+    # Snapshot pré-renderizado (sem ORM); se ausente, buscar e gravar no cache
+    snapshot = get_scoped_snapshot(request, "config", slug)
+    if snapshot is None:
+        agent, error = _fetch_agent(request, slug)
+        if error:
+            return error
+        snapshot = store_snapshots(agent)["config"]
+    
     # Log da requisição
-    AuditLog.log(
-        action="api_call",
-        entity="Agent",
-        padaria=padaria,
-        entity_id=agent.id,
-        diff={
-            "endpoint": "get_agent_config",
-            "slug": slug
-        },
+    AccessLog.log(
+        "get_agent_config",
+        api_key=request.api_key,
+        agent_id=snapshot["agent_id"],
+        ref=slug,
         ip=get_client_ip(request),
         user_agent=request.META.get("HTTP_USER_AGENT", "")
     )
     
-    # Atualizar last_used_at da API key
-    from django.utils import timezone
-    request.api_key.last_used_at = timezone.now()
-    request.api_key.save(update_fields=["last_used_at"])
-    
     # Retornar configuração (sem knowledge_base para manter leve)
-    config = {
-        "name": agent.name,
-        "slug": agent.slug,
-        "role": agent.role,
-        "sector": agent.sector,
-        "language": agent.language,
-        "greeting": agent.greeting,
-        "tone": agent.tone,
-        "personality": agent.personality,
-        "style_guidelines": agent.style_guidelines,
-        "business_hours": agent.business_hours,
-        "fallback_message": agent.fallback_message,
-        "escalation_rule": agent.escalation_rule,
-        "padaria": {
-            "name": padaria.name,
-            "slug": padaria.slug,
-        },
-        "updated_at": agent.updated_at.isoformat(),
+    return HttpResponse(snapshot["body"], content_type="application/json")
+
+
+def _parse_batch_request(request):
+    """
+    Extrai slugs (e ETags conhecidos) do request em lote.
+    GET: ?slugs=a,b,c  |  POST: {"slugs": [...], "etags": {"slug": "etag"}}
+    Retorna (slugs, etags, None) ou (None, None, JsonResponse de erro).
+    """
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body.decode("utf-8") or "{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None, None, JsonResponse({"error": "Invalid JSON"}, status=400)
+        body_error = JsonResponse({
+            "error": "Body must be an object with 'slugs' (list) and optional 'etags' (object)"
+        }, status=400)
+        if not isinstance(data, dict):
+            return None, None, body_error
+        slugs = data.get("slugs")
+        etags = data.get("etags") or {}
+        if not isinstance(slugs, list) or not isinstance(etags, dict):
+            return None, None, body_error
+    else:
+        slugs = request.GET.get("slugs", "").split(",")
+        etags = {}
+    
+    # Remover vazios e duplicados mantendo a ordem
+    slugs = list(dict.fromkeys(str(slug).strip() for slug in slugs if str(slug).strip()))
+    if not slugs:
+        return None, None, JsonResponse({"error": "Provide at least one slug"}, status=400)
+    
+    max_slugs = getattr(settings, "AGENT_CONFIG_BATCH_MAX", 500)
+    if len(slugs) > max_slugs:
+        return None, None, JsonResponse({
+            "error": f"Too many slugs. Max {max_slugs} per request."
+        }, status=400)
+    
+    return slugs, etags, None
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@require_api_key
+def get_agent_config_batch(request):
+    """
+    Retorna a configuração de vários agentes em uma única chamada.
+    Cada item tem status próprio (200, 304, 403 ou 404) e ETag.
+    Os snapshots em cache são usados; os ausentes são buscados em uma só query.
+    """
+    api_key = request.api_key
+    padaria = api_key.padaria
+    
+    slugs, etags, error = _parse_batch_request(request)
+    if error:
+        return error
+    
+    snapshots = {
+        slug: snapshot
+        for slug, snapshot in get_snapshots("config", slugs).items()
+        if snapshot_in_scope(snapshot, api_key)
     }
+    errors = {}
+    
+    missing = [slug for slug in slugs if slug not in snapshots]
+    if missing:
+        agents = Agent.objects.select_related("padaria").filter(
+            slug__in=missing, padaria=padaria, is_active=True
+        )
+        for agent in agents:
+            if not api_key.has_access_to_agent(agent):
+                errors[agent.slug] = {"status": 403, "error": "Access denied"}
+                continue
+            snapshots[agent.slug] = store_snapshots(agent)["config"]
+        for slug in missing:
+            if slug not in snapshots and slug not in errors:
+                errors[slug] = {"status": 404, "error": "Agent not found"}
+    
+    # Montar a resposta reaproveitando os bytes JSON dos snapshots
+    items = []
+    for slug in slugs:
+        key = json.dumps(slug).encode("utf-8")
+        if slug in errors:
+            items.append(key + b":" + json.dumps(errors[slug]).encode("utf-8"))
+            continue
+        snapshot = snapshots[slug]
+        header = {"status": 200, "etag": snapshot["etag"], "version": snapshot["version"]}
+        if etags.get(slug) == snapshot["etag"]:
+            header["status"] = 304
+            items.append(key + b":" + json.dumps(header).encode("utf-8"))
+        else:
+            items.append(
+                key + b":" + json.dumps(header).encode("utf-8")[:-1] + b', "config": ' + snapshot["body"] + b"}"
+            )
+    
+    # Um único log para o lote
+    AccessLog.log(
+        "get_agent_config_batch",
+        api_key=api_key,
+        extra={
+            "count": len(slugs),
+            "found": len(slugs) - len(errors),
+        },
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    body = b'{"agents": {' + b", ".join(items) + b"}}"
+    return HttpResponse(body, content_type="application/json")
+
+
+@require_http_methods(["GET"])
+@require_api_key
+def get_agent_changes(request):
+    """
+    Feed de alterações: agentes (no escopo da API key) cuja configuração
+    ou conhecimento mudou depois do cursor informado em ?since=.
+    Paginado por keyset em (updated_at, id). Sem ?since= lista todos.
+    O cursor final fica um pouco atrás das últimas alterações (ver
+    changes_cursor): elas podem vir de novo, com a mesma version.
+    """
+    api_key = request.api_key
+    padaria = api_key.padaria
+    
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), 500)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    
+    agents = Agent.objects.filter(padaria=padaria)
+    if api_key.agent_id:
+        agents = agents.filter(pk=api_key.agent_id)
+    agents = agents.values(*CHANGE_FIELDS)
+    
+    try:
+        rows, cursor, has_more = keyset_page(
+            agents, ("updated_at", "id"), cursor=request.GET.get("since"), limit=limit
+        )
+    except (InvalidCursor, ValidationError):
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    
+    cursor = changes_cursor(rows, cursor, has_more)
+    changes = [serialize_change(row) for row in rows]
     
-    return JsonResponse(config)
+    AccessLog.log(
+        "get_agent_changes",
+        api_key=api_key,
+        extra={"count": len(changes)},
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    return JsonResponse({"changes": changes, "cursor": cursor, "has_more": has_more})
+
+
+@require_http_methods(["GET"])
+async def agent_stream(request):
+    """
+    Stream de alterações dos agentes no escopo da API key.
+    
+    - SSE (padrão): mantém a conexão aberta e emite um evento "agent" a cada
+      alteração (id do evento = cursor; reconecte com Last-Event-ID).
+    - Long-poll (?mode=poll&since=<cursor>&timeout=25): responde assim que
+      houver alterações ou no timeout, no mesmo formato do feed /changes.
+    
+    Deve ser servido pelo entry point ASGI (config/asgi.py) para que as
+    conexões ociosas não ocupem workers síncronos.
+    """
+    error = await sync_to_async(authenticate_api_key)(request)
+    if error:
+        return error
+    
+    api_key = request.api_key
+    poll_mode = request.GET.get("mode") == "poll"
+    since = request.GET.get("since") or request.META.get("HTTP_LAST_EVENT_ID")
+    broadcaster = stream.get_broadcaster()
+    
+    # Inscrever antes de ler o backlog para não perder alterações no meio
+    subscriber = broadcaster.subscribe(api_key.padaria_id, api_key.agent_id)
+    try:
+        if since:
+            backlog, cursor = await sync_to_async(stream.fetch_changes)(
+                since, api_key.padaria_id, api_key.agent_id
+            )
+        elif poll_mode:
+            backlog, cursor = [], await sync_to_async(stream.latest_cursor)()
+        else:
+            backlog, cursor = [], None
+    except (InvalidCursor, ValidationError):
+        broadcaster.unsubscribe(subscriber)
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    
+    await sync_to_async(AccessLog.log)(
+        "agent_stream",
+        api_key=api_key,
+        extra={"mode": "poll" if poll_mode else "sse"},
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    if poll_mode:
+        if backlog:
+            broadcaster.unsubscribe(subscriber)
+            rows = backlog
+        else:
+            try:
+                timeout = min(max(float(request.GET.get("timeout", 25)), 0), 55)
+            except ValueError:
+                timeout = 25
+            rows = await stream.wait_for_changes(broadcaster, subscriber, timeout)
+        if rows:
+            cursor = stream.row_cursor(rows[-1])
+        return JsonResponse({
+            "changes": [serialize_change(row) for row in rows],
+            "cursor": cursor,
+            "has_more": False,
+        })
+    
+    response = StreamingHttpResponse(
+        stream.sse_events(broadcaster, subscriber, backlog),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @require_http_methods(["GET"])
 @require_api_key
+@log_not_modified("get_agent_knowledge")
+@condition(etag_func=knowledge_etag, last_modified_func=knowledge_last_modified)
 def get_agent_knowledge(request, slug):
     """
     Retorna apenas a base de conhecimento de um agente.
     Endpoint separado para não sobrecarregar a API principal.
+    Suporta GET condicional (If-None-Match / If-Modified-Since -> 304).
     """
-    padaria = request.api_key.padaria
+    # Snapshot pré-renderizado (sem ORM); se ausente, buscar e gravar no cache
+    snapshot = get_scoped_snapshot(request, "knowledge", slug)
+    if snapshot is None:
+        agent, error = _fetch_agent(request, slug)
+        if error:
+            return error
+        snapshot = store_snapshots(agent)["knowledge"]
+    
+    # Log da requisição
+    AccessLog.log(
+        "get_agent_knowledge",
+        api_key=request.api_key,
+        agent_id=snapshot["agent_id"],
+        ref=slug,
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    # Retornar conhecimento
+    return HttpResponse(snapshot["body"], content_type="application/json")
+
+
+def _serialize_chunk(chunk, include_text=False):
+    data = {
+        "chunk_id": chunk.chunk_id,
+        "source": chunk.source,
+        "position": chunk.position,
+        "title": chunk.title,
+        "start": chunk.start,
+        "end": chunk.end,
+        "size": chunk.size,
+    }
+    if include_text:
+        data["text"] = chunk.text
+    return data
+
+
+@require_http_methods(["GET"])
+@require_api_key
+@log_not_modified("list_knowledge_chunks")
+@condition(etag_func=knowledge_etag, last_modified_func=knowledge_last_modified)
+def list_knowledge_chunks(request, slug):
+    """
+    Lista os chunks de conhecimento de um agente (IDs, tamanhos, offsets).
+    
+    Parâmetros:
+        ids: lista de chunk_ids separados por vírgula (busca por ID)
+        source: "base" ou "pdf"
+        cursor / limit: paginação por posição (máx. 100 por página)
+        include_text=1: inclui o texto de cada chunk da página
+    """
+    agent, error = _fetch_agent(request, slug, light=True)
+    if error:
+        return error
     
-    # Buscar agente
     try:
-        agent = Agent.objects.get(slug=slug, padaria=padaria, is_active=True)
-    except Agent.DoesNotExist:
+        limit = min(max(int(request.GET.get("limit", 50)), 1), 100)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    include_text = request.GET.get("include_text") in ("1", "true")
+    
+    chunks = KnowledgeChunk.objects.filter(agent=agent)
+    if not include_text:
+        chunks = chunks.defer("text")
+    if request.GET.get("source"):
+        chunks = chunks.filter(source=request.GET["source"])
+    ids = [chunk_id for chunk_id in request.GET.get("ids", "").split(",") if chunk_id]
+    if ids:
+        chunks = chunks.filter(chunk_id__in=ids[:limit])
+    
+    try:
+        items, cursor, has_more = keyset_page(
+            chunks, ("position",), cursor=request.GET.get("cursor"), limit=limit
+        )
+    except (InvalidCursor, ValidationError):
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    
+    AccessLog.log(
+        "list_knowledge_chunks",
+        api_key=request.api_key,
+        agent_id=agent.id,
+        ref=slug,
+        extra={"count": len(items)},
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    return JsonResponse({
+        "slug": agent.slug,
+        "chunks": [_serialize_chunk(chunk, include_text) for chunk in items],
+        "cursor": cursor,
+        "has_more": has_more,
+    })
+
+
+@require_http_methods(["GET"])
+@require_api_key
+@log_not_modified("get_knowledge_chunk")
+@condition(etag_func=chunk_etag)
+def get_knowledge_chunk(request, slug, chunk_id):
+    """
+    Retorna um chunk de conhecimento pelo ID.
+    O ETag cobre o chunk_id (conteúdo) e a posição/offsets/título atuais.
+    """
+    agent, error = _fetch_agent(request, slug, light=True)
+    if error:
+        return error
+    
+    try:
+        chunk = KnowledgeChunk.objects.get(agent=agent, chunk_id=chunk_id)
+    except KnowledgeChunk.DoesNotExist:
         return JsonResponse({
-            "error": "Agent not found",
-            "details": {
-                "slug": slug,
-                "padaria": padaria.name
-            }
+            "error": "Chunk not found",
+            "details": {"slug": slug, "chunk_id": chunk_id}
         }, status=404)
     
-    # Verificar se a API Key tem acesso a este agente
-    if not request.api_key.has_access_to_agent(agent):
-        return JsonResponse({
-            "error": "Access denied",
-            "details": {
-                "message": "Esta API Key não tem permissão para acessar este agente",
-                "api_key_agent": request.api_key.agent.name if request.api_key.agent else "Todos",
-                "requested_agent": agent.name
-            }
-        }, status=403)
+    AccessLog.log(
+        "get_knowledge_chunk",
+        api_key=request.api_key,
+        agent_id=agent.id,
+        ref=slug,
+        extra={"chunk_id": chunk_id},
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
     
-    # Log da requisição
-    AuditLog.log(
-        action="api_call",
-        entity="Agent",
-        padaria=padaria,
-        entity_id=agent.id,
-        diff={
-            "endpoint": "get_agent_knowledge",
-            "slug": slug
+    return JsonResponse(_serialize_chunk(chunk, include_text=True))
+
+
+@require_http_methods(["GET"])
+@require_api_key
+def search_knowledge(request, slug):
+    """
+    Busca textual (BM25) na base de conhecimento do agente.
+    Retorna os k trechos (chunks) mais relevantes para a pergunta.
+    
+    Parâmetros:
+        q: texto da busca (obrigatório)
+        k: quantidade de trechos (padrão 5, máx. 20)
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"error": "Missing query parameter 'q'"}, status=400)
+    try:
+        k = min(max(int(request.GET.get("k", 5)), 1), 20)
+    except ValueError:
+        return JsonResponse({"error": "Invalid k"}, status=400)
+    
+    agent, error = _fetch_agent(request, slug, light=True)
+    if error:
+        return error
+    
+    results = []
+    for chunk, score in search_chunks(agent.id, agent.knowledge_updated_at, lambda index: index.search(query, k)):
+        data = _serialize_chunk(chunk, include_text=True)
+        data["score"] = round(score, 4)
+        results.append(data)
+    
+    AccessLog.log(
+        "search_knowledge",
+        api_key=request.api_key,
+        agent_id=agent.id,
+        ref=slug,
+        extra={
+            "query": query[:200],
+            "count": len(results),
         },
         ip=get_client_ip(request),
         user_agent=request.META.get("HTTP_USER_AGENT", "")
     )
     
-    # Retornar conhecimento
-    knowledge = {
+    return JsonResponse({
         "slug": agent.slug,
-        "knowledge_base": agent.knowledge_base,
-        "has_pdf": bool(agent.knowledge_pdf),
-        "pdf_text": agent.knowledge_pdf_text if agent.knowledge_pdf else None,
-        "updated_at": agent.updated_at.isoformat(),
-    }
+        "query": query,
+        "results": results,
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@require_api_key
+def get_agent_context(request, slug):
+    """
+    Monta o contexto de prompt do agente para uma mensagem do cliente:
+    persona + trechos de conhecimento mais relevantes dentro do orçamento.
+    
+    GET:  ?message=...&budget=1500&cliente_nome=Maria
+    POST: {"message": "...", "budget": 1500, "cliente_nome": "Maria"}
+    """
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body.decode("utf-8") or "{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Body must be an object"}, status=400)
+    else:
+        data = request.GET
+    
+    message = str(data.get("message") or "").strip()
+    if not message:
+        return JsonResponse({"error": "Missing 'message'"}, status=400)
+    max_budget = getattr(settings, "AGENT_CONTEXT_MAX_TOKENS", 16000)
+    try:
+        budget = int(data.get("budget") or getattr(settings, "AGENT_CONTEXT_DEFAULT_TOKENS", 1500))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid budget"}, status=400)
+    budget = min(max(budget, 1), max_budget)
+    cliente_nome = str(data.get("cliente_nome") or "Cliente")[:100]
+    
+    agent, error = _fetch_agent(request, slug, light=True)
+    if error:
+        return error
+    
+    result = assemble_context(agent, message, budget, cliente_nome=cliente_nome)
+    
+    AccessLog.log(
+        "get_agent_context",
+        api_key=request.api_key,
+        agent_id=agent.id,
+        ref=slug,
+        extra={
+            "budget": budget,
+            "tokens": result["tokens"],
+            "passages": len(result["passages"]),
+        },
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
+    
+    return JsonResponse({
+        "slug": agent.slug,
+        "budget": budget,
+        **result,
+    })
+
+
+@require_http_methods(["GET"])
+@require_api_key
+def get_session_events(request, session_id):
+    """
+    Linha do tempo de uma sessão de conversa: eventos recebidos pelos
+    webhooks, em ordem de ts. Paginado por keyset em (ts, id).
+    
+    Parâmetros:
+        agent: slug do agente (opcional)
+        type: tipo do evento (opcional)
+        cursor / limit: paginação (máx. 500 por página)
+    """
+    api_key = request.api_key
+    
+    try:
+        limit = min(max(int(request.GET.get("limit", 100)), 1), 500)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    
+    events = ConversationEvent.objects.filter(padaria_id=api_key.padaria_id, session_id=session_id)
+    if api_key.agent_id:
+        events = events.filter(agent_id=api_key.agent_id)
+    if request.GET.get("agent"):
+        events = events.filter(agent_slug=request.GET["agent"])
+    if request.GET.get("type"):
+        events = events.filter(type=request.GET["type"])
+    
+    try:
+        items, cursor, has_more = keyset_page(
+            events, ("ts", "id"), cursor=request.GET.get("cursor"), limit=limit
+        )
+    except (InvalidCursor, ValidationError):
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    
+    AccessLog.log(
+        "get_session_events",
+        api_key=api_key,
+        ref=session_id,
+        extra={"count": len(items)},
+        ip=get_client_ip(request),
+        user_agent=request.META.get("HTTP_USER_AGENT", "")
+    )
     
-    return JsonResponse(knowledge)
+    return JsonResponse({
+        "session_id": session_id,
+        "events": [event.serialize() for event in items],
+        "cursor": cursor,
+        "has_more": has_more,
+    })
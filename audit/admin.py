@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AuditLog
+from .models import AuditLog, AccessLog
 
 
 @admin.register(AuditLog)
@@ -15,3 +15,21 @@ class AuditLogAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+
+
+@admin.register(AccessLog)
+class AccessLogAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "endpoint", "padaria", "api_key", "ref", "ip_address")
+    list_filter = ("endpoint", "day")
+    list_select_related = ("padaria", "api_key")
+    readonly_fields = (
+        "created_at", "day", "endpoint", "padaria", "api_key", "agent_id", "ref", "extra", "ip_address", "user_agent",
+    )
+    # Tabela grande: não contar todas as linhas a cada página
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,169 @@
+"""
+Exportação dos logs em streaming (CSV ou NDJSON, com gzip opcional).
+
+As linhas são lidas com .iterator(chunk_size=AUDIT_EXPORT_CHUNK_SIZE) e
+serializadas em blocos de ~64 KB, então a memória usada não depende do
+tamanho da exportação. Usado pela view audit:export e pelo comando
+export_audit_logs.
+
+Fontes:
+    "audit": AuditLog (ações humanas);
+    "access": AccessLog (chamadas da API e webhooks).
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .models import AuditLog, AccessLog, ENDPOINT_CHOICES, ENDPOINT_CODES, WEBHOOK_ENDPOINTS
+from .queries import access_filters
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+# Colunas exportadas: (nome na exportação, campo para values_list)
+EXPORT_COLUMNS = {
+    "audit": (
+        ("id", "id"),
+        ("created_at", "created_at"),
+        ("padaria", "padaria__slug"),
+        ("actor", "actor__username"),
+        ("action", "action"),
+        ("entity", "entity"),
+        ("entity_id", "entity_id"),
+        ("ip_address", "ip_address"),
+        ("user_agent", "user_agent"),
+        ("diff", "diff"),
+    ),
+    "access": (
+        ("id", "id"),
+        ("created_at", "created_at"),
+        ("padaria", "padaria__slug"),
+        ("endpoint", "endpoint"),
+        ("api_key_id", "api_key_id"),
+        ("agent_id", "agent_id"),
+        ("ref", "ref"),
+        ("ip_address", "ip_address"),
+        ("user_agent", "user_agent__value"),
+        ("extra", "extra"),
+    ),
+}
+
+ENDPOINT_NAMES = dict(ENDPOINT_CHOICES)
+BLOCK_SIZE = 64 * 1024
+
+
+def day_bounds(start=None, end=None):
+    """Filtros de created_at para as datas (inclusivas, no fuso do projeto)."""
+    filters = {}
+    if start:
+        filters["created_at__gte"] = timezone.make_aware(datetime.combine(start, time.min))
+    if end:
+        filters["created_at__lt"] = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return filters
+
+
+def export_queryset(source="audit", padaria_ids=None, actions=None, start=None, end=None):
+    """
+    values_list das linhas a exportar, em ordem de created_at.
+    actions: ações do AuditLog; no AccessLog, nomes de endpoint ou
+    "api_call"/"webhook_received".
+    """
+    filters = day_bounds(start, end)
+    if padaria_ids is not None:
+        filters["padaria_id__in"] = padaria_ids
+
+    if source == "access":
+        queryset = AccessLog.objects.filter(**access_filters(filters))
+        if actions:
+            endpoints = set()
+            for action in actions:
+                if action == "api_call":
+                    endpoints.update(code for code in ENDPOINT_NAMES if code not in WEBHOOK_ENDPOINTS)
+                elif action == "webhook_received":
+                    endpoints.update(WEBHOOK_ENDPOINTS)
+                elif action in ENDPOINT_CODES:
+                    endpoints.add(ENDPOINT_CODES[action])
+            queryset = queryset.filter(endpoint__in=endpoints)
+    elif source == "audit":
+        queryset = AuditLog.objects.filter(**filters)
+        if actions:
+            queryset = queryset.filter(action__in=actions)
+    else:
+        raise ValueError(f"Fonte de exportação inválida: {source}")
+
+    fields = [field for _, field in EXPORT_COLUMNS[source]]
+    return queryset.order_by("created_at", "id").values_list(*fields)
+
+
+def iter_export(queryset, source="audit", fmt="csv", compress=False):
+    """Gera a exportação em blocos de bytes (sem carregar o queryset)."""
+    chunks = _iter_blocks(queryset, source, fmt)
+    if compress:
+        chunks = _gzip(chunks)
+    return chunks
+
+
+class _Buffer:
+    """Destino do csv.writer: acumula o texto para ser enviado em blocos."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, value):
+        self.parts.append(value)
+        self.size += len(value)
+
+    def take(self):
+        data = "".join(self.parts).encode("utf-8")
+        self.parts = []
+        self.size = 0
+        return data
+
+
+def _iter_blocks(queryset, source, fmt):
+    names = [name for name, _ in EXPORT_COLUMNS[source]]
+    chunk_size = getattr(settings, "AUDIT_EXPORT_CHUNK_SIZE", 2000)
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(names)
+
+    for row in queryset.iterator(chunk_size=chunk_size):
+        record = dict(zip(names, row))
+        if source == "access":
+            record["endpoint"] = ENDPOINT_NAMES.get(record["endpoint"], record["endpoint"])
+        if fmt == "csv":
+            last = names[-1]  # diff / extra em JSON
+            record[last] = json.dumps(record[last], cls=DjangoJSONEncoder, ensure_ascii=False) if record[last] else ""
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else ("" if value is None else value)
+                for value in record.values()
+            ])
+        else:
+            buffer.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+        if buffer.size >= BLOCK_SIZE:
+            yield buffer.take()
+
+    if buffer.size:
+        yield buffer.take()
+
+
+def _gzip(chunks):
+    # wbits=31: formato gzip (cabeçalho + CRC), compactado em fluxo
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(source, fmt, compress, padaria_slug=None):
+    name = f"{source}-{padaria_slug or 'todas'}-{timezone.localdate():%Y%m%d}.{EXPORT_FORMATS[fmt][1]}"
+    return f"{name}.gz" if compress else name
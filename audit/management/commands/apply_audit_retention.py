@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from audit.retention import RetentionEngine, compact
+
+
+class Command(BaseCommand):
+    help = (
+        "Arquiva (JSONL gzip em AUDIT_ARCHIVE_DIR) e remove os logs de auditoria vencidos "
+        "segundo AUDIT_RETENTION_POLICIES. Pode ser interrompido e executado de novo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Apenas contar os logs vencidos")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--pause", type=float, default=0, help="Segundos de pausa entre os lotes")
+        parser.add_argument("--archive-dir", default=None, help="Diretório do arquivo (padrão: AUDIT_ARCHIVE_DIR)")
+        parser.add_argument("--compact", action="store_true", help="Atualizar as estatísticas da tabela ao final")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="Com --compact: VACUUM completo (bloqueia as escritas no SQLite)")
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine(
+            archive_dir=options["archive_dir"],
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+            progress=self.stdout.write,
+        )
+        if not engine.policies:
+            self.stdout.write("Nenhuma política de retenção configurada.")
+            return
+
+        if options["dry_run"]:
+            for name, count in engine.count_expired().items():
+                self.stdout.write(f"{name}: {count} log(s) vencido(s)")
+            return
+
+        totals = engine.run()
+        if options["compact"]:
+            compact(full=options["vacuum"])
+        self.stdout.write(self.style.SUCCESS(f"{sum(totals.values())} log(s) de auditoria arquivado(s) e removido(s)."))
@@ -0,0 +1,55 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from organizations.models import Padaria
+from audit.export import EXPORT_FORMATS, export_queryset, iter_export
+
+
+class Command(BaseCommand):
+    help = "Exporta os logs em streaming (CSV ou NDJSON, gzip opcional), com memória constante."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-", help="Arquivo de saída (padrão: stdout)")
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--source", choices=["audit", "access"], default="audit",
+                            help="audit: AuditLog; access: AccessLog (API e webhooks)")
+        parser.add_argument("--padaria", action="append", default=[], help="Slug da padaria (repetível)")
+        parser.add_argument("--action", action="append", default=[], help="Ação (repetível)")
+        parser.add_argument("--start", default=None, help="Data inicial (AAAA-MM-DD)")
+        parser.add_argument("--end", default=None, help="Data final, inclusiva (AAAA-MM-DD)")
+        parser.add_argument("--gzip", action="store_true", help="Compactar com gzip")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ("start", "end"):
+            value = options[name]
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                raise CommandError(f"--{name} deve estar no formato AAAA-MM-DD")
+
+        padaria_ids = None
+        if options["padaria"]:
+            padarias = dict(Padaria.objects.filter(slug__in=options["padaria"]).values_list("slug", "id"))
+            missing = set(options["padaria"]) - set(padarias)
+            if missing:
+                raise CommandError(f"Padaria(s) não encontrada(s): {', '.join(sorted(missing))}")
+            padaria_ids = list(padarias.values())
+
+        queryset = export_queryset(
+            source=options["source"],
+            padaria_ids=padaria_ids,
+            actions=options["action"],
+            start=dates["start"],
+            end=dates["end"],
+        )
+        chunks = iter_export(queryset, options["source"], options["format"], options["gzip"])
+
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options["output"] != "-":
+            self.stderr.write(self.style.SUCCESS(f"Exportação gravada em {options['output']}."))
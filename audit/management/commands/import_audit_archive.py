@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from audit.retention import import_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa de volta arquivos .jsonl.gz do arquivamento dos logs de auditoria "
+        "(linhas já existentes são ignoradas). Os logs importados continuam sujeitos à retenção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Arquivos a importar")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        for path in options["paths"]:
+            try:
+                count = import_archive(path, batch_size=options["batch_size"])
+            except FileNotFoundError:
+                raise CommandError(f"Arquivo não encontrado: {path}")
+            self.stdout.write(f"{path}: {count} log(s)")
+            total += count
+        self.stdout.write(self.style.SUCCESS(f"{total} log(s) de auditoria importado(s)."))
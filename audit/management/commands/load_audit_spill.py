@@ -0,0 +1,56 @@
+import json
+import os
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+from audit.writer import save_entries
+
+
+class Command(BaseCommand):
+    help = "Importa para o banco os logs de auditoria gravados no arquivo de spill (JSONL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=None,
+            help="Arquivo de spill (padrão: AUDIT_SPILL_PATH)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"] or getattr(settings, "AUDIT_SPILL_PATH", "audit_spill.jsonl")
+        if not os.path.exists(path):
+            self.stdout.write("Nenhum arquivo de spill encontrado.")
+            return
+
+        # Renomear antes de ler: os workers continuam gravando em um arquivo novo
+        loading_path = f"{path}.loading"
+        if not os.path.exists(loading_path):
+            os.replace(path, loading_path)
+
+        total = 0
+        batch = []
+        with open(loading_path, encoding="utf-8") as spill_file:
+            for line in spill_file:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                # Linhas sem "model" são de versões anteriores (só AuditLog)
+                model = apps.get_model(data.pop("model", "audit.auditlog"))
+                data["created_at"] = parse_datetime(data["created_at"])
+                user_agent_string = data.pop("user_agent_string", None)
+                entry = model(**data)
+                if user_agent_string is not None:
+                    entry.user_agent_string = user_agent_string
+                batch.append(entry)
+                if len(batch) >= options["batch_size"]:
+                    save_entries(batch)
+                    total += len(batch)
+                    batch = []
+        if batch:
+            save_entries(batch)
+            total += len(batch)
+
+        os.remove(loading_path)
+        self.stdout.write(self.style.SUCCESS(f"{total} log(s) de auditoria importado(s)."))
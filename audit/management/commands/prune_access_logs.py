@@ -0,0 +1,40 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from audit.models import AccessLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove os logs de acesso (AccessLog) mais antigos que a retenção, um dia por vez. "
+        "Não arquiva: os totais continuam nos resumos de atividade."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Dias mantidos (padrão: ACCESS_LOG_RETENTION_DAYS)",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        days = options["days"] if options["days"] is not None else getattr(settings, "ACCESS_LOG_RETENTION_DAYS", 30)
+        cutoff = timezone.now().date() - timedelta(days=days)
+
+        total = 0
+        expired_days = (
+            AccessLog.objects.filter(day__lt=cutoff).values_list("day", flat=True).distinct().order_by("day")
+        )
+        for day in list(expired_days):
+            # Lotes pequenos para não travar a tabela enquanto os workers gravam
+            while True:
+                ids = list(AccessLog.objects.filter(day=day).values_list("pk", flat=True)[:options["batch_size"]])
+                if not ids:
+                    break
+                total += AccessLog.objects.filter(pk__in=ids).delete()[0]
+            self.stdout.write(f"{day}: removido")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} log(s) de acesso removido(s)."))
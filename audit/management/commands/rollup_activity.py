@@ -0,0 +1,63 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from audit.models import AuditLog, AccessLog
+from audit.rollups import aggregate, hour_bucket, day_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os resumos de atividade (ActivityRollup) a partir dos logs. "
+        "Idempotente: as horas do período são refeitas do zero. "
+        "A hora corrente, ainda em uso pela soma incremental, fica de fora (ver --include-current-hour). "
+        "Atenção: horas cujos logs de acesso já foram removidos (prune_access_logs) perdem essas chamadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=48, help="Horas recalculadas até agora (padrão: 48)")
+        parser.add_argument("--since", default=None, help="Data inicial (AAAA-MM-DD)")
+        parser.add_argument("--all", action="store_true", help="Backfill: recalcula desde o log mais antigo")
+        parser.add_argument(
+            "--include-current-hour",
+            action="store_true",
+            help=(
+                "Recalcula também a hora corrente. Sujeito a corrida com os workers gravando logs: "
+                "incrementos no meio do recálculo podem se perder ou contar duas vezes"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        end = hour_bucket(timezone.now())
+        if options["include_current_hour"]:
+            end += timedelta(hours=1)
+        if options["all"]:
+            oldest = [
+                value for value in (
+                    AuditLog.objects.aggregate(oldest=Min("created_at"))["oldest"],
+                    AccessLog.objects.aggregate(oldest=Min("created_at"))["oldest"],
+                )
+                if value
+            ]
+            if not oldest:
+                self.stdout.write("Nenhum log encontrado.")
+                return
+            start = hour_bucket(min(oldest))
+        elif options["since"]:
+            since = parse_date(options["since"])
+            if since is None:
+                raise CommandError("--since deve estar no formato AAAA-MM-DD")
+            start = day_start(since)
+        else:
+            start = end - timedelta(hours=options["hours"])
+
+        # Um dia por vez: transações curtas e consultas limitadas à partição do dia
+        total = 0
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(day_start(chunk_start.date()) + timedelta(days=1), end)
+            total += aggregate(chunk_start, chunk_end, include_current_hour=options["include_current_hour"])
+            chunk_start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f"{total} resumo(s) de atividade gravado(s) desde {start:%Y-%m-%d %H:%M} UTC."))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0002_rename_audit_audit_organiz_c1c99d_idx_audit_audit_padaria_8a3705_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Criado em'),
+        ),
+    ]
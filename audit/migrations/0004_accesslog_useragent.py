@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0003_auditlog_created_at_default'),
+        ('organizations', '0004_quotaplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True, verbose_name='Hash')),
+                ('value', models.TextField(verbose_name='User Agent')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'User Agent',
+                'verbose_name_plural': 'User Agents',
+            },
+        ),
+        migrations.CreateModel(
+            name='AccessLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criado em')),
+                ('day', models.DateField(verbose_name='Dia (UTC)')),
+                ('endpoint', models.PositiveSmallIntegerField(choices=[(1, 'get_agent_config'), (2, 'get_agent_config_batch'), (3, 'get_agent_changes'), (4, 'agent_stream'), (5, 'get_agent_knowledge'), (6, 'list_knowledge_chunks'), (7, 'get_knowledge_chunk'), (8, 'search_knowledge'), (9, 'get_agent_context'), (100, 'webhook_received')], verbose_name='Endpoint')),
+                ('agent_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID do Agente')),
+                ('ref', models.CharField(blank=True, help_text='Slug do agente ou sessão do webhook', max_length=100, verbose_name='Referência')),
+                ('extra', models.JSONField(blank=True, null=True, verbose_name='Extra')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP')),
+                ('api_key', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='access_logs', to='organizations.apikey', verbose_name='API Key')),
+                ('padaria', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='access_logs', to='organizations.padaria', verbose_name='Padaria')),
+                ('user_agent', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='audit.useragent', verbose_name='User Agent')),
+            ],
+            options={
+                'verbose_name': 'Log de Acesso',
+                'verbose_name_plural': 'Logs de Acesso',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['day'], name='audit_acces_day_db4ba4_idx'), models.Index(fields=['padaria', '-created_at'], name='audit_acces_padaria_70f59c_idx')],
+            },
+        ),
+    ]
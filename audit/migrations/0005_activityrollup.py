@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0004_accesslog_useragent'),
+        ('organizations', '0004_quotaplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Início da hora (UTC)', verbose_name='Hora')),
+                ('action', models.CharField(max_length=100, verbose_name='Ação')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('padaria', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='activity_rollups', to='organizations.padaria', verbose_name='Padaria')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Atividade',
+                'verbose_name_plural': 'Resumos de Atividade',
+                'indexes': [models.Index(fields=['bucket'], name='audit_activ_bucket_eaead8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('padaria', 'bucket', 'action'), name='unique_activity_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0005_activityrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accesslog',
+            name='endpoint',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'get_agent_config'), (2, 'get_agent_config_batch'), (3, 'get_agent_changes'), (4, 'agent_stream'), (5, 'get_agent_knowledge'), (6, 'list_knowledge_chunks'), (7, 'get_knowledge_chunk'), (8, 'search_knowledge'), (9, 'get_agent_context'), (10, 'get_session_events'), (100, 'webhook_received')], verbose_name='Endpoint'),
+        ),
+    ]
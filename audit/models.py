@@ -1,5 +1,8 @@
+import hashlib
+from datetime import timezone as dt_timezone
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from organizations.models import Padaria
 
 
@@ -54,7 +57,8 @@ class AuditLog(models.Model):
         blank=True,
         verbose_name="User Agent"
     )
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em", db_index=True)
+    # Preenchido no momento do evento (a gravação pode ser adiada pelo writer)
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Criado em", db_index=True)
 
     class Meta:
         verbose_name = "Log de Auditoria"
@@ -72,8 +76,14 @@ class AuditLog(models.Model):
 
     @classmethod
     def log(cls, action, entity, padaria=None, actor=None, entity_id=None, diff=None, ip=None, user_agent=None):
-        """Helper para criar log de forma simplificada."""
-        return cls.objects.create(
+        """
+        Helper para criar log de forma simplificada.
+        A gravação é feita em lote pelo audit.writer (imediata se AUDIT_ASYNC
+        estiver desligado); o log retornado pode ainda não ter pk.
+        """
+        from .writer import audit_writer
+        
+        entry = cls(
             padaria=padaria,
             actor=actor,
             action=action,
@@ -83,3 +93,223 @@ class AuditLog(models.Model):
             ip_address=ip,
             user_agent=user_agent or ""
         )
+        audit_writer.write(entry)
+        return entry
+
+
+# Endpoints registrados no AccessLog (código pequeno no lugar do nome)
+ENDPOINT_CHOICES = [
+    (1, "get_agent_config"),
+    (2, "get_agent_config_batch"),
+    (3, "get_agent_changes"),
+    (4, "agent_stream"),
+    (5, "get_agent_knowledge"),
+    (6, "list_knowledge_chunks"),
+    (7, "get_knowledge_chunk"),
+    (8, "search_knowledge"),
+    (9, "get_agent_context"),
+    (10, "get_session_events"),
+    (100, "webhook_received"),
+]
+ENDPOINT_CODES = {name: code for code, name in ENDPOINT_CHOICES}
+WEBHOOK_ENDPOINTS = {ENDPOINT_CODES["webhook_received"]}
+
+# Cache do processo: user agent -> id em UserAgent
+_user_agent_ids = {}
+USER_AGENT_CACHE_SIZE = 1024
+
+
+class UserAgent(models.Model):
+    """
+    User agents distintos vistos nos acessos; o AccessLog guarda só o id.
+    """
+    digest = models.CharField(max_length=40, unique=True, verbose_name="Hash")
+    value = models.TextField(verbose_name="User Agent")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "User Agent"
+        verbose_name_plural = "User Agents"
+
+    def __str__(self):
+        return self.value[:80]
+
+    @staticmethod
+    def clear_cache():
+        _user_agent_ids.clear()
+
+    @staticmethod
+    def digest_for(value):
+        return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def resolve_ids(cls, values):
+        """Retorna {user agent: id}, criando os que ainda não existem."""
+        ids = {value: _user_agent_ids[value] for value in values if value in _user_agent_ids}
+        missing = {cls.digest_for(value): value for value in values if value not in ids}
+        if missing:
+            found = dict(cls.objects.filter(digest__in=missing).values_list("digest", "id"))
+            new = [cls(digest=digest, value=value) for digest, value in missing.items() if digest not in found]
+            if new:
+                # Outro worker pode ter criado o mesmo user agent: ignorar e reler
+                cls.objects.bulk_create(new, ignore_conflicts=True)
+                found.update(cls.objects.filter(digest__in=[ua.digest for ua in new]).values_list("digest", "id"))
+            if len(_user_agent_ids) + len(found) > USER_AGENT_CACHE_SIZE:
+                _user_agent_ids.clear()
+            for digest, pk in found.items():
+                ids[missing[digest]] = _user_agent_ids[missing[digest]] = pk
+        return ids
+
+
+class AccessLog(models.Model):
+    """
+    Log compacto das chamadas de máquina (API do n8n e webhooks), separado do
+    AuditLog, que fica com as ações humanas. Só acrescenta linhas: endpoint e
+    chaves são inteiros, o user agent vai para a tabela UserAgent e a coluna
+    `day` particiona as linhas por dia (consultas e retenção, ver
+    prune_access_logs).
+
+    As propriedades action/entity/entity_id/actor/diff imitam o AuditLog para
+    os templates que listam os dois tipos juntos (audit.queries).
+    """
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Criado em")
+    day = models.DateField(verbose_name="Dia (UTC)")
+    endpoint = models.PositiveSmallIntegerField(choices=ENDPOINT_CHOICES, verbose_name="Endpoint")
+    # Sem FK no banco: inserção sem checagem e exclusões que não varrem o log
+    padaria = models.ForeignKey(
+        Padaria,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="access_logs",
+        verbose_name="Padaria"
+    )
+    api_key = models.ForeignKey(
+        "organizations.ApiKey",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="access_logs",
+        verbose_name="API Key"
+    )
+    agent_id = models.PositiveIntegerField(null=True, blank=True, verbose_name="ID do Agente")
+    ref = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Referência",
+        help_text="Slug do agente ou sessão do webhook"
+    )
+    extra = models.JSONField(null=True, blank=True, verbose_name="Extra")
+    ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP")
+    user_agent = models.ForeignKey(
+        UserAgent,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="User Agent"
+    )
+
+    class Meta:
+        verbose_name = "Log de Acesso"
+        verbose_name_plural = "Logs de Acesso"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["day"]),
+            models.Index(fields=["padaria", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_endpoint_display()} - {self.ref} ({self.created_at})"
+
+    @property
+    def action(self):
+        return "webhook_received" if self.endpoint in WEBHOOK_ENDPOINTS else "api_call"
+
+    @property
+    def entity(self):
+        return "n8n_event" if self.endpoint in WEBHOOK_ENDPOINTS else "Agent"
+
+    @property
+    def entity_id(self):
+        return self.ref or (str(self.agent_id) if self.agent_id else "")
+
+    @property
+    def actor(self):
+        return None
+
+    @property
+    def diff(self):
+        return {"endpoint": self.get_endpoint_display(), **(self.extra or {})}
+
+    @classmethod
+    def prepare_batch(cls, entries):
+        """Preenche day e user_agent dos logs antes do bulk_create."""
+        values = {entry.user_agent_string for entry in entries if getattr(entry, "user_agent_string", "")}
+        ids = UserAgent.resolve_ids(values) if values else {}
+        for entry in entries:
+            entry.day = entry.created_at.astimezone(dt_timezone.utc).date()
+            value = getattr(entry, "user_agent_string", "")
+            if value:
+                entry.user_agent_id = ids[value]
+
+    @classmethod
+    def build(cls, endpoint, api_key=None, padaria=None, agent_id=None, ref="", extra=None, ip=None, user_agent=None):
+        """Monta (sem gravar) um log de acesso; endpoint pelo nome (ver ENDPOINT_CHOICES)."""
+        entry = cls(
+            endpoint=ENDPOINT_CODES[endpoint],
+            api_key_id=api_key.pk if api_key else None,
+            padaria_id=padaria.pk if padaria else (api_key.padaria_id if api_key else None),
+            agent_id=agent_id,
+            ref=str(ref or "")[:100],
+            extra=extra or None,
+            ip_address=ip,
+        )
+        entry.user_agent_string = user_agent or ""
+        return entry
+
+    @classmethod
+    def log(cls, endpoint, api_key=None, padaria=None, agent_id=None, ref="", extra=None, ip=None, user_agent=None):
+        """
+        Registra um acesso (endpoint pelo nome, ver ENDPOINT_CHOICES).
+        Gravado em lote pelo audit.writer, como o AuditLog.
+        """
+        from .writer import audit_writer
+
+        entry = cls.build(endpoint, api_key, padaria, agent_id, ref, extra, ip, user_agent)
+        audit_writer.write(entry)
+        return entry
+
+
+class ActivityRollup(models.Model):
+    """
+    Total de logs (AuditLog + AccessLog) por padaria, hora (UTC) e ação, lido
+    pelos dashboards. Mantido em lote pelo audit.writer e recalculado pelo
+    comando rollup_activity (ver audit.rollups).
+    """
+    padaria = models.ForeignKey(
+        Padaria,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="activity_rollups",
+        verbose_name="Padaria"
+    )
+    bucket = models.DateTimeField(verbose_name="Hora", help_text="Início da hora (UTC)")
+    action = models.CharField(max_length=100, verbose_name="Ação")
+    count = models.PositiveIntegerField(default=0, verbose_name="Total")
+
+    class Meta:
+        verbose_name = "Resumo de Atividade"
+        verbose_name_plural = "Resumos de Atividade"
+        constraints = [
+            models.UniqueConstraint(fields=["padaria", "bucket", "action"], name="unique_activity_rollup"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket"]),
+        ]
+
+    def __str__(self):
+        return f"{self.padaria_id} - {self.action} - {self.bucket}: {self.count}"
@@ -0,0 +1,89 @@
+"""
+Consultas sobre os dois logs: AuditLog (ações humanas) e AccessLog (chamadas
+da API do n8n e webhooks).
+
+Os filtros (**filters) usam campos comuns às duas tabelas, como padaria,
+padaria__owner e created_at; filtros por created_at também restringem a
+coluna `day` do AccessLog, para a consulta ler só as partições do período.
+"""
+from datetime import timezone as dt_timezone
+from django.db.models import Count
+from core.pagination import KeysetPage, InvalidCursor, decode_cursor, encode_cursor, keyset_filter, to_datetime, to_int
+from .models import AuditLog, AccessLog, WEBHOOK_ENDPOINTS
+
+# Ordem das tabelas no cursor de activity_page
+ACTIVITY_MODELS = (AuditLog, AccessLog)
+
+
+def access_filters(filters):
+    filters = dict(filters)
+    if "created_at__gte" in filters:
+        filters["day__gte"] = filters["created_at__gte"].astimezone(dt_timezone.utc).date()
+    if "created_at__lt" in filters:
+        filters["day__lte"] = filters["created_at__lt"].astimezone(dt_timezone.utc).date()
+    return filters
+
+
+def recent_activity(limit=100, **filters):
+    """Logs mais recentes das duas tabelas, intercalados por created_at."""
+    return activity_page(limit=limit, **filters).object_list
+
+
+def activity_page(cursor=None, limit=100, **filters):
+    """
+    Página (core.pagination.KeysetPage) dos logs das duas tabelas, do mais
+    recente ao mais antigo, por keyset em (created_at, tabela, id).
+    Só avança: next_cursor leva à página seguinte (mais antiga).
+    """
+    values = None
+    if cursor:
+        try:
+            values = decode_cursor(cursor, 3, (to_datetime, to_int, to_int))
+        except InvalidCursor:
+            values = None
+
+    logs = []
+    for source, model in enumerate(ACTIVITY_MODELS):
+        queryset = model.objects.filter(**(access_filters(filters) if model is AccessLog else filters))
+        queryset = queryset.select_related(*(("padaria", "actor") if model is AuditLog else ("padaria",)))
+        if values:
+            created_at, cursor_source, cursor_id = values
+            # Mesma created_at: a tabela de índice menor vem depois na ordem
+            if source < cursor_source:
+                queryset = queryset.filter(created_at__lte=created_at)
+            elif source > cursor_source:
+                queryset = queryset.filter(created_at__lt=created_at)
+            else:
+                queryset = queryset.filter(keyset_filter(("-created_at", "-id"), [created_at, cursor_id]))
+        logs.extend((log.created_at, source, log.pk, log) for log in queryset.order_by("-created_at", "-id")[:limit + 1])
+
+    logs.sort(key=lambda row: row[:3], reverse=True)
+    next_cursor = None
+    if len(logs) > limit:
+        created_at, source, pk, _ = logs[limit - 1]
+        next_cursor = encode_cursor([created_at, source, pk])
+    return KeysetPage([row[3] for row in logs[:limit]], next_cursor=next_cursor)
+
+
+def count_activity(**filters):
+    """Total de logs (das duas tabelas) que atendem aos filtros."""
+    return AuditLog.objects.filter(**filters).count() + count_access(**filters)
+
+
+def count_access(**filters):
+    """Total de chamadas registradas no AccessLog."""
+    return AccessLog.objects.filter(**access_filters(filters)).count()
+
+
+def action_counts(limit=5, **filters):
+    """Ações mais frequentes: [{"action": ..., "total": ...}], das duas tabelas."""
+    totals = {}
+    rows = AuditLog.objects.filter(**filters).values("action").annotate(total=Count("id")).order_by()
+    for row in rows:
+        totals[row["action"]] = totals.get(row["action"], 0) + row["total"]
+    rows = AccessLog.objects.filter(**access_filters(filters)).values("endpoint").annotate(total=Count("id")).order_by()
+    for row in rows:
+        action = "webhook_received" if row["endpoint"] in WEBHOOK_ENDPOINTS else "api_call"
+        totals[action] = totals.get(action, 0) + row["total"]
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"action": action, "total": total} for action, total in ranked]
@@ -0,0 +1,186 @@
+"""
+Retenção dos logs de auditoria: arquivamento e remoção por política.
+
+Políticas (AUDIT_RETENTION_POLICIES): {ação: dias}. "*" vale para as ações
+sem política própria; dias <= 0 (ou ação ausente sem "*") = manter para
+sempre. Ex.: {"api_call": 30, "delete": 0, "*": 730}.
+
+Para cada política, as linhas vencidas são lidas em lotes pequenos na ordem
+(created_at, id) — pelos índices (action, created_at) / created_at —,
+gravadas em AUDIT_ARCHIVE_DIR/AAAA/MM/DD.jsonl.gz (um membro gzip por lote,
+particionado pelo dia UTC do log) e só então removidas, um lote por
+transação curta.
+
+Retomada: depois de gravar um lote no arquivo, os ids arquivados e ainda não
+removidos de cada política vão para AUDIT_ARCHIVE_DIR/checkpoint.json e saem
+de lá assim que o lote é removido. Se o processo parar entre o arquivamento
+e a remoção, a próxima execução remove essas linhas sem arquivá-las de novo;
+qualquer outra linha vencida (política alterada, logs reimportados) é
+arquivada antes de sair. import_archive traz um arquivo de volta (ids
+preservados; linhas já existentes são ignoradas).
+"""
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog
+
+ARCHIVE_FIELDS = (
+    "id", "padaria_id", "actor_id", "action", "entity", "entity_id", "diff", "ip_address", "user_agent", "created_at",
+)
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def get_policies():
+    return dict(getattr(settings, "AUDIT_RETENTION_POLICIES", {}))
+
+
+def get_archive_dir():
+    return str(getattr(settings, "AUDIT_ARCHIVE_DIR", "audit_archive"))
+
+
+class RetentionEngine:
+    """Aplica as políticas de retenção (ver o docstring do módulo)."""
+
+    def __init__(self, policies=None, archive_dir=None, batch_size=500, pause=0, progress=None):
+        self.policies = get_policies() if policies is None else dict(policies)
+        self.archive_dir = archive_dir or get_archive_dir()
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress or (lambda message: None)
+        self._checkpoint = None
+
+    def querysets(self, now=None):
+        """[(nome da política, queryset das linhas vencidas)]."""
+        now = now or timezone.now()
+        explicit = [action for action in self.policies if action != "*"]
+        result = []
+        for action, days in self.policies.items():
+            if not days or days <= 0:
+                continue
+            queryset = AuditLog.objects.filter(created_at__lt=now - timedelta(days=days))
+            if action == "*":
+                queryset = queryset.exclude(action__in=explicit)
+            else:
+                queryset = queryset.filter(action=action)
+            result.append((action, queryset))
+        return result
+
+    def count_expired(self, now=None):
+        return {name: queryset.count() for name, queryset in self.querysets(now)}
+
+    def run(self, now=None):
+        """Arquiva e remove as linhas vencidas. Retorna {política: removidas}."""
+        totals = {}
+        for name, queryset in self.querysets(now):
+            totals[name] = self._apply(name, queryset)
+        return totals
+
+    def _apply(self, name, queryset):
+        removed = 0
+        # Ids já gravados no arquivo e não removidos (execução interrompida)
+        archived = self._load_checkpoint().get(name, set())
+        while True:
+            rows = list(queryset.order_by("created_at", "id").values(*ARCHIVE_FIELDS)[:self.batch_size])
+            if not rows:
+                break
+            ids = {row["id"] for row in rows}
+            pending = [row for row in rows if row["id"] not in archived]
+            if pending:
+                self._archive(pending)
+                archived = archived | {row["id"] for row in pending}
+                self._save_checkpoint(name, archived)
+            removed += AuditLog.objects.filter(pk__in=ids).delete()[0]
+            archived = archived - ids
+            self._save_checkpoint(name, archived)
+            self.progress(f"{name}: {removed} log(s) arquivado(s) e removido(s)")
+            if self.pause:
+                # Libera o banco para os workers entre os lotes
+                time.sleep(self.pause)
+        # Sobras: linhas arquivadas que já não existem (removidas por fora)
+        self._save_checkpoint(name, set())
+        return removed
+
+    def _archive(self, rows):
+        by_day = defaultdict(list)
+        for row in rows:
+            by_day[row["created_at"].astimezone(dt_timezone.utc).date()].append(row)
+        for day, day_rows in by_day.items():
+            directory = os.path.join(self.archive_dir, f"{day:%Y}", f"{day:%m}")
+            os.makedirs(directory, exist_ok=True)
+            data = "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in day_rows).encode("utf-8")
+            # Cada lote é um novo membro gzip no arquivo do dia
+            with open(os.path.join(directory, f"{day:%d}.jsonl.gz"), "ab") as archive_file:
+                archive_file.write(gzip.compress(data))
+                archive_file.flush()
+                os.fsync(archive_file.fileno())
+
+    def _checkpoint_path(self):
+        return os.path.join(self.archive_dir, CHECKPOINT_FILE)
+
+    def _load_checkpoint(self):
+        if self._checkpoint is None:
+            try:
+                with open(self._checkpoint_path(), encoding="utf-8") as checkpoint_file:
+                    self._checkpoint = {name: set(ids) for name, ids in json.load(checkpoint_file).items()}
+            except FileNotFoundError:
+                self._checkpoint = {}
+        return self._checkpoint
+
+    def _save_checkpoint(self, name, ids):
+        checkpoint = self._load_checkpoint()
+        if not ids and name not in checkpoint:
+            return
+        if ids:
+            checkpoint[name] = set(ids)
+        else:
+            del checkpoint[name]
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temporary = f"{self._checkpoint_path()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as checkpoint_file:
+            json.dump({key: sorted(value) for key, value in checkpoint.items()}, checkpoint_file)
+        os.replace(temporary, self._checkpoint_path())
+
+
+def compact(full=False):
+    """
+    Atualiza as estatísticas da tabela depois de uma remoção grande
+    (PostgreSQL: VACUUM ANALYZE; SQLite: ANALYZE, e VACUUM com full=True,
+    que reescreve o banco inteiro e bloqueia as escritas enquanto roda).
+    """
+    table = connection.ops.quote_name(AuditLog._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"VACUUM {'FULL ' if full else ''}ANALYZE {table}")
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"ANALYZE {table}")
+            if full:
+                cursor.execute("VACUUM")
+
+
+def import_archive(path, batch_size=1000):
+    """Importa um arquivo .jsonl.gz do arquivamento. Retorna o número de linhas lidas."""
+    total = 0
+    batch = []
+    with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+        for line in archive_file:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            data["created_at"] = parse_datetime(data["created_at"])
+            batch.append(AuditLog(**data))
+            if len(batch) >= batch_size:
+                AuditLog.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+                batch = []
+    if batch:
+        AuditLog.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+    return total
@@ -0,0 +1,142 @@
+"""
+Resumos de atividade (ActivityRollup): total de logs por padaria, hora UTC
+e ação, somando AuditLog e AccessLog.
+
+Manutenção:
+    - incremental: o audit.writer soma cada lote gravado (um UPDATE por
+      padaria/hora/ação do lote) com ACTIVITY_ROLLUP_LIVE ligado;
+    - recálculo: `python manage.py rollup_activity` refaz as horas de um
+      período a partir dos logs (idempotente; corrige falhas do incremental).
+      Com --all serve de backfill dos dados existentes. A hora corrente fica
+      de fora: o writer ainda soma nela, e os incrementos feitos entre a
+      contagem e a troca das linhas se perderiam ou seriam contados duas vezes.
+
+Os logs sem padaria não entram nos resumos (os dashboards filtram por padaria).
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from .models import AuditLog, AccessLog, ActivityRollup, WEBHOOK_ENDPOINTS
+
+logger = logging.getLogger(__name__)
+
+
+def hour_bucket(moment):
+    """Início da hora (UTC) do momento."""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(day):
+    """Meia-noite UTC da data."""
+    return datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+
+
+def record_rollups(entries):
+    """Soma aos resumos os logs de um lote recém-gravado."""
+    if not getattr(settings, "ACTIVITY_ROLLUP_LIVE", True):
+        return
+    counts = Counter(
+        (entry.padaria_id, hour_bucket(entry.created_at), entry.action)
+        for entry in entries
+        if entry.padaria_id
+    )
+    try:
+        for (padaria_id, bucket, action), count in counts.items():
+            increment(padaria_id, bucket, action, count)
+    except Exception as e:
+        # Os logs já foram gravados: o próximo rollup_activity corrige o resumo
+        logger.error(f"Erro ao atualizar resumos de atividade: {str(e)}")
+
+
+def increment(padaria_id, bucket, action, count):
+    rows = ActivityRollup.objects.filter(padaria_id=padaria_id, bucket=bucket, action=action)
+    if rows.update(count=F("count") + count):
+        return
+    try:
+        with transaction.atomic():
+            ActivityRollup.objects.create(padaria_id=padaria_id, bucket=bucket, action=action, count=count)
+    except IntegrityError:
+        # Outro worker criou a linha ao mesmo tempo
+        rows.update(count=F("count") + count)
+
+
+def aggregate(start, end, include_current_hour=False):
+    """
+    Recalcula os resumos das horas em [start, end) a partir dos logs e
+    substitui os existentes. Retorna o número de linhas de resumo gravadas.
+    `end` é limitado ao início da hora corrente, salvo com
+    include_current_hour (sujeito à corrida com o incremental, ver acima).
+    """
+    if not include_current_hour:
+        end = min(end, hour_bucket(timezone.now()))
+    if start >= end:
+        return 0
+    counts = Counter()
+    rows = (
+        AuditLog.objects.filter(padaria__isnull=False, created_at__gte=start, created_at__lt=end)
+        .annotate(hour=TruncHour("created_at", tzinfo=dt_timezone.utc))
+        .values("padaria_id", "hour", "action").annotate(total=Count("id")).order_by()
+    )
+    for row in rows:
+        counts[(row["padaria_id"], row["hour"], row["action"])] += row["total"]
+    rows = (
+        AccessLog.objects.filter(
+            padaria__isnull=False, created_at__gte=start, created_at__lt=end,
+            day__gte=start.date(), day__lte=end.date(),
+        )
+        .annotate(hour=TruncHour("created_at", tzinfo=dt_timezone.utc))
+        .values("padaria_id", "hour", "endpoint").annotate(total=Count("id")).order_by()
+    )
+    for row in rows:
+        action = "webhook_received" if row["endpoint"] in WEBHOOK_ENDPOINTS else "api_call"
+        counts[(row["padaria_id"], row["hour"], action)] += row["total"]
+
+    with transaction.atomic():
+        ActivityRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        ActivityRollup.objects.bulk_create(
+            [
+                ActivityRollup(padaria_id=padaria_id, bucket=bucket, action=action, count=count)
+                for (padaria_id, bucket, action), count in counts.items()
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def activity_by_day(start_day, **filters):
+    """
+    Totais dos resumos por dia (UTC) e ação a partir de start_day, em uma
+    consulta. Retorna {(date, action): total}.
+    """
+    rows = (
+        ActivityRollup.objects.filter(bucket__gte=day_start(start_day), **filters)
+        .annotate(day=TruncDate("bucket", tzinfo=dt_timezone.utc))
+        .values("day", "action").annotate(total=Sum("count")).order_by()
+    )
+    return {(row["day"], row["action"]): row["total"] for row in rows}
+
+
+def summarize(totals, today, chart_days, top=5):
+    """
+    Estatísticas dos dashboards a partir de activity_by_day: total do
+    período, total dos últimos `chart_days` dias (contando hoje), chamadas de
+    API, série diária e ações mais frequentes.
+    """
+    per_day = Counter()
+    per_action = Counter()
+    for (day, action), total in totals.items():
+        per_day[day] += total
+        per_action[action] += total
+    dates = [today - timedelta(days=offset) for offset in range(chart_days - 1, -1, -1)]
+    return {
+        "total": sum(per_day.values()),
+        "recent": sum(per_day[day] for day in dates),
+        "api_calls": per_action["api_call"],
+        "daily": [(day, per_day[day]) for day in dates],
+        "top_actions": [{"action": action, "total": total} for action, total in per_action.most_common(top)],
+    }
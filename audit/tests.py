@@ -0,0 +1,312 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from core.pagination import encode_cursor
+from organizations.models import Organization, ApiKey
+from .models import AuditLog, AccessLog, UserAgent, ActivityRollup
+from .queries import recent_activity, activity_page, count_activity, action_counts
+from .retention import RetentionEngine
+from .rollups import activity_by_day, summarize
+from .writer import AuditWriter
+
+
+class AuditWriterTest(TransactionTestCase):
+    """Testes para a gravação assíncrona dos logs de auditoria."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+
+    @override_settings(AUDIT_ASYNC=True, AUDIT_FLUSH_INTERVAL_MS=50)
+    def test_async_writes_are_flushed_on_shutdown(self):
+        """Testa que os logs enfileirados são gravados em lote até o shutdown."""
+        writer = AuditWriter()
+        for index in range(5):
+            writer.write(AuditLog(padaria=self.padaria, action="api_call", entity="Agent", entity_id=str(index)))
+        writer.shutdown()
+        self.assertEqual(AuditLog.objects.filter(action="api_call").count(), 5)
+
+
+class AuditSpillTest(TestCase):
+    """Testes para o spill em JSONL e sua importação."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+
+    def test_log_is_written_synchronously(self):
+        """Testa que AuditLog.log grava na hora com AUDIT_ASYNC desligado."""
+        AuditLog.log(action="create", entity="Agent", padaria=self.padaria, diff={"name": "Ana"})
+        self.assertTrue(AuditLog.objects.filter(action="create", diff__name="Ana").exists())
+
+    def test_spill_and_load(self):
+        """Testa o spill em arquivo e a importação pelo comando."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spill.jsonl")
+            with override_settings(AUDIT_SPILL_PATH=path):
+                writer = AuditWriter()
+                writer.spill([
+                    AuditLog(padaria=self.padaria, action="webhook_received", entity="n8n_event", diff={"a": 1}),
+                    AuditLog(action="api_call", entity="Agent", ip_address="10.0.0.1"),
+                ])
+                self.assertEqual(AuditLog.objects.count(), 0)
+                call_command("load_audit_spill", stdout=StringIO())
+            self.assertFalse(os.path.exists(path))
+        log = AuditLog.objects.get(action="webhook_received")
+        self.assertEqual(log.padaria, self.padaria)
+        self.assertEqual(log.diff, {"a": 1})
+        self.assertEqual(AuditLog.objects.get(action="api_call").ip_address, "10.0.0.1")
+
+    @override_settings(AUDIT_ASYNC=True)
+    def test_failed_batch_is_not_partially_saved(self):
+        """Testa que, se uma tabela do lote falha, nada é gravado e o lote vai inteiro para o spill."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spill.jsonl")
+            with override_settings(AUDIT_SPILL_PATH=path), \
+                    mock.patch.object(AccessLog.objects, "bulk_create", side_effect=RuntimeError("falhou")):
+                writer = AuditWriter()
+                writer.write_batch([
+                    AuditLog(padaria=self.padaria, action="create", entity="Agent"),
+                    AccessLog(endpoint=1, padaria=self.padaria, ref="ana"),
+                ])
+                self.assertEqual(AuditLog.objects.count(), 0)
+                self.assertEqual(writer.spilled, 2)
+
+    def test_spill_access_logs(self):
+        """Testa spill e importação de logs de acesso (com o user agent)."""
+        UserAgent.clear_cache()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spill.jsonl")
+            with override_settings(AUDIT_SPILL_PATH=path):
+                entry = AccessLog(endpoint=1, padaria=self.padaria, ref="ana")
+                entry.user_agent_string = "n8n/1.0"
+                AuditWriter().spill([entry])
+                call_command("load_audit_spill", stdout=StringIO())
+        log = AccessLog.objects.get()
+        self.assertEqual(log.ref, "ana")
+        self.assertEqual(log.user_agent.value, "n8n/1.0")
+
+
+class AccessLogTest(TestCase):
+    """Testes para o log de acesso compacto e as consultas das duas tabelas."""
+
+    def setUp(self):
+        UserAgent.clear_cache()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        self.api_key = ApiKey.objects.create(padaria=self.padaria)
+
+    def test_user_agents_are_deduplicated(self):
+        """Testa que o user agent é gravado uma vez e referenciado por id."""
+        for _ in range(3):
+            AccessLog.log("get_agent_config", api_key=self.api_key, ref="ana", user_agent="n8n/1.0")
+        AccessLog.log("webhook_received", api_key=self.api_key, user_agent="curl/8.0")
+        self.assertEqual(UserAgent.objects.count(), 2)
+        log = AccessLog.objects.filter(endpoint=1).first()
+        self.assertEqual(log.padaria_id, self.padaria.pk)
+        self.assertEqual(log.day, log.created_at.date())
+        self.assertEqual(log.action, "api_call")
+        self.assertEqual(log.diff, {"endpoint": "get_agent_config"})
+
+    def test_queries_cover_both_tables(self):
+        """Testa os helpers que consultam AuditLog e AccessLog juntos."""
+        AuditLog.log(action="create", entity="Agent", padaria=self.padaria)
+        AccessLog.log("get_agent_config", api_key=self.api_key)
+        AccessLog.log("search_knowledge", api_key=self.api_key)
+        since = timezone.now() - timedelta(days=1)
+
+        logs = recent_activity(limit=2, padaria__owner=self.user)
+        self.assertEqual(len(logs), 2)
+        self.assertEqual(count_activity(padaria=self.padaria, created_at__gte=since), 3)
+        self.assertEqual(
+            action_counts(padaria=self.padaria),
+            [{"action": "api_call", "total": 2}, {"action": "create", "total": 1}],
+        )
+
+    def test_activity_pages_across_tables(self):
+        """Testa a paginação por cursor intercalando as duas tabelas."""
+        moment = timezone.now()
+        for index in range(3):
+            AuditLog.objects.create(action="create", entity="Agent", entity_id=str(index), padaria=self.padaria,
+                                    created_at=moment)
+            AccessLog.log("get_agent_config", api_key=self.api_key, ref=str(index))
+        seen = []
+        cursor = None
+        while True:
+            page = activity_page(cursor=cursor, limit=2, padaria=self.padaria)
+            seen.extend((log.action, log.entity_id) for log in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+        # Cursor adulterado: volta para a primeira página
+        tampered = encode_cursor([timezone.now().isoformat(), "x", 1])
+        self.assertEqual(len(activity_page(cursor=tampered, limit=2, padaria=self.padaria)), 2)
+
+    def test_prune_access_logs(self):
+        """Testa a remoção dos dias fora da retenção."""
+        old = AccessLog.log("get_agent_config", api_key=self.api_key)
+        AccessLog.objects.filter(pk=old.pk).update(day=timezone.now().date() - timedelta(days=40))
+        AccessLog.log("get_agent_config", api_key=self.api_key)
+        call_command("prune_access_logs", days=30, stdout=StringIO())
+        self.assertEqual(AccessLog.objects.count(), 1)
+        self.assertFalse(AccessLog.objects.filter(pk=old.pk).exists())
+
+
+class ActivityRollupTest(TestCase):
+    """Testes para os resumos de atividade dos dashboards."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        self.api_key = ApiKey.objects.create(padaria=self.padaria)
+
+    def test_rollups_are_incremental(self):
+        """Testa que cada log gravado soma ao resumo da hora."""
+        AuditLog.log(action="create", entity="Agent", padaria=self.padaria)
+        AccessLog.log("get_agent_config", api_key=self.api_key)
+        AccessLog.log("search_knowledge", api_key=self.api_key)
+        AuditLog.log(action="login", entity="User")  # sem padaria: fora dos resumos
+        totals = dict(ActivityRollup.objects.values_list("action", "count"))
+        self.assertEqual(totals, {"create": 1, "api_call": 2})
+
+    def test_rollup_command_is_idempotent(self):
+        """Testa o backfill e que recalcular não duplica os totais."""
+        with override_settings(ACTIVITY_ROLLUP_LIVE=False):
+            for _ in range(3):
+                AccessLog.log("get_agent_config", api_key=self.api_key)
+            AuditLog.log(action="update", entity="Agent", padaria=self.padaria)
+        self.assertFalse(ActivityRollup.objects.exists())
+
+        # Hora corrente fica de fora por padrão (o incremental ainda soma nela)
+        call_command("rollup_activity", all=True, stdout=StringIO())
+        self.assertFalse(ActivityRollup.objects.exists())
+        call_command("rollup_activity", all=True, include_current_hour=True, stdout=StringIO())
+        call_command("rollup_activity", include_current_hour=True, stdout=StringIO())
+        today = timezone.now().date()
+        with self.assertNumQueries(1):
+            stats = summarize(activity_by_day(today - timedelta(days=29), padaria=self.padaria), today, chart_days=7)
+        self.assertEqual(stats["total"], 4)
+        self.assertEqual(stats["api_calls"], 3)
+        self.assertEqual(stats["daily"][-1], (today, 4))
+        self.assertEqual(stats["top_actions"][0], {"action": "api_call", "total": 3})
+
+
+class AuditExportTest(TestCase):
+    """Testes para a exportação em streaming."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.other = User.objects.create_user(username="other", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        self.other_padaria = Organization.objects.create(name="Other Org", owner=self.other)
+        AuditLog.log(action="create", entity="Agent", padaria=self.padaria, diff={"name": "Ana"})
+        AuditLog.log(action="delete", entity="Agent", padaria=self.padaria)
+        AuditLog.log(action="create", entity="Agent", padaria=self.other_padaria)
+        self.client.login(username="testuser", password="12345")
+
+    def read(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_csv_export_is_scoped_to_owner(self):
+        """Testa o CSV em streaming só com as padarias do usuário, filtrado por ação."""
+        response = self.client.get("/audit/export/", {"action": "create"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(self.read(response).decode("utf-8").splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["padaria"], self.padaria.slug)
+        self.assertEqual(json.loads(rows[0]["diff"]), {"name": "Ana"})
+        response = self.client.get("/audit/export/", {"padaria": self.other_padaria.slug})
+        self.assertEqual(response.status_code, 404)
+
+    def test_gzip_jsonl_export(self):
+        """Testa NDJSON compactado com gzip."""
+        response = self.client.get("/audit/export/", {"format": "jsonl", "gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(self.read(response)).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["action"] for line in lines], ["create", "delete"])
+
+    def test_export_command(self):
+        """Testa o comando de exportação para arquivo."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.csv.gz")
+            call_command("export_audit_logs", output=path, gzip=True, padaria=[self.other_padaria.slug],
+                         stderr=StringIO())
+            with gzip.open(path, "rt", encoding="utf-8") as export_file:
+                rows = list(csv.DictReader(export_file))
+        self.assertEqual([row["padaria"] for row in rows], [self.other_padaria.slug])
+
+
+class RetentionTest(TestCase):
+    """Testes para a retenção com arquivamento."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        old = timezone.now() - timedelta(days=60)
+        for index in range(5):
+            AuditLog.objects.create(action="api_call", entity="Agent", entity_id=str(index), padaria=self.padaria,
+                                    created_at=old)
+        AuditLog.objects.create(action="delete", entity="Agent", padaria=self.padaria, created_at=old)
+        AuditLog.objects.create(action="update", entity="Agent", padaria=self.padaria, created_at=old)
+        AuditLog.objects.create(action="api_call", entity="Agent", padaria=self.padaria)
+
+    def test_policies_archive_then_delete(self):
+        """Testa políticas por ação, arquivo por dia e reimportação."""
+        with tempfile.TemporaryDirectory() as directory:
+            engine = RetentionEngine(
+                policies={"api_call": 30, "delete": 0, "*": 45}, archive_dir=directory, batch_size=2
+            )
+            self.assertEqual(engine.run(), {"api_call": 5, "*": 1})
+            self.assertEqual(sorted(AuditLog.objects.values_list("action", flat=True)), ["api_call", "delete"])
+
+            archives = [
+                os.path.join(root, name) for root, _, names in os.walk(directory)
+                for name in names if name.endswith(".jsonl.gz")
+            ]
+            self.assertEqual(len(archives), 1)
+            with gzip.open(archives[0], "rt", encoding="utf-8") as archive_file:
+                self.assertEqual(len(archive_file.readlines()), 6)
+
+            call_command("import_audit_archive", archives[0], stdout=StringIO())
+            call_command("import_audit_archive", archives[0], stdout=StringIO())
+            self.assertEqual(AuditLog.objects.count(), 8)
+
+    def test_resume_skips_archived_rows(self):
+        """Testa que linhas já arquivadas (checkpoint) não são arquivadas de novo."""
+        with tempfile.TemporaryDirectory() as directory:
+            engine = RetentionEngine(policies={"api_call": 30}, archive_dir=directory, batch_size=10)
+            ids = list(engine.querysets()[0][1].order_by("created_at", "id").values_list("id", flat=True))
+            engine._save_checkpoint("api_call", ids[:3])
+
+            RetentionEngine(policies={"api_call": 30}, archive_dir=directory).run()
+            archives = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names
+                        if name.endswith(".jsonl.gz")]
+            with gzip.open(archives[0], "rt", encoding="utf-8") as archive_file:
+                self.assertEqual(len(archive_file.readlines()), 2)
+            with open(os.path.join(directory, "checkpoint.json"), encoding="utf-8") as checkpoint_file:
+                self.assertEqual(json.load(checkpoint_file), {})
+        self.assertEqual(AuditLog.objects.filter(action="api_call").count(), 1)
+    
+    def test_policy_change_archives_older_rows(self):
+        """Testa que linhas que passam a vencer depois (política alterada) também são arquivadas."""
+        with tempfile.TemporaryDirectory() as directory:
+            RetentionEngine(policies={"delete": 0, "*": 45}, archive_dir=directory).run()
+            self.assertEqual(RetentionEngine(policies={"*": 45}, archive_dir=directory).run(), {"*": 1})
+            archives = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names
+                        if name.endswith(".jsonl.gz")]
+            with gzip.open(archives[0], "rt", encoding="utf-8") as archive_file:
+                actions = [json.loads(line)["action"] for line in archive_file]
+        self.assertEqual(sorted(actions), ["api_call"] * 5 + ["delete", "update"])
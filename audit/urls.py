@@ -5,4 +5,5 @@ app_name = "audit"
 
 urlpatterns = [
     path("", views.audit_log_list, name="list"),
+    path("export/", views.audit_log_export, name="export"),
 ]
@@ -1,14 +1,59 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from .models import AuditLog
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from organizations.models import Padaria
+from .export import EXPORT_FORMATS, export_queryset, iter_export, export_filename
+from .queries import activity_page
 
 
 @login_required
 def audit_log_list(request):
-    """Lista de logs de auditoria do usuario."""
-    logs = AuditLog.objects.filter(
-        padaria__owner=request.user
-    ).select_related('padaria', 'actor')[:100]  # Ultimos 100 logs
+    """Lista de logs de auditoria do usuario (acoes e chamadas de API), 100 por pagina."""
+    cursor = request.GET.get("cursor")
+    logs = activity_page(cursor=cursor, limit=100, padaria__owner=request.user)
     
-    return render(request, "audit/list.html", {"logs": logs})
+    return render(request, "audit/list.html", {"logs": logs, "cursor": cursor})
 
+
+@login_required
+def audit_log_export(request):
+    """
+    Exporta os logs em streaming (CSV ou NDJSON, gzip opcional).
+    Parametros: padaria (slug), action (repetivel), start/end (AAAA-MM-DD),
+    format (csv|jsonl), source (audit|access), gzip=1.
+    Usuarios comuns exportam apenas as padarias de que sao donos.
+    """
+    fmt = request.GET.get("format", "csv")
+    source = request.GET.get("source", "audit")
+    if fmt not in EXPORT_FORMATS or source not in ("audit", "access"):
+        return JsonResponse({"error": "Invalid format or source"}, status=400)
+    
+    dates = {}
+    for name in ("start", "end"):
+        value = request.GET.get(name)
+        dates[name] = parse_date(value) if value else None
+        if value and dates[name] is None:
+            return JsonResponse({"error": f"Invalid {name} date (use YYYY-MM-DD)"}, status=400)
+    
+    padarias = Padaria.objects.all() if request.user.is_superuser else Padaria.objects.filter(owner=request.user)
+    slug = request.GET.get("padaria")
+    if slug:
+        padarias = padarias.filter(slug=slug)
+        if not padarias.exists():
+            return JsonResponse({"error": "Padaria not found"}, status=404)
+    # Superusuario sem padaria: exporta tudo (inclusive logs sem padaria)
+    padaria_ids = None if request.user.is_superuser and not slug else list(padarias.values_list("id", flat=True))
+    
+    compress = request.GET.get("gzip") == "1"
+    queryset = export_queryset(
+        source=source,
+        padaria_ids=padaria_ids,
+        actions=request.GET.getlist("action"),
+        start=dates["start"],
+        end=dates["end"],
+    )
+    content_type = "application/gzip" if compress else EXPORT_FORMATS[fmt][0]
+    response = StreamingHttpResponse(iter_export(queryset, source, fmt, compress), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(source, fmt, compress, slug)}"'
+    return response
@@ -0,0 +1,203 @@
+"""
+Gravação assíncrona e em lote dos logs de auditoria.
+
+AuditLog.log e AccessLog.log montam a linha (com created_at do momento do
+evento) e a colocam em um buffer limitado do processo; uma thread em segundo
+plano grava o buffer com bulk_create a cada AUDIT_FLUSH_INTERVAL_MS ou
+AUDIT_FLUSH_BATCH linhas, o que vier primeiro. O request não espera o INSERT.
+
+Com AUDIT_ASYNC desligado (padrão em dev/testes) a gravação é imediata.
+
+Buffer cheio (AUDIT_OVERFLOW):
+    "block": espera até AUDIT_BLOCK_TIMEOUT segundos por espaço; depois
+        grava a linha de forma síncrona (nada se perde).
+    "drop": descarta a linha e registra um aviso.
+    "spill": grava a linha em AUDIT_SPILL_PATH (JSONL); importe depois com
+        `python manage.py load_audit_spill`.
+
+Cada lote é gravado numa transação (as duas tabelas e os resumos juntos): se
+o bulk_create falhar, nada fica gravado e o lote inteiro vai para o arquivo
+de spill, sem duplicar linhas na importação. Na saída do processo (atexit) o
+buffer é gravado; um worker morto com SIGKILL perde no máximo as linhas ainda
+no buffer (até um intervalo de flush).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Campos gravados no spill, por modelo (attnames; o "model" vai em cada linha)
+SPILL_FIELDS = {
+    "audit.auditlog": (
+        "padaria_id", "actor_id", "action", "entity", "entity_id", "diff", "ip_address", "user_agent", "created_at",
+    ),
+    "audit.accesslog": (
+        "padaria_id", "api_key_id", "endpoint", "agent_id", "ref", "extra", "ip_address", "user_agent_string",
+        "created_at",
+    ),
+}
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def save_entries(entries):
+    """
+    Grava logs ainda não salvos (AuditLog e/ou AccessLog) com bulk_create e
+    soma o lote aos resumos de atividade, tudo numa transação.
+    """
+    from .models import AccessLog
+    from .rollups import record_rollups
+
+    by_model = {}
+    for entry in entries:
+        by_model.setdefault(type(entry), []).append(entry)
+    if AccessLog in by_model:
+        # Fora da transação: os ids de UserAgent ficam no cache do processo
+        AccessLog.prepare_batch(by_model[AccessLog])
+    with transaction.atomic():
+        for model, rows in by_model.items():
+            model.objects.bulk_create(rows, batch_size=get_setting("AUDIT_FLUSH_BATCH", 500))
+        record_rollups(entries)
+
+
+class AuditWriter:
+    """Buffer limitado + thread de flush dos logs de auditoria."""
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._pid = None
+        self.dropped = 0
+        self.spilled = 0
+
+    def write(self, entry):
+        """Enfileira (ou grava, no modo síncrono) um AuditLog/AccessLog ainda não salvo."""
+        if not get_setting("AUDIT_ASYNC", False):
+            self.write_batch([entry])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._overflow(entry)
+
+    def write_many(self, entries):
+        """Como write, para vários logs; no modo síncrono, um único bulk_create."""
+        if not get_setting("AUDIT_ASYNC", False):
+            self.write_batch(entries)
+            return
+        for entry in entries:
+            self.write(entry)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processo novo (fork do gunicorn): buffer e thread próprios
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=get_setting("AUDIT_BUFFER_SIZE", 10000))
+                self._thread = None
+                self._stop = threading.Event()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _overflow(self, entry):
+        policy = get_setting("AUDIT_OVERFLOW", "block")
+        if policy == "block":
+            try:
+                self._queue.put(entry, timeout=get_setting("AUDIT_BLOCK_TIMEOUT", 1.0))
+            except queue.Full:
+                self.write_batch([entry])
+        elif policy == "spill":
+            self.spill([entry])
+        else:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Buffer de auditoria cheio: {self.dropped} log(s) descartado(s)")
+
+    def _run(self):
+        interval = get_setting("AUDIT_FLUSH_INTERVAL_MS", 200) / 1000
+        batch_size = get_setting("AUDIT_FLUSH_BATCH", 500)
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.write_batch(batch)
+            if self._queue.empty():
+                # Conexão própria da thread: não manter aberta ociosa
+                connection.close()
+
+    def write_batch(self, entries):
+        """Grava um lote; em caso de erro, manda o lote para o spill."""
+        try:
+            save_entries(entries)
+        except Exception as e:
+            if not get_setting("AUDIT_ASYNC", False):
+                raise
+            logger.error(f"Erro ao gravar {len(entries)} log(s) de auditoria: {str(e)}")
+            self.spill(entries)
+
+    def spill(self, entries):
+        """Acrescenta as linhas ao arquivo JSONL de spill."""
+        lines = []
+        for entry in entries:
+            label = entry._meta.label_lower
+            data = {"model": label}
+            data.update({name: getattr(entry, name, "") for name in SPILL_FIELDS[label]})
+            lines.append(json.dumps(data, cls=DjangoJSONEncoder))
+        with self._spill_lock:
+            with open(get_setting("AUDIT_SPILL_PATH", "audit_spill.jsonl"), "a", encoding="utf-8") as spill_file:
+                spill_file.write("\n".join(lines) + "\n")
+        self.spilled += len(entries)
+
+    def flush(self):
+        """Grava tudo o que estiver no buffer (chamado na saída e nos testes)."""
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write_batch(batch)
+        return len(batch)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Erro ao gravar logs de auditoria na saída: {str(e)}")
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.shutdown)
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Servir arquivos estáticos
+    "core.middleware.QuotaMiddleware",  # Cotas da API do n8n e dos webhooks
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -182,13 +183,151 @@ SECURE_HSTS_SECONDS = 0
 SECURE_HSTS_INCLUDE_SUBDOMAINS = False
 SECURE_HSTS_PRELOAD = False
 
-# Cache configuration (para rate limiting)
+# Cache configuration (rate limiting e snapshots da API)
+# Em produção use um cache compartilhado entre os workers do gunicorn, ex.:
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# CACHE_LOCATION=/var/tmp/pandia_cache
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "unique-snowflake"),
     }
 }
+# Os snapshots da API (ETags) e a invalidação do cache de API keys entre os
+# workers dependem do cache padrão. Com um cache local ao processo (LocMem/Dummy)
+# e vários workers, os outros workers servem snapshots antigos até o TTL e
+# aceitam API keys revogadas até API_KEY_CACHE_TTL. Com CACHE_REQUIRE_SHARED=1
+# (padrão com DEBUG=0) o processo não sobe com cache local; use 0 só com um
+# único worker.
+CACHE_REQUIRE_SHARED = os.getenv("CACHE_REQUIRE_SHARED", "1" if not DEBUG else "0") == "1"
+
+# Tempo de vida (segundos) dos snapshots de config/conhecimento dos agentes
+AGENT_SNAPSHOT_TTL = int(os.getenv("AGENT_SNAPSHOT_TTL", "300"))
+
+# Máximo de agentes por chamada em /api/n8n/agents/config:batch
+AGENT_CONFIG_BATCH_MAX = int(os.getenv("AGENT_CONFIG_BATCH_MAX", "500"))
+
+# Feed e stream de alterações: janela relida atrás do cursor (updated_at é gravado antes do
+# commit; alterações dessa janela podem vir de novo, com a mesma version)
+AGENT_CHANGES_OVERLAP_SECONDS = float(os.getenv("AGENT_CHANGES_OVERLAP_SECONDS", "5"))
+
+# Stream de alterações (/api/n8n/agents/stream)
+AGENT_STREAM_POLL_SECONDS = float(os.getenv("AGENT_STREAM_POLL_SECONDS", "2"))
+AGENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("AGENT_STREAM_HEARTBEAT_SECONDS", "15"))
+AGENT_STREAM_MAX_SECONDS = float(os.getenv("AGENT_STREAM_MAX_SECONDS", "3600"))
+
+# Cache de API keys em memória (por worker). Invalidação entre workers via carimbo
+# no cache padrão (precisa ser compartilhado em produção), conferido a cada CHECK_SECONDS
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_CACHE_NEGATIVE_TTL = int(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", "5"))
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "1024"))
+API_KEY_CACHE_CHECK_SECONDS = float(os.getenv("API_KEY_CACHE_CHECK_SECONDS", "1"))
+
+# Uso das API keys (last_used_at/usage_count): acumulado em memória e gravado em lote
+# a cada N segundos (0 = gravação imediata). Ver core/usage.py para os limites de perda
+API_KEY_USAGE_FLUSH_SECONDS = float(os.getenv("API_KEY_USAGE_FLUSH_SECONDS", "10"))
+
+# Rate limiting (core/ratelimit.py): "locmem" (por processo, dev), "sqlite" (arquivo
+# compartilhado pelos workers da máquina) ou "database" (tabela no banco principal)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "locmem")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", str(BASE_DIR / "ratelimit.sqlite3"))
+
+# Cota padrão (padarias sem QuotaPlan). 0 = ilimitado
+QUOTA_DEFAULT_PLAN = {
+    "requests_per_second": int(os.getenv("QUOTA_REQUESTS_PER_SECOND", "10")),
+    "burst": int(os.getenv("QUOTA_BURST", "20")),
+    "requests_per_minute": int(os.getenv("QUOTA_REQUESTS_PER_MINUTE", "300")),
+    "requests_per_day": int(os.getenv("QUOTA_REQUESTS_PER_DAY", "50000")),
+    "knowledge_per_minute": int(os.getenv("QUOTA_KNOWLEDGE_PER_MINUTE", "60")),
+    "webhook_per_minute": int(os.getenv("QUOTA_WEBHOOK_PER_MINUTE", "600")),
+}
+
+# Auditoria (audit/writer.py): com AUDIT_ASYNC os logs vão para um buffer do processo e
+# são gravados em lote por uma thread. AUDIT_OVERFLOW: "block", "drop" ou "spill" (JSONL)
+AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "0") == "1"
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200"))
+AUDIT_FLUSH_BATCH = int(os.getenv("AUDIT_FLUSH_BATCH", "500"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "block")
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "1"))
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", str(BASE_DIR / "audit_spill.jsonl"))
+
+# Logs de acesso (audit.AccessLog): chamadas da API do n8n e webhooks, mantidos por
+# ACCESS_LOG_RETENTION_DAYS dias (rodar `python manage.py prune_access_logs` diariamente).
+# Não são arquivados: a remoção é definitiva (os totais ficam nos resumos de atividade)
+ACCESS_LOG_RETENTION_DAYS = int(os.getenv("ACCESS_LOG_RETENTION_DAYS", "30"))
+
+# Resumos de atividade dos dashboards (audit.ActivityRollup): somados a cada lote gravado;
+# `python manage.py rollup_activity` recalcula as últimas horas (--all faz o backfill)
+ACTIVITY_ROLLUP_LIVE = os.getenv("ACTIVITY_ROLLUP_LIVE", "1") == "1"
+
+# Exportação dos logs (audit/export.py): linhas lidas do banco por vez em cada bloco
+AUDIT_EXPORT_CHUNK_SIZE = int(os.getenv("AUDIT_EXPORT_CHUNK_SIZE", "2000"))
+
+# Retenção dos logs de auditoria (audit/retention.py): dias por ação, "*" = demais ações;
+# ações sem política (ou com 0) ficam para sempre. Ex.: AUDIT_RETENTION="api_call:30,delete:0,*:730"
+# Os logs vencidos são arquivados em AUDIT_ARCHIVE_DIR (JSONL gzip por dia) antes de removidos.
+# Só vale para AuditLog: api_call/webhook_received cobrem as linhas antigas, de antes do AccessLog
+AUDIT_RETENTION_POLICIES = {
+    action.strip(): int(days)
+    for action, days in (
+        item.split(":") for item in os.getenv("AUDIT_RETENTION", "api_call:30,webhook_received:30,*:730").split(",")
+        if item.strip()
+    )
+}
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", str(BASE_DIR / "audit_archive"))
+
+# Webhooks: máximo de eventos por requisição em /webhooks/n8n/events/batch
+WEBHOOK_BATCH_MAX_EVENTS = int(os.getenv("WEBHOOK_BATCH_MAX_EVENTS", "500"))
+# Idempotência: event_ids recentes em memória por worker (janela em segundos e
+# tamanho máximo); fora da janela vale a constraint única no banco
+WEBHOOK_DEDUP_WINDOW_SECONDS = int(os.getenv("WEBHOOK_DEDUP_WINDOW_SECONDS", "3600"))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+# Modo 202: webhooks vão para uma fila local (SQLite) e o comando
+# drain_webhook_queue grava no banco. Acima do high watermark: 503 + Retry-After
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", str(BASE_DIR / "webhook_queue.sqlite3"))
+WEBHOOK_QUEUE_HIGH_WATERMARK = int(os.getenv("WEBHOOK_QUEUE_HIGH_WATERMARK", "50000"))
+WEBHOOK_QUEUE_RETRY_AFTER = int(os.getenv("WEBHOOK_QUEUE_RETRY_AFTER", "5"))
+WEBHOOK_QUEUE_BATCH_SIZE = int(os.getenv("WEBHOOK_QUEUE_BATCH_SIZE", "500"))
+WEBHOOK_QUEUE_LEASE_SECONDS = int(os.getenv("WEBHOOK_QUEUE_LEASE_SECONDS", "60"))
+# Tentativas por item antes do dead letter (drain_webhook_queue --retry-dead)
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "5"))
+
+# n8n: webhook que recebe o texto dos PDFs de conhecimento (memória do agente)
+N8N_MEMORY_WEBHOOK_URL = os.getenv("N8N_MEMORY_WEBHOOK_URL", "https://n8n.newcouros.com.br/webhook/memoria")
+
+# Outbox das notificações ao n8n (integrations/outbox.py, comando run_outbox):
+# tentativas, backoff (segundos), envios simultâneos por destino e a janela
+# (segundos) em que saves repetidos do mesmo agente viram uma só entrega
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = int(os.getenv("OUTBOX_BACKOFF_BASE", "10"))
+OUTBOX_BACKOFF_MAX = int(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+OUTBOX_MAX_PER_DESTINATION = int(os.getenv("OUTBOX_MAX_PER_DESTINATION", "2"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_COALESCE_SECONDS = int(os.getenv("OUTBOX_COALESCE_SECONDS", "30"))
+
+# Cliente HTTP de saída (integrations/http.py): conexões por host com keep-alive.
+# Por destino: OUTBOUND_HTTP_DESTINATIONS="host=pool:timeout,..."
+# Ex.: "n8n.newcouros.com.br=8:20"
+OUTBOUND_HTTP_POOL_SIZE = int(os.getenv("OUTBOUND_HTTP_POOL_SIZE", "4"))
+OUTBOUND_HTTP_TIMEOUT = float(os.getenv("OUTBOUND_HTTP_TIMEOUT", "10"))
+OUTBOUND_HTTP_CONNECT_TIMEOUT = float(os.getenv("OUTBOUND_HTTP_CONNECT_TIMEOUT", "3"))
+OUTBOUND_HTTP_DESTINATIONS = {
+    host.strip().lower(): {"pool_size": int(pool_size), "timeout": float(timeout)}
+    for host, pool_size, timeout in (
+        (item.split("=")[0], *item.split("=")[1].split(":"))
+        for item in os.getenv("OUTBOUND_HTTP_DESTINATIONS", "").split(",")
+        if item.strip()
+    )
+}
+
+# Busca na base de conhecimento: agentes com índice BM25 em memória (por processo)
+KNOWLEDGE_SEARCH_CACHE_SIZE = int(os.getenv("KNOWLEDGE_SEARCH_CACHE_SIZE", "128"))
+
+# Montagem de contexto (/api/n8n/agents/<slug>/context): orçamento de tokens padrão e máximo
+AGENT_CONTEXT_DEFAULT_TOKENS = int(os.getenv("AGENT_CONTEXT_DEFAULT_TOKENS", "1500"))
+AGENT_CONTEXT_MAX_TOKENS = int(os.getenv("AGENT_CONTEXT_MAX_TOKENS", "16000"))
 
 # Messages framework
 from django.contrib.messages import constants as messages
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+    
+    def ready(self):
+        """Importar signals e conferir o cache compartilhado quando o app estiver pronto."""
+        import core.signals
+        from .utils import ensure_shared_cache
+        
+        ensure_shared_cache()
@@ -0,0 +1,31 @@
+from .quotas import classify_path, check_quota
+from .utils import lookup_api_key, rate_limit_response
+
+
+class QuotaMiddleware:
+    """
+    Aplica as cotas de requisições (core.quotas) à API do n8n e aos webhooks.
+    Requisições sem API key válida seguem para a view, que responde 401.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        category = classify_path(request.path_info)
+        if category is None:
+            return self.get_response(request)
+
+        api_key_value = request.GET.get("api_key") or request.META.get("HTTP_X_API_KEY")
+        api_key = lookup_api_key(api_key_value) if api_key_value else None
+        if api_key is None:
+            return self.get_response(request)
+
+        result = check_quota(api_key, category)
+        if result is not None and not result:
+            return rate_limit_response(result, f"Quota exceeded ({result.name})")
+
+        response = self.get_response(request)
+        if result is not None:
+            for header, value in result.headers().items():
+                response[header] = value
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Chave')),
+                ('state', models.JSONField(default=list, verbose_name='Estado')),
+                ('expires_at', models.FloatField(db_index=True, verbose_name='Expira em (epoch)')),
+            ],
+            options={
+                'verbose_name': 'Estado de Rate Limit',
+                'verbose_name_plural': 'Estados de Rate Limit',
+            },
+        ),
+    ]
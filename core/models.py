@@ -1,3 +1,18 @@
 from django.db import models
 
-# Core não tem models específicos
+
+class RateLimitState(models.Model):
+    """
+    Estado de um limitador (backend "database" de core.ratelimit):
+    balde de tokens ou log da janela deslizante de uma chave.
+    """
+    key = models.CharField(max_length=255, unique=True, verbose_name="Chave")
+    state = models.JSONField(default=list, verbose_name="Estado")
+    expires_at = models.FloatField(db_index=True, verbose_name="Expira em (epoch)")
+
+    class Meta:
+        verbose_name = "Estado de Rate Limit"
+        verbose_name_plural = "Estados de Rate Limit"
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,281 @@
+"""
+Paginação por keyset (cursor) para listas grandes.
+
+Em vez de OFFSET, a próxima página é buscada a partir dos valores da última
+linha entregue (ex.: (updated_at, id)), usando o índice composto. O cursor é
+opaco para o cliente: base64 de uma lista JSON com esses valores. Ao
+decodificar, cada valor é convertido para o tipo do campo (data/hora, inteiro
+ou texto); um cursor adulterado vira InvalidCursor (400), não erro do ORM.
+
+keyset_page serve às APIs; KeysetPaginator às listas das telas (páginas
+anterior/próxima e total exato, estimado ou nenhum).
+"""
+import base64
+import binascii
+import json
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connections, models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """Cursor malformado ou incompatível com a ordenação."""
+
+
+def encode_cursor(values):
+    """Codifica uma lista de valores em um cursor opaco."""
+    payload = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def to_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError("Inteiro esperado")
+    return int(value)
+
+
+def to_str(value):
+    if not isinstance(value, str):
+        raise TypeError("Texto esperado")
+    return value
+
+
+def to_datetime(value):
+    parsed = parse_datetime(to_str(value))
+    if parsed is None:
+        raise ValueError("Data/hora inválida")
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def to_date(value):
+    parsed = parse_date(to_str(value))
+    if parsed is None:
+        raise ValueError("Data inválida")
+    return parsed
+
+
+def field_coercers(model, fields):
+    """Conversores dos valores do cursor para os campos da ordenação."""
+    coercers = []
+    for field in fields:
+        model_field = model._meta.get_field(field.lstrip("-"))
+        if isinstance(model_field, models.DateTimeField):
+            coercers.append(to_datetime)
+        elif isinstance(model_field, models.DateField):
+            coercers.append(to_date)
+        elif isinstance(model_field, (models.IntegerField, models.AutoField, models.ForeignKey)):
+            coercers.append(to_int)
+        else:
+            coercers.append(to_str)
+    return coercers
+
+
+def decode_cursor(cursor, size, coercers=None):
+    """
+    Decodifica um cursor opaco, convertendo cada valor com `coercers` (um
+    por posição, ex. (to_datetime, to_int)). Levanta InvalidCursor se for
+    inválido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor")
+    if coercers:
+        try:
+            values = [coerce(value) for coerce, value in zip(coercers, values)]
+        except (ValueError, TypeError, OverflowError):
+            raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def keyset_filter(fields, values):
+    """
+    Monta o filtro "depois de (values)" para a ordenação dada.
+    fields: ex. ("updated_at", "id") ou ("-created_at", "-id").
+    """
+    condition = Q()
+    for index in range(len(fields) - 1, -1, -1):
+        name = fields[index].lstrip("-")
+        lookup = "lt" if fields[index].startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[index]})
+        if index < len(fields) - 1:
+            step |= Q(**{name: values[index]}) & condition
+        condition = step
+    return condition
+
+
+def keyset_page(queryset, fields, cursor=None, limit=100):
+    """
+    Retorna (itens, próximo_cursor, tem_mais) de uma página do queryset.
+    Funciona com instâncias de model ou dicts (queryset.values()).
+    """
+    queryset = queryset.order_by(*fields)
+    if cursor:
+        values = decode_cursor(cursor, len(fields), field_coercers(queryset.model, fields))
+        queryset = queryset.filter(keyset_filter(fields, values))
+
+    items = list(queryset[:limit + 1])
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    next_cursor = cursor
+    if items:
+        last = items[-1]
+        names = [field.lstrip("-") for field in fields]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor([last[name] for name in names])
+        else:
+            next_cursor = encode_cursor([getattr(last, name) for name in names])
+    return items, next_cursor, has_more
+
+
+class KeysetPage:
+    """
+    Página de um KeysetPaginator (iterável nos templates).
+    count: total de linhas (None se não calculado); count_is_estimate indica
+    estimativa do banco ou contagem limitada ("mais de N").
+    """
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None, count=None, count_is_estimate=False):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginação por keyset para as listas das telas.
+
+    ordering deve terminar em um campo único (padrão: ("-created_at", "-id")).
+    O cursor da URL leva a direção ("a": depois de, "b": antes de) e os
+    valores da linha de referência.
+
+    count:
+        "exact": COUNT(*) do queryset;
+        "estimate": estimativa sem varrer a tabela (ver estimate_count);
+        None: sem total.
+    """
+
+    def __init__(self, queryset, per_page=20, ordering=("-created_at", "-id"), count="exact"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.count_mode = count
+
+    def _values(self, item):
+        names = [field.lstrip("-") for field in self.ordering]
+        return [getattr(item, name) for name in names]
+
+    def get_page(self, cursor=None):
+        """Página do cursor (primeira página se vazio ou inválido)."""
+        direction, values = "a", None
+        if cursor:
+            try:
+                direction, *values = decode_cursor(
+                    cursor, len(self.ordering) + 1, [to_str] + field_coercers(self.queryset.model, self.ordering)
+                )
+            except InvalidCursor:
+                direction, values = "a", None
+            if direction not in ("a", "b"):
+                direction, values = "a", None
+
+        ordering = self.ordering
+        if direction == "b":
+            # Página anterior: percorrer ao contrário a partir da primeira linha
+            ordering = tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+        queryset = self.queryset.order_by(*ordering)
+        if values:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+
+        items = list(queryset[:self.per_page + 1])
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == "b":
+            items.reverse()
+
+        next_cursor = previous_cursor = None
+        if items:
+            has_next = more if direction == "a" else True
+            has_previous = bool(values) if direction == "a" else more
+            if has_next:
+                next_cursor = encode_cursor(["a"] + self._values(items[-1]))
+            if has_previous:
+                previous_cursor = encode_cursor(["b"] + self._values(items[0]))
+
+        count, is_estimate = None, False
+        if self.count_mode == "exact":
+            count = self.queryset.count()
+        elif self.count_mode == "estimate":
+            count, is_estimate = estimate_count(self.queryset)
+        return KeysetPage(items, next_cursor, previous_cursor, count, is_estimate)
+
+
+def estimate_count(queryset, cap=1000):
+    """
+    Total aproximado do queryset, sem COUNT(*) na tabela inteira.
+    Retorna (total, é_estimativa).
+
+    - sem filtros: estatística da tabela (pg_class.reltuples no PostgreSQL,
+      sqlite_stat1 no SQLite após ANALYZE);
+    - com filtros no PostgreSQL: linhas previstas pelo planner (EXPLAIN);
+    - senão: contagem limitada a `cap` linhas (total exato abaixo do limite).
+    Estimativas abaixo de `cap` são trocadas pela contagem exata.
+    """
+    connection = connections[queryset.db]
+    estimate = None
+    try:
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                table = queryset.model._meta.db_table
+                if connection.vendor == "postgresql":
+                    cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+                    row = cursor.fetchone()
+                    estimate = row[0] if row and row[0] > 0 else None
+                elif connection.vendor == "sqlite":
+                    cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                    rows = cursor.fetchall()
+                    estimate = max((int(row[0].split()[0]) for row in rows), default=None)
+            elif connection.vendor == "postgresql":
+                sql, params = queryset.order_by().query.sql_with_params()
+                cursor.execute(f"EXPLAIN {sql}", params)
+                match = re.search(r"rows=(\d+)", cursor.fetchone()[0])
+                estimate = int(match.group(1)) if match else None
+    except Exception:
+        # Sem estatísticas (ex.: sqlite_stat1 inexistente antes do ANALYZE)
+        estimate = None
+
+    if estimate is not None and estimate >= cap:
+        return estimate, True
+    capped = queryset.order_by()[:cap + 1].count()
+    if capped > cap:
+        return cap, True
+    return capped, False
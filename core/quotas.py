@@ -0,0 +1,130 @@
+"""
+Cotas de requisições por padaria / API key (organizations.QuotaPlan).
+
+O plano efetivo é o da API key (se houver; a cota passa a ser contada só
+para a chave) ou o da padaria, ou QUOTA_DEFAULT_PLAN. Os planos ficam no
+cache do processo junto com as API keys.
+
+Contadores:
+    - requisições por segundo + rajada: balde de tokens em memória do worker,
+      sem ida ao backend (protege cada worker de um loop de um único tenant);
+    - por minuto (API), conhecimento por minuto, webhook por minuto e por
+      dia: um único MultiLimit no backend compartilhado (RATE_LIMIT_BACKEND),
+      válido entre os workers. Cada requisição consome só o orçamento por
+      minuto da sua categoria (conhecimento e webhooks não gastam o da API)
+      e o limite diário, comum a todas.
+
+O webhook em lote custa um por evento (ver `charge_quota`).
+"""
+from django.conf import settings
+from .ratelimit import TokenBucket, MultiLimit, LocMemBackend, check_rate_limit
+from .utils import quota_plan_cache
+
+QUOTA_FIELDS = (
+    "requests_per_second", "burst", "requests_per_minute", "requests_per_day",
+    "knowledge_per_minute", "webhook_per_minute",
+)
+
+# Prefixos de path sujeitos a cota e a categoria de cada requisição
+QUOTA_PATH_PREFIXES = ("/api/n8n/", "/webhooks/")
+
+# Contadores por segundo, locais ao worker
+local_backend = LocMemBackend()
+
+
+def classify_path(path):
+    """Categoria da requisição: "webhook", "knowledge", "api" ou None (sem cota)."""
+    if not path.startswith(QUOTA_PATH_PREFIXES):
+        return None
+    if path.startswith("/webhooks/"):
+        return "webhook"
+    if "/knowledge" in path or path.endswith("/context"):
+        return "knowledge"
+    return "api"
+
+
+def get_default_limits():
+    defaults = {
+        "requests_per_second": 10,
+        "burst": 20,
+        "requests_per_minute": 300,
+        "requests_per_day": 50000,
+        "knowledge_per_minute": 60,
+        "webhook_per_minute": 600,
+    }
+    defaults.update(getattr(settings, "QUOTA_DEFAULT_PLAN", {}))
+    return defaults
+
+
+def get_plan_limits(plan_id):
+    """Limites do plano (do cache do processo). Sem plano: QUOTA_DEFAULT_PLAN."""
+    if not plan_id:
+        return get_default_limits()
+    found, limits = quota_plan_cache.get(plan_id)
+    if not found:
+        from organizations.models import QuotaPlan
+
+        limits = QuotaPlan.objects.filter(pk=plan_id).values(*QUOTA_FIELDS).first()
+        quota_plan_cache.set(plan_id, limits)
+    return limits or get_default_limits()
+
+
+def get_quota_scope(api_key):
+    """Retorna (chave do contador, limites) da API key."""
+    if api_key.quota_plan_id:
+        return f"quota:key:{api_key.pk}", get_plan_limits(api_key.quota_plan_id)
+    return f"quota:padaria:{api_key.padaria_id}", get_plan_limits(api_key.padaria.quota_plan_id)
+
+
+def build_limits(limits, category):
+    """MultiLimit (compartilhado) do plano para a categoria da requisição."""
+    windows = {"day": (limits["requests_per_day"], 86400)}
+    if category == "knowledge":
+        windows["knowledge"] = (limits["knowledge_per_minute"], 60)
+    elif category == "webhook":
+        windows["webhook"] = (limits["webhook_per_minute"], 60)
+    else:
+        windows["minute"] = (limits["requests_per_minute"], 60)
+    buckets = {
+        name: TokenBucket.per_window(limit, window)
+        for name, (limit, window) in windows.items()
+        if limit
+    }
+    return MultiLimit(buckets) if buckets else None
+
+
+def check_quota(api_key, category):
+    """
+    Consome a cota da requisição. Retorna o RateLimitResult mais restritivo
+    (negado, se algum limite estourou) ou None se o plano é ilimitado.
+    """
+    scope, limits = get_quota_scope(api_key)
+
+    result = None
+    if limits["requests_per_second"]:
+        bucket = TokenBucket(limits["requests_per_second"], max(limits["burst"], limits["requests_per_second"]))
+        result = check_rate_limit(f"{scope}:second", bucket, backend=local_backend)
+        result.name = "second"
+        if not result:
+            return result
+
+    shared = build_limits(limits, category)
+    if shared is not None:
+        result = check_rate_limit(scope, shared)
+    return result
+
+
+def charge_quota(api_key, category, cost):
+    """
+    Consome `cost` unidades a mais dos limites compartilhados, para
+    requisições que valem por várias (ex.: webhook em lote, um por evento,
+    além da unidade já cobrada pelo QuotaMiddleware). Retorna como
+    check_quota.
+    """
+    if cost <= 0:
+        return None
+    scope, limits = get_quota_scope(api_key)
+    shared = build_limits(limits, category)
+    if shared is None:
+        return None
+    return check_rate_limit(scope, shared, cost=cost)
@@ -0,0 +1,293 @@
+"""
+Rate limiting com algoritmos atômicos e backends compartilhados entre workers.
+
+Algoritmos:
+    TokenBucket: taxa sustentada (tokens/segundo) com rajada (capacidade).
+    SlidingWindowLog: no máximo N requisições em qualquer janela de W segundos
+        (guarda o horário de cada requisição; use para janelas curtas).
+    MultiLimit: combinação dos anteriores, consumida de uma vez.
+
+Backends (RATE_LIMIT_BACKEND):
+    "locmem": memória do processo (dev/testes; cada worker conta separado).
+    "sqlite": arquivo SQLite em RATE_LIMIT_SQLITE_PATH, atualizado com
+        BEGIN IMMEDIATE; correto entre os workers de uma mesma máquina.
+    "database": tabela core.RateLimitState no banco principal, com
+        SELECT ... FOR UPDATE (PostgreSQL); correto entre máquinas.
+
+Cada backend aplica a atualização do estado de uma chave de forma atômica
+(ler, calcular, gravar) e os algoritmos são funções puras sobre esse estado.
+"""
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+
+class RateLimitResult:
+    """Resultado de uma verificação de limite (com os headers X-RateLimit-*)."""
+
+    def __init__(self, allowed, limit, remaining, reset_after, retry_after=0, name=None):
+        self.name = name
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = max(int(remaining), 0)
+        self.reset_after = max(reset_after, 0)
+        self.retry_after = max(retry_after, 0)
+
+    def __bool__(self):
+        return self.allowed
+
+    def headers(self):
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+class TokenBucket:
+    """Balde de tokens: `rate` tokens por segundo, até `capacity` acumulados."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+
+    @classmethod
+    def per_window(cls, limit, window_seconds, burst=None):
+        """limit requisições por window_seconds, com rajada (padrão: limit)."""
+        return cls(limit / window_seconds, burst or limit)
+
+    def ttl(self):
+        # Depois desse tempo o balde está cheio de novo: o estado pode expirar
+        return self.capacity / self.rate if self.rate else 0
+
+    def apply(self, state, now, cost=1):
+        tokens, updated = state if state else (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        missing = self.capacity - tokens
+        result = RateLimitResult(
+            allowed,
+            limit=int(self.capacity),
+            remaining=math.floor(tokens),
+            reset_after=missing / self.rate if self.rate else 0,
+            retry_after=0 if allowed else (cost - tokens) / self.rate if self.rate else 0,
+        )
+        return [tokens, now], result
+
+
+class SlidingWindowLog:
+    """No máximo `limit` requisições em qualquer janela de `window` segundos."""
+
+    def __init__(self, limit, window):
+        self.limit = int(limit)
+        self.window = float(window)
+
+    def ttl(self):
+        return self.window
+
+    def apply(self, state, now, cost=1):
+        log = [stamp for stamp in (state or []) if stamp > now - self.window]
+        allowed = len(log) + cost <= self.limit
+        if allowed:
+            log.extend([now] * cost)
+        retry_after = 0
+        if not allowed and log:
+            # Espera até sair da janela a requisição que libera espaço
+            index = min(len(log) + cost - self.limit - 1, len(log) - 1)
+            retry_after = log[index] + self.window - now
+        result = RateLimitResult(
+            allowed,
+            limit=self.limit,
+            remaining=self.limit - len(log),
+            reset_after=(log[0] + self.window - now) if log else 0,
+            retry_after=retry_after,
+        )
+        return log, result
+
+
+class MultiLimit:
+    """
+    Vários limites aplicados juntos sobre o mesmo estado (uma só operação
+    atômica no backend). A requisição só consome se todos permitirem.
+    limits: {nome: TokenBucket/SlidingWindowLog}. Outras entradas do estado
+    (de limites não incluídos nesta chamada) são preservadas.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+
+    def ttl(self):
+        return max(limit.ttl() for limit in self.limits.values())
+
+    def apply(self, state, now, cost=1):
+        state = dict(state or {})
+        updates = {}
+        results = {}
+        for name, limit in self.limits.items():
+            updates[name], results[name] = limit.apply(state.get(name), now, cost)
+        denied = [result for result in results.values() if not result.allowed]
+        if denied:
+            # Nenhum limite consome: apenas atualizar a reposição
+            updates = {name: limit.apply(state.get(name), now, 0)[0] for name, limit in self.limits.items()}
+            result = max(denied, key=lambda r: r.retry_after)
+        else:
+            result = min(results.values(), key=lambda r: r.remaining / (r.limit or 1))
+        state.update(updates)
+        result.name = next(name for name, r in results.items() if r is result)
+        return state, result
+
+
+class BaseBackend:
+    """Aplica algorithm.apply ao estado da chave de forma atômica."""
+
+    def hit(self, key, algorithm, cost=1):
+        raise NotImplementedError
+
+
+class LocMemBackend(BaseBackend):
+    """Estado em memória do processo (não compartilhado entre workers)."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, algorithm, cost=1):
+        now = time.time()
+        with self._lock:
+            entry = self._states.get(key)
+            state = entry[0] if entry and entry[1] > now else None
+            state, result = algorithm.apply(state, now, cost)
+            self._states[key] = (state, now + algorithm.ttl())
+            if len(self._states) > 10000:
+                self._states = {k: v for k, v in self._states.items() if v[1] > now}
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+class SQLiteBackend(BaseBackend):
+    """
+    Estado em um arquivo SQLite local, compartilhado pelos workers da máquina.
+    BEGIN IMMEDIATE pega o lock de escrita antes da leitura, então a
+    sequência ler-calcular-gravar é atômica entre processos.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit_state "
+                "(key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, algorithm, cost=1):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT state, expires_at FROM ratelimit_state WHERE key = ?", (key,)
+            ).fetchone()
+            state = json.loads(row[0]) if row and row[1] > now else None
+            state, result = algorithm.apply(state, now, cost)
+            conn.execute(
+                "INSERT OR REPLACE INTO ratelimit_state (key, state, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(state), now + algorithm.ttl()),
+            )
+            # Limpeza ocasional de chaves expiradas
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM ratelimit_state WHERE expires_at < ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def clear(self):
+        self._connection().execute("DELETE FROM ratelimit_state")
+
+
+class DatabaseBackend(BaseBackend):
+    """
+    Estado na tabela core.RateLimitState do banco principal.
+    A linha da chave é travada com SELECT ... FOR UPDATE dentro da transação
+    (no SQLite o lock é do banco inteiro; prefira o backend "sqlite" nele).
+    """
+
+    def hit(self, key, algorithm, cost=1):
+        from .models import RateLimitState
+
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    now = time.time()
+                    row = RateLimitState.objects.select_for_update().filter(key=key).first()
+                    state = row.state if row and row.expires_at > now else None
+                    state, result = algorithm.apply(state, now, cost)
+                    if row is None:
+                        RateLimitState.objects.create(key=key, state=state, expires_at=now + algorithm.ttl())
+                    else:
+                        row.state = state
+                        row.expires_at = now + algorithm.ttl()
+                        row.save(update_fields=["state", "expires_at"])
+                if random.random() < 0.01:
+                    RateLimitState.objects.filter(expires_at__lt=now).delete()
+                return result
+            except IntegrityError:
+                # Outro worker criou a linha ao mesmo tempo: repetir com lock
+                if attempt:
+                    raise
+
+    def clear(self):
+        from .models import RateLimitState
+        RateLimitState.objects.all().delete()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend configurado em RATE_LIMIT_BACKEND (instância única por processo)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, "RATE_LIMIT_BACKEND", "locmem")
+                if name == "sqlite":
+                    _backend = SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH)
+                elif name == "database":
+                    _backend = DatabaseBackend()
+                elif name == "locmem":
+                    _backend = LocMemBackend()
+                else:
+                    raise ValueError(f"RATE_LIMIT_BACKEND inválido: {name}")
+    return _backend
+
+
+def check_rate_limit(key, algorithm, cost=1, backend=None):
+    """Consome `cost` do limite da chave. Retorna RateLimitResult."""
+    return (backend or get_backend()).hit(f"rl:{key}", algorithm, cost)
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from organizations.models import ApiKey, Padaria, QuotaPlan
+from .utils import invalidate_api_key_cache
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def refresh_api_key_cache_on_key_change(sender, instance, **kwargs):
+    """Invalida o cache de API keys dos workers quando uma chave muda."""
+    invalidate_api_key_cache()
+
+
+@receiver(post_save, sender=Padaria)
+@receiver(post_delete, sender=Padaria)
+def refresh_api_key_cache_on_padaria_change(sender, instance, **kwargs):
+    """O cache guarda nome/slug da padaria: invalidar quando ela muda."""
+    invalidate_api_key_cache()
+
+
+@receiver(post_save, sender=QuotaPlan)
+@receiver(post_delete, sender=QuotaPlan)
+def refresh_quota_plan_cache(sender, instance, **kwargs):
+    """Planos de cota ficam no cache do processo: invalidar quando mudam."""
+    invalidate_api_key_cache()
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.contrib.auth.models import User
+from organizations.models import Organization, ApiKey, QuotaPlan
+from agents.models import Agent
+from .pagination import KeysetPaginator, InvalidCursor, decode_cursor, encode_cursor, estimate_count, field_coercers
+from .quotas import local_backend
+from .ratelimit import (
+    TokenBucket, SlidingWindowLog, LocMemBackend, SQLiteBackend, DatabaseBackend, check_rate_limit, get_backend
+)
+from .usage import ApiKeyUsageTracker, usage_tracker
+from .utils import authenticate_api_key, api_key_cache, ensure_shared_cache, quota_plan_cache, rate_limit_decorator
 
-# Core tests
+
+@override_settings(API_KEY_USAGE_FLUSH_SECONDS=3600)
+class ApiKeyCacheTest(TestCase):
+    """Testes para o cache de API keys em memória."""
+
+    def setUp(self):
+        api_key_cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        self.api_key = ApiKey.objects.create(padaria=self.padaria)
+
+    def tearDown(self):
+        usage_tracker.flush()
+
+    def authenticate(self, key):
+        request = self.factory.get("/api/n8n/agents/changes", HTTP_X_API_KEY=key)
+        return request, authenticate_api_key(request)
+
+    def test_cached_key_skips_database(self):
+        """Testa que a segunda autenticação não consulta o banco."""
+        self.authenticate(self.api_key.key)
+        with self.assertNumQueries(0):
+            request, error = self.authenticate(self.api_key.key)
+        self.assertIsNone(error)
+        self.assertEqual(request.api_key.pk, self.api_key.pk)
+        self.assertEqual(request.padaria.name, "Test Org")
+
+    def test_deactivated_key_is_invalidated(self):
+        """Testa que desativar a chave invalida o cache."""
+        self.authenticate(self.api_key.key)
+        self.api_key.is_active = False
+        self.api_key.save()
+        _, error = self.authenticate(self.api_key.key)
+        self.assertEqual(error.status_code, 401)
+
+    def test_padaria_rename_is_invalidated(self):
+        """Testa que renomear a padaria atualiza os dados em cache."""
+        self.authenticate(self.api_key.key)
+        self.padaria.name = "Novo Nome"
+        self.padaria.save()
+        request, _ = self.authenticate(self.api_key.key)
+        self.assertEqual(request.padaria.name, "Novo Nome")
+
+    def test_process_local_cache_is_refused_when_shared_required(self):
+        """Testa que LocMemCache não é aceito com CACHE_REQUIRE_SHARED."""
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        filebased = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache"}}
+        with self.settings(CACHES=locmem, CACHE_REQUIRE_SHARED=True), self.assertRaises(ImproperlyConfigured):
+            ensure_shared_cache()
+        with self.settings(CACHES=filebased, CACHE_REQUIRE_SHARED=True):
+            ensure_shared_cache()
+        with self.settings(CACHES=locmem, CACHE_REQUIRE_SHARED=False):
+            ensure_shared_cache()
+
+    def test_invalid_key_is_cached(self):
+        """Testa que chaves inválidas também ficam em cache (negativo)."""
+        self.authenticate("sk_invalida")
+        with self.assertNumQueries(0):
+            _, error = self.authenticate("sk_invalida")
+        self.assertEqual(error.status_code, 401)
+
+
+class ApiKeyUsageTest(TestCase):
+    """Testes para a gravação agrupada do uso das API keys."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user)
+        self.api_key = ApiKey.objects.create(padaria=self.padaria)
+        self.other_key = ApiKey.objects.create(padaria=self.padaria)
+
+    @override_settings(API_KEY_USAGE_FLUSH_SECONDS=3600)
+    def test_usage_is_coalesced(self):
+        """Testa que os usos são acumulados em memória e gravados em um UPDATE."""
+        tracker = ApiKeyUsageTracker()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                tracker.record(self.api_key.pk)
+            tracker.record(self.other_key.pk)
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(tracker.flush(), 2)
+        
+        self.api_key.refresh_from_db()
+        self.other_key.refresh_from_db()
+        self.assertEqual(self.api_key.usage_count, 3)
+        self.assertEqual(self.other_key.usage_count, 1)
+        self.assertIsNotNone(self.api_key.last_used_at)
+        tracker.shutdown()
+
+
+class RateLimitTest(TestCase):
+    """Testes para o rate limiting (algoritmos e backends)."""
+
+    def test_sliding_window_log(self):
+        """Testa limite da janela deslizante e Retry-After."""
+        backend = LocMemBackend()
+        window = SlidingWindowLog(limit=3, window=60)
+        results = [check_rate_limit("cliente", window, backend=backend) for _ in range(4)]
+        self.assertEqual([bool(r) for r in results], [True, True, True, False])
+        self.assertEqual(results[2].remaining, 0)
+        headers = results[3].headers()
+        self.assertEqual(headers["X-RateLimit-Limit"], "3")
+        self.assertGreaterEqual(int(headers["Retry-After"]), 59)
+
+    def test_token_bucket_refills(self):
+        """Testa rajada e reposição do balde de tokens."""
+        bucket = TokenBucket(rate=1, capacity=2)
+        state, first = bucket.apply(None, now=100.0)
+        state, second = bucket.apply(state, now=100.0)
+        state, third = bucket.apply(state, now=100.0)
+        self.assertEqual([first.allowed, second.allowed, third.allowed], [True, True, False])
+        self.assertAlmostEqual(third.retry_after, 1.0)
+        _, later = bucket.apply(state, now=101.0)
+        self.assertTrue(later.allowed)
+
+    def test_sqlite_backend_is_shared(self):
+        """Testa que duas instâncias (workers) do backend SQLite dividem o limite."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ratelimit.sqlite3")
+            workers = [SQLiteBackend(path), SQLiteBackend(path)]
+            window = SlidingWindowLog(limit=4, window=60)
+            allowed = [bool(check_rate_limit("padaria-1", window, backend=workers[i % 2])) for i in range(6)]
+            self.assertEqual(allowed, [True] * 4 + [False] * 2)
+
+    def test_database_backend(self):
+        """Testa o backend no banco principal."""
+        backend = DatabaseBackend()
+        bucket = TokenBucket.per_window(2, 60)
+        allowed = [bool(check_rate_limit("padaria-1", bucket, backend=backend)) for _ in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+
+    def test_decorator_sets_headers(self):
+        """Testa headers X-RateLimit-* e 429 no decorator."""
+        @rate_limit_decorator(limit=1, window_seconds=60, key_func=lambda request: "decorator-test")
+        def view(request):
+            return JsonResponse({"status": "ok"})
+
+        request = RequestFactory().get("/")
+        response = view(request)
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+        response = view(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+
+@override_settings(API_KEY_USAGE_FLUSH_SECONDS=0)
+class QuotaMiddlewareTest(TestCase):
+    """Testes para as cotas por padaria / API key."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.plan = QuotaPlan.objects.create(name="Teste", requests_per_minute=2, knowledge_per_minute=1)
+        self.padaria = Organization.objects.create(name="Test Org", owner=self.user, quota_plan=self.plan)
+        self.api_key = ApiKey.objects.create(padaria=self.padaria)
+        self.agent = Agent.objects.create(padaria=self.padaria, name="Test Agent")
+
+    def tearDown(self):
+        get_backend().clear()
+        local_backend.clear()
+
+    def get(self, path, api_key=None):
+        return self.client.get(path, HTTP_X_API_KEY=(api_key or self.api_key).key)
+
+    def test_padaria_plan_is_enforced(self):
+        """Testa o limite por minuto do plano da padaria, com headers."""
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        first = self.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["X-RateLimit-Limit"], "2")
+        self.assertEqual(first["X-RateLimit-Remaining"], "1")
+        self.assertEqual(self.get(url).status_code, 200)
+        response = self.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    def test_knowledge_budget_is_separate(self):
+        """Testa o orçamento próprio dos endpoints de conhecimento."""
+        url = f"/api/n8n/agents/{self.agent.slug}/knowledge"
+        self.assertEqual(self.get(url).status_code, 200)
+        self.assertEqual(self.get(url).status_code, 429)
+        self.assertEqual(self.get(f"/api/n8n/agents/{self.agent.slug}/config").status_code, 200)
+
+    def test_webhooks_do_not_consume_api_budget(self):
+        """Testa que webhooks gastam só o próprio orçamento, um por evento no lote."""
+        self.plan.webhook_per_minute = 3
+        self.plan.save()
+        quota_plan_cache.clear()
+        event = {"type": "message", "agent_slug": self.agent.slug, "session_id": "s1"}
+        for _ in range(2):
+            response = self.client.post(
+                "/webhooks/n8n/events", data=json.dumps(event), content_type="application/json",
+                HTTP_X_API_KEY=self.api_key.key
+            )
+            self.assertEqual(response.status_code, 200)
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        self.assertEqual(self.get(url).status_code, 200)
+        self.assertEqual(self.get(url).status_code, 200)
+
+        # Restam 1 unidade de webhook: um lote de 2 eventos estoura
+        response = self.client.post(
+            "/webhooks/n8n/events/batch", data=json.dumps([event, event]), content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_api_key_plan_overrides_padaria(self):
+        """Testa que o plano da API key substitui o da padaria e conta separado."""
+        unlimited = QuotaPlan.objects.create(
+            name="Ilimitado", requests_per_second=0, requests_per_minute=0, requests_per_day=0,
+            knowledge_per_minute=0, webhook_per_minute=0
+        )
+        key = ApiKey.objects.create(padaria=self.padaria, quota_plan=unlimited)
+        url = f"/api/n8n/agents/{self.agent.slug}/config"
+        for _ in range(5):
+            self.assertEqual(self.get(url, key).status_code, 200)
+        self.assertEqual(self.get(url).status_code, 200)
+
+
+class KeysetPaginatorTest(TestCase):
+    """Testes para a paginação por cursor das listas."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        for index in range(5):
+            Organization.objects.create(name=f"Padaria {index}", owner=self.user)
+
+    def test_pages_forward_and_back(self):
+        """Testa a navegação pelas páginas com cursores opacos."""
+        paginator = KeysetPaginator(Organization.objects.all(), per_page=2)
+        first = paginator.get_page()
+        self.assertEqual([p.name for p in first], ["Padaria 4", "Padaria 3"])
+        self.assertFalse(first.has_previous())
+        self.assertEqual(first.count, 5)
+
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual([p.name for p in third], ["Padaria 0"])
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual([p.name for p in back], ["Padaria 2", "Padaria 1"])
+        self.assertTrue(back.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        """Testa que um cursor inválido volta para a primeira página."""
+        page = KeysetPaginator(Organization.objects.all(), per_page=2, count=None).get_page("invalido")
+        self.assertEqual([p.name for p in page], ["Padaria 4", "Padaria 3"])
+        self.assertIsNone(page.count)
+
+    def test_tampered_cursor_values_are_rejected(self):
+        """Testa que valores de tipo errado no cursor viram InvalidCursor."""
+        coercers = field_coercers(Organization, ("-created_at", "-id"))
+        for values in (["2026-01-01T00:00:00", "x"], ["2026-01-01T00:00:00", [1]], [1, 2], ["ontem", 1]):
+            with self.subTest(values=values), self.assertRaises(InvalidCursor):
+                decode_cursor(encode_cursor(values), 2, coercers)
+        created_at, pk = decode_cursor(encode_cursor(["2026-01-01T00:00:00", "7"]), 2, coercers)
+        self.assertEqual((created_at.year, pk), (2026, 7))
+
+        page = KeysetPaginator(Organization.objects.all(), per_page=2).get_page(encode_cursor(["a", 1, "x"]))
+        self.assertEqual([p.name for p in page], ["Padaria 4", "Padaria 3"])
+
+    def test_estimate_count(self):
+        """Testa a contagem estimada (limitada quando não há estatística)."""
+        self.assertEqual(estimate_count(Organization.objects.all()), (5, False))
+        self.assertEqual(estimate_count(Organization.objects.all(), cap=3), (3, True))
@@ -0,0 +1,152 @@
+"""
+Registro de uso das API keys (last_used_at e usage_count) com escrita agrupada.
+
+Cada request autenticado apenas acumula o uso em memória no processo; uma
+thread em segundo plano grava o acumulado a cada API_KEY_USAGE_FLUSH_SECONDS
+com um único UPDATE ... CASE por lote de chaves. Assim as leituras da API não
+abrem transação de escrita (no SQLite, cada escrita serializa os workers).
+
+Limites de perda: se o worker morrer sem sair normalmente (SIGKILL, OOM,
+queda da máquina), perde-se o uso acumulado desde o último flush, ou seja,
+no máximo API_KEY_USAGE_FLUSH_SECONDS de last_used_at/usage_count por worker.
+Em saídas normais (restart do gunicorn, fim do processo) o acumulado é
+gravado pelo atexit. Se o flush falhar (banco indisponível), o acumulado
+volta para a memória e é tentado de novo no próximo ciclo.
+
+Com API_KEY_USAGE_FLUSH_SECONDS = 0 a gravação é imediata (útil em testes).
+"""
+import atexit
+import logging
+import os
+import threading
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, Value, F, DateTimeField, BigIntegerField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from organizations.models import ApiKey
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+def get_flush_interval():
+    return getattr(settings, "API_KEY_USAGE_FLUSH_SECONDS", 10)
+
+
+class ApiKeyUsageTracker:
+    """Acumula o uso das API keys em memória e grava em lote."""
+
+    def __init__(self):
+        self._pending = {}  # api_key_id -> [último uso, quantidade]
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        self._pid = os.getpid()
+
+    def record(self, api_key_id, when=None):
+        """Registra um uso da API key."""
+        when = when or timezone.now()
+        with self._lock:
+            self._reset_after_fork()
+            entry = self._pending.get(api_key_id)
+            if entry is None:
+                self._pending[api_key_id] = [when, 1]
+            else:
+                entry[0] = max(entry[0], when)
+                entry[1] += 1
+
+        interval = get_flush_interval()
+        if interval <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher(interval)
+
+    def _reset_after_fork(self):
+        # Workers criados por fork (gunicorn --preload) não herdam a thread
+        # nem o acumulado do processo pai
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = {}
+            self._flusher = None
+            self._stop = threading.Event()
+
+    def _ensure_flusher(self, interval):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._run, args=(interval,), name="api-key-usage-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            finally:
+                # Conexão própria da thread: não manter aberta entre flushes
+                connection.close()
+
+    def flush(self):
+        """Grava o uso acumulado. Retorna a quantidade de chaves atualizadas."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Erro ao gravar uso das API keys: {str(e)}")
+                self._restore(items[start:])
+                return start
+        return len(items)
+
+    def _write_batch(self, batch):
+        last_used = Case(
+            *[When(pk=pk, then=Value(when)) for pk, (when, _) in batch],
+            output_field=DateTimeField(),
+        )
+        increment = Case(
+            *[When(pk=pk, then=Value(count)) for pk, (_, count) in batch],
+            default=Value(0),
+            output_field=BigIntegerField(),
+        )
+        # Greatest: outro worker pode ter gravado um uso mais recente
+        ApiKey.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            last_used_at=Greatest(Coalesce(F("last_used_at"), last_used), last_used),
+            usage_count=F("usage_count") + increment,
+        )
+
+    def _restore(self, items):
+        with self._lock:
+            for pk, (when, count) in items:
+                entry = self._pending.get(pk)
+                if entry is None:
+                    self._pending[pk] = [when, count]
+                else:
+                    entry[0] = max(entry[0], when)
+                    entry[1] += count
+
+    def shutdown(self):
+        """Para a thread e grava o que estiver pendente (chamado no atexit)."""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Erro ao gravar uso das API keys na saída: {str(e)}")
+
+
+usage_tracker = ApiKeyUsageTracker()
+atexit.register(usage_tracker.shutdown)
+
+
+def record_api_key_usage(api_key):
+    """Registra o uso da API key (gravado em lote pelo usage_tracker)."""
+    usage_tracker.record(api_key.pk)
@@ -1,10 +1,41 @@
 """
 Utilidades e decorators de segurança para o projeto.
 """
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
 from django.http import JsonResponse
 from django.core.cache import cache
-from organizations.models import ApiKey
+from organizations.models import ApiKey, Padaria
+from .ratelimit import check_rate_limit, SlidingWindowLog
+from .usage import record_api_key_usage
+
+# Carimbo de versão (no cache compartilhado) do cache de API keys dos workers
+API_KEY_CACHE_VERSION_KEY = "api_key_cache_version"
+
+# Backends de cache que não são vistos pelos outros processos
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def ensure_shared_cache():
+    """
+    Com CACHE_REQUIRE_SHARED, recusa subir com um cache padrão local ao
+    processo: os snapshots da API e a invalidação das API keys entre os
+    workers dependem dele (ver settings).
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if getattr(settings, "CACHE_REQUIRE_SHARED", False) and backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f"CACHE_BACKEND={backend} não é compartilhado entre os workers: configure um cache "
+            "compartilhado (ex.: FileBasedCache ou Redis) ou CACHE_REQUIRE_SHARED=0 com um único worker."
+        )
 
 
 def get_client_ip(request):
@@ -17,6 +48,138 @@ def get_client_ip(request):
     return ip
 
 
+class ApiKeyCache:
+    """
+    Cache em memória (por processo) das API keys resolvidas, com TTL e LRU.
+    Guarda os campos da ApiKey e id/nome/slug/plano da padaria; chaves
+    inválidas ficam em cache por pouco tempo (negativo) para não martelar o
+    banco. Também é usado para os planos de cota (core.quotas).
+    
+    Alterações em ApiKey/Padaria/QuotaPlan trocam o carimbo de versão no cache
+    compartilhado (core.signals); cada processo confere o carimbo no máximo
+    uma vez por API_KEY_CACHE_CHECK_SECONDS e descarta tudo se ele mudou.
+    Isso só vale entre workers se o cache padrão for compartilhado: sem isso,
+    uma chave revogada segue aceita nos outros workers até API_KEY_CACHE_TTL
+    (ver ensure_shared_cache).
+    """
+    
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+    
+    def _check_version(self, now):
+        if now - self._checked_at < getattr(settings, "API_KEY_CACHE_CHECK_SECONDS", 1):
+            return
+        version = cache.get(API_KEY_CACHE_VERSION_KEY)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+    
+    def get(self, key):
+        """Retorna (encontrado, registro). Registro None = chave inválida em cache."""
+        now = time.monotonic()
+        self._check_version(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, record = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, record
+    
+    def set(self, key, record):
+        if record is None:
+            ttl = getattr(settings, "API_KEY_CACHE_NEGATIVE_TTL", 5)
+        else:
+            ttl = getattr(settings, "API_KEY_CACHE_TTL", 60)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, record)
+            self._entries.move_to_end(key)
+            while len(self._entries) > getattr(settings, "API_KEY_CACHE_SIZE", 1024):
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+api_key_cache = ApiKeyCache()
+
+API_KEY_FIELDS = [field.attname for field in ApiKey._meta.concrete_fields]
+PADARIA_FIELDS = ["id", "name", "slug", "quota_plan_id"]
+
+
+quota_plan_cache = ApiKeyCache()
+
+
+def invalidate_api_key_cache():
+    """Descarta as API keys (e planos de cota) em cache neste processo e nos demais workers."""
+    api_key_cache.clear()
+    quota_plan_cache.clear()
+    cache.set(API_KEY_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+def lookup_api_key(value):
+    """
+    Resolve uma API key ativa, usando o cache do processo.
+    Retorna uma instância de ApiKey (com a padaria carregada parcialmente:
+    id, nome, slug e plano; os demais campos são buscados sob demanda) ou None.
+    """
+    found, record = api_key_cache.get(value)
+    if not found:
+        row = ApiKey.objects.filter(key=value, is_active=True).values_list(
+            *API_KEY_FIELDS, *(f"padaria__{name}" for name in PADARIA_FIELDS[1:])
+        ).first()
+        record = tuple(row) if row else None
+        api_key_cache.set(value, record)
+    if record is None:
+        return None
+    
+    # Instâncias novas por request (o registro em cache é imutável)
+    values = record[:len(API_KEY_FIELDS)]
+    api_key = ApiKey.from_db(DEFAULT_DB_ALIAS, API_KEY_FIELDS, values)
+    padaria_values = (api_key.padaria_id, *record[len(API_KEY_FIELDS):])
+    api_key.padaria = Padaria.from_db(DEFAULT_DB_ALIAS, PADARIA_FIELDS, padaria_values)
+    return api_key
+
+
+def authenticate_api_key(request):
+    """
+    Valida a API key do request e anexa api_key/padaria a ele.
+    A chave pode vir via query param 'api_key' ou header 'X-API-Key'.
+    Retorna None em caso de sucesso ou a JsonResponse de erro (401).
+    """
+    # Tentar obter API key da query string ou header
+    api_key_value = request.GET.get('api_key') or request.META.get('HTTP_X_API_KEY')
+    
+    if not api_key_value:
+        return JsonResponse({
+            "error": "API key required. Provide via 'api_key' query param or 'X-API-Key' header."
+        }, status=401)
+    
+    # Validar API key (cache do processo)
+    api_key = lookup_api_key(api_key_value)
+    if api_key is None:
+        return JsonResponse({"error": "Invalid or inactive API key"}, status=401)
+    
+    # Uso da chave (last_used_at/usage_count) é gravado em lote, fora do request
+    record_api_key_usage(api_key)
+    
+    # Anexar API key e padaria ao request
+    request.api_key = api_key
+    request.padaria = api_key.padaria
+    # Alias para compatibilidade
+    request.organization = api_key.padaria
+    return None
+
+
 def require_api_key(view_func):
     """
     Decorator que exige autenticação via API key.
@@ -24,29 +187,9 @@ def require_api_key(view_func):
     """
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        # Tentar obter API key da query string ou header
-        api_key_value = request.GET.get('api_key') or request.META.get('HTTP_X_API_KEY')
-        
-        if not api_key_value:
-            return JsonResponse({
-                "error": "API key required. Provide via 'api_key' query param or 'X-API-Key' header."
-            }, status=401)
-        
-        # Validar API key
-        try:
-            api_key = ApiKey.objects.select_related('padaria').get(
-                key=api_key_value,
-                is_active=True
-            )
-        except ApiKey.DoesNotExist:
-            return JsonResponse({"error": "Invalid or inactive API key"}, status=401)
-        
-        # Anexar API key e padaria ao request
-        request.api_key = api_key
-        request.padaria = api_key.padaria
-        # Alias para compatibilidade
-        request.organization = api_key.padaria
-        
+        error = authenticate_api_key(request)
+        if error:
+            return error
         return view_func(request, *args, **kwargs)
     
     return wrapper
@@ -54,7 +197,8 @@ def require_api_key(view_func):
 
 def rate_limited(cache_key, limit=60, window_seconds=60):
     """
-    Implementa rate limiting simples usando cache.
+    Verifica e consome o limite de requisições (janela deslizante).
+    Atômico e compartilhado entre workers conforme RATE_LIMIT_BACKEND.
     
     Args:
         cache_key: Chave única para identificar o limitador
@@ -62,26 +206,21 @@ def rate_limited(cache_key, limit=60, window_seconds=60):
         window_seconds: Janela de tempo em segundos
     
     Returns:
-        bool: True se dentro do limite, False se excedeu
+        RateLimitResult: verdadeiro se dentro do limite, falso se excedeu
+        (com os headers X-RateLimit-* em .headers())
     """
-    # Obter contador atual
-    count = cache.get(cache_key, 0)
-    
-    if count >= limit:
-        return False
-    
-    # Incrementar contador
-    if count == 0:
-        # Primeira requisição na janela
-        cache.set(cache_key, 1, window_seconds)
-    else:
-        # Incrementar existente
-        cache.incr(cache_key)
-    
-    return True
+    return check_rate_limit(cache_key, SlidingWindowLog(limit, window_seconds))
 
 
-def rate_limit_decorator(limit=60, window_seconds=60, key_func=None):
+def rate_limit_response(result, message=None):
+    """Resposta 429 com Retry-After e headers X-RateLimit-*."""
+    response = JsonResponse({"error": message or "Rate limit exceeded"}, status=429)
+    for header, value in result.headers().items():
+        response[header] = value
+    return response
+
+
+def rate_limit_decorator(limit=60, window_seconds=60, key_func=None, algorithm=None):
     """
     Decorator para aplicar rate limiting em views.
     
@@ -89,7 +228,10 @@ def rate_limit_decorator(limit=60, window_seconds=60, key_func=None):
         limit: Número máximo de requisições
         window_seconds: Janela de tempo
         key_func: Função que retorna a chave do cache baseada no request
+        algorithm: TokenBucket/SlidingWindowLog (padrão: janela deslizante limit/window_seconds)
     """
+    algorithm = algorithm or SlidingWindowLog(limit, window_seconds)
+    
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
@@ -101,12 +243,16 @@ def rate_limit_decorator(limit=60, window_seconds=60, key_func=None):
                 cache_key = f"rate_limit_{get_client_ip(request)}"
             
             # Verificar rate limit
-            if not rate_limited(cache_key, limit, window_seconds):
-                return JsonResponse({
-                    "error": f"Rate limit exceeded. Max {limit} requests per {window_seconds} seconds."
-                }, status=429)
+            result = check_rate_limit(cache_key, algorithm)
+            if not result:
+                return rate_limit_response(
+                    result, f"Rate limit exceeded. Max {limit} requests per {window_seconds} seconds."
+                )
             
-            return view_func(request, *args, **kwargs)
+            response = view_func(request, *args, **kwargs)
+            for header, value in result.headers().items():
+                response[header] = value
+            return response
         
         return wrapper
     return decorator
@@ -30,6 +30,13 @@ python manage.py collectstatic --noinput
 # Reiniciar Gunicorn
 echo "🔄 Reiniciando Gunicorn..."
 sudo systemctl restart gunicorn
+sudo systemctl restart gunicorn-asgi
+# Drain da fila dos webhooks e outbox do n8n (se instalados, ver DEPLOY_GUIDE 8.11 e 8.12)
+for service in webhook-drain outbox; do
+    if systemctl list-unit-files "$service.service" | grep -q "$service"; then
+        sudo systemctl restart "$service"
+    fi
+done
 
 # Verificar status
 echo "✅ Verificando status..."
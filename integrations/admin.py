@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import N8nConfig
+from django.utils import timezone
+from .models import N8nConfig, OutboundDelivery
 
 
 @admin.register(N8nConfig)
@@ -8,3 +9,24 @@ class N8nConfigAdmin(admin.ModelAdmin):
     search_fields = ("padaria__name",)
     list_filter = ("enabled", "created_at")
 
+
+@admin.register(OutboundDelivery)
+class OutboundDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "kind", "destination", "status", "attempts", "next_attempt_at", "last_status_code")
+    list_filter = ("status", "kind", "destination")
+    search_fields = ("url", "last_error")
+    readonly_fields = (
+        "padaria", "url", "destination", "kind", "payload", "status", "attempts", "next_attempt_at",
+        "locked_until", "last_status_code", "last_error", "created_at", "delivered_at",
+    )
+    actions = ("retry_deliveries",)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(description="Reenviar (voltar para a fila)")
+    def retry_deliveries(self, request, queryset):
+        count = queryset.exclude(status=OutboundDelivery.STATUS_IN_PROGRESS).update(
+            status=OutboundDelivery.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{count} entrega(s) devolvida(s) à fila.")
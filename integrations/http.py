@@ -0,0 +1,157 @@
+"""
+Cliente HTTP de saída (n8n e demais webhooks externos).
+
+Uma requests.Session por host (e por processo), com keep-alive: as entregas
+seguintes para o mesmo destino reaproveitam a conexão TCP/TLS. O pool de cada
+host tem OUTBOUND_HTTP_POOL_SIZE conexões e bloqueia acima disso, o que também
+limita as requisições simultâneas por destino.
+
+Configuração por destino (host da URL, vale para Agent.n8n_webhook_url e
+N8nConfig.webhook_url): OUTBOUND_HTTP_DESTINATIONS = {host: {"pool_size": n,
+"timeout": segundos}}; os hosts ausentes usam OUTBOUND_HTTP_POOL_SIZE e
+OUTBOUND_HTTP_TIMEOUT. A conexão tem OUTBOUND_HTTP_CONNECT_TIMEOUT.
+
+Métricas por destino (memória do processo, ver `stats`): total de
+requisições, histograma de latência e erros por tipo (timeout, conexão,
+4xx, 5xx, outros).
+"""
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# Limites superiores (ms) das faixas do histograma de latência
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def destination_for(url):
+    return urlsplit(url).netloc.lower()
+
+
+class DestinationStats:
+    """Contadores de um destino: requisições, histograma de latência e erros."""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.errors = Counter()
+
+    def observe(self, elapsed_ms, error=None):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        index = next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= limit), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+        if error:
+            self.errors[error] += 1
+
+    def quantile(self, q):
+        """Limite superior da faixa que contém o quantil (None acima da última faixa)."""
+        target = q * self.requests
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+    def snapshot(self):
+        labels = [f"<={limit}" for limit in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "requests": self.requests,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "latency_ms": dict(zip(labels, self.buckets)),
+            "errors": dict(self.errors),
+        }
+
+
+class OutboundHttpClient:
+    """Sessions por host com keep-alive e métricas por destino (ver o docstring do módulo)."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def destination_config(self, destination):
+        config = getattr(settings, "OUTBOUND_HTTP_DESTINATIONS", {}).get(destination, {})
+        return {
+            "pool_size": config.get("pool_size", getattr(settings, "OUTBOUND_HTTP_POOL_SIZE", 4)),
+            "timeout": config.get("timeout", getattr(settings, "OUTBOUND_HTTP_TIMEOUT", 10)),
+        }
+
+    def session(self, destination):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processo novo (fork): conexões do pai não são reaproveitadas
+                self._sessions = {}
+                self._stats = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(destination)
+            if session is None:
+                pool_size = self.destination_config(destination)["pool_size"]
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[destination] = session
+            return session
+
+    def request(self, method, url, **kwargs):
+        destination = destination_for(url)
+        session = self.session(destination)
+        kwargs.setdefault("timeout", (
+            getattr(settings, "OUTBOUND_HTTP_CONNECT_TIMEOUT", 3),
+            self.destination_config(destination)["timeout"],
+        ))
+        error = None
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.Timeout:
+            error = "timeout"
+            raise
+        except requests.exceptions.ConnectionError:
+            error = "connection"
+            raise
+        except Exception:
+            error = "other"
+            raise
+        else:
+            if response.status_code >= 500:
+                error = "5xx"
+            elif response.status_code >= 400:
+                error = "4xx"
+            return response
+        finally:
+            self._observe(destination, (time.monotonic() - start) * 1000, error)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def _observe(self, destination, elapsed_ms, error):
+        with self._lock:
+            self._stats.setdefault(destination, DestinationStats()).observe(elapsed_ms, error)
+
+    def stats(self):
+        """{destino: métricas} deste processo."""
+        with self._lock:
+            return {destination: stats.snapshot() for destination, stats in self._stats.items()}
+
+    def close(self):
+        """Fecha as conexões e zera as métricas."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+            self._stats = {}
+
+
+http_client = OutboundHttpClient()
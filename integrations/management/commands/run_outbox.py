@@ -0,0 +1,61 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from integrations.http import http_client
+from integrations.outbox import run, retry_dead
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrega as notificações pendentes para o n8n (outbox), com novas tentativas, "
+        "backoff e limite de envios simultâneos por destino."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Envios em paralelo (padrão: 4)")
+        parser.add_argument("--poll", type=float, default=1.0, help="Espera sem entregas vencidas, em segundos")
+        parser.add_argument("--once", action="store_true", help="Entrega as vencidas e termina")
+        parser.add_argument(
+            "--stats-interval",
+            type=float,
+            default=300,
+            help="Intervalo entre as métricas por destino (latência e erros), em segundos; 0 desliga",
+        )
+        parser.add_argument(
+            "--retry-dead",
+            action="store_true",
+            help="Devolve à fila as entregas em dead letter antes de começar",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_dead"]:
+            count = retry_dead()
+            self.stdout.write(f"{count} entrega(s) em dead letter devolvida(s) à fila.")
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        if options["stats_interval"] and not options["once"]:
+            threading.Thread(
+                target=self.report_stats, args=(stop, options["stats_interval"]), name="outbox-stats", daemon=True
+            ).start()
+        try:
+            totals = run(workers=options["workers"], once=options["once"], poll=options["poll"], stop=stop)
+        except KeyboardInterrupt:
+            totals = {}
+        stop.set()
+
+        self.write_stats()
+        summary = ", ".join(f"{status}: {total}" for status, total in sorted(totals.items())) or "nenhuma entrega"
+        self.stdout.write(self.style.SUCCESS(f"Outbox: {summary}."))
+
+    def report_stats(self, stop, interval):
+        while not stop.wait(interval):
+            self.write_stats()
+
+    def write_stats(self):
+        for destination, stats in sorted(http_client.stats().items()):
+            errors = ", ".join(f"{kind}: {total}" for kind, total in sorted(stats["errors"].items())) or "nenhum"
+            self.stdout.write(
+                f"{destination}: {stats['requests']} requisição(ões), média {stats['avg_ms']} ms, "
+                f"p50 <= {stats['p50_ms']} ms, p95 <= {stats['p95_ms']} ms; erros: {errors}"
+            )
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0001_initial'),
+        ('organizations', '0004_quotaplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, verbose_name='URL')),
+                ('destination', models.CharField(help_text='Host da URL (limite de envios simultâneos por destino)', max_length=255, verbose_name='Destino')),
+                ('kind', models.CharField(choices=[('json', 'JSON'), ('agent_pdf', 'PDF do agente')], default='json', max_length=20, verbose_name='Tipo')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('in_progress', 'Enviando'), ('delivered', 'Entregue'), ('dead', 'Falhou (dead letter)')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Reservado até')),
+                ('last_status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Último status HTTP')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Entregue em')),
+                ('padaria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbound_deliveries', to='organizations.padaria', verbose_name='Padaria')),
+            ],
+            options={
+                'verbose_name': 'Entrega para o n8n',
+                'verbose_name_plural': 'Entregas para o n8n',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='integration_status_25f1a5_idx'), models.Index(fields=['destination', 'status'], name='integration_destina_a7ccdb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0002_outbounddelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbounddelivery',
+            name='coalesce_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Notificações pendentes com a mesma chave viram uma só entrega', max_length=100, verbose_name='Chave de agrupamento'),
+        ),
+    ]
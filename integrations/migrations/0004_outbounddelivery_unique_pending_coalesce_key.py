@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0003_outbounddelivery_coalesce_key'),
+        ('organizations', '0004_quotaplan'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='outbounddelivery',
+            constraint=models.UniqueConstraint(condition=models.Q(('attempts', 0), ('status', 'pending'), models.Q(('coalesce_key', ''), _negated=True)), fields=('coalesce_key',), name='unique_pending_coalesce_key'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from organizations.models import Padaria
 
 
@@ -38,3 +39,80 @@ class N8nConfig(models.Model):
 
     def __str__(self):
         return f"n8n Config - {self.padaria.name}"
+
+
+class OutboundDelivery(models.Model):
+    """
+    Notificação de saída para o n8n (outbox). Criada na mesma transação da
+    alteração que a gerou e entregue depois pelo comando run_outbox, com
+    novas tentativas (ver integrations.outbox).
+    """
+    KIND_JSON = "json"
+    KIND_AGENT_PDF = "agent_pdf"
+    KIND_CHOICES = [
+        (KIND_JSON, "JSON"),
+        (KIND_AGENT_PDF, "PDF do agente"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_IN_PROGRESS = "in_progress"
+    STATUS_DELIVERED = "delivered"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pendente"),
+        (STATUS_IN_PROGRESS, "Enviando"),
+        (STATUS_DELIVERED, "Entregue"),
+        (STATUS_DEAD, "Falhou (dead letter)"),
+    ]
+
+    padaria = models.ForeignKey(
+        Padaria,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="outbound_deliveries",
+        verbose_name="Padaria"
+    )
+    url = models.URLField(max_length=500, verbose_name="URL")
+    destination = models.CharField(
+        max_length=255,
+        verbose_name="Destino",
+        help_text="Host da URL (limite de envios simultâneos por destino)"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_JSON, verbose_name="Tipo")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Payload")
+    coalesce_key = models.CharField(
+        max_length=100,
+        blank=True,
+        db_index=True,
+        verbose_name="Chave de agrupamento",
+        help_text="Notificações pendentes com a mesma chave viram uma só entrega"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próxima tentativa")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="Reservado até")
+    last_status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Último status HTTP")
+    last_error = models.TextField(blank=True, verbose_name="Último erro")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Entregue em")
+
+    class Meta:
+        verbose_name = "Entrega para o n8n"
+        verbose_name_plural = "Entregas para o n8n"
+        ordering = ["-created_at"]
+        constraints = [
+            # Uma única entrega agrupável por chave (pendente e ainda não tentada)
+            models.UniqueConstraint(
+                fields=["coalesce_key"],
+                condition=models.Q(status="pending", attempts=0) & ~models.Q(coalesce_key=""),
+                name="unique_pending_coalesce_key",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["destination", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} -> {self.destination} ({self.get_status_display()})"
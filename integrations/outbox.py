@@ -0,0 +1,256 @@
+"""
+Outbox das notificações para o n8n.
+
+As views e signals não chamam o n8n: `enqueue` cria uma OutboundDelivery na
+mesma transação da alteração (se a transação for desfeita, a notificação
+também é) e o save volta na hora, esteja o n8n de pé ou não.
+
+`python manage.py run_outbox` entrega as pendentes com um pool de threads:
+    - no máximo OUTBOX_MAX_PER_DESTINATION envios simultâneos por host;
+    - falhas (erro de rede, timeout, 5xx, 408, 429) são tentadas de novo com
+      backoff exponencial e jitter: metade de min(OUTBOX_BACKOFF_MAX,
+      OUTBOX_BACKOFF_BASE * 2^(tentativas-1)) fixa, a outra metade aleatória;
+    - depois de OUTBOX_MAX_ATTEMPTS tentativas, ou num erro que não melhora
+      com nova tentativa (outros 4xx, agente ou PDF removido), a entrega vai
+      para o estado "dead" (dead letter), visível no admin e reenviável com
+      `run_outbox --retry-dead`.
+
+Agrupamento: com `coalesce_key`, uma nova notificação substitui a pendente de
+mesma chave (ainda não tentada) em vez de criar outra, e só fica disponível
+OUTBOX_COALESCE_SECONDS depois da primeira: saves repetidos do mesmo agente
+nesse intervalo viram uma única entrega, com o payload mais recente. Uma
+constraint única garante uma só entrega agrupável por chave mesmo com saves
+simultâneos; por isso as entregas que voltam à fila depois de reservadas
+contam a tentativa (reserva vencida) ou perdem a chave (dead letter reenviada).
+
+Cada entrega reservada fica "in_progress" por OUTBOX_LEASE_SECONDS; se o
+dispatcher morrer no meio, ela volta a "pending" quando a reserva vence.
+"""
+import logging
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .http import http_client, destination_for
+from .models import OutboundDelivery
+
+logger = logging.getLogger(__name__)
+
+# Status HTTP que valem nova tentativa (além de 5xx)
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+class PermanentError(Exception):
+    """Falha que não melhora com nova tentativa: a entrega vai direto para dead letter."""
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(url, payload=None, kind=OutboundDelivery.KIND_JSON, padaria_id=None, coalesce_key=""):
+    """
+    Agenda uma notificação (grava na transação corrente). Com coalesce_key,
+    atualiza a pendente de mesma chave, se houver (ver o docstring do
+    módulo). Retorna a OutboundDelivery.
+    """
+    fields = {
+        "padaria_id": padaria_id,
+        "url": url,
+        "destination": destination_for(url),
+        "kind": kind,
+        "payload": payload or {},
+    }
+    if not coalesce_key:
+        return OutboundDelivery.objects.create(**fields)
+
+    for _ in range(3):
+        pending = OutboundDelivery.objects.filter(
+            coalesce_key=coalesce_key, status=OutboundDelivery.STATUS_PENDING, attempts=0
+        ).first()
+        # UPDATE condicional: se o dispatcher reservou a entrega no meio tempo, cria outra
+        if pending is not None and OutboundDelivery.objects.filter(
+            pk=pending.pk, status=OutboundDelivery.STATUS_PENDING
+        ).update(**fields):
+            for name, value in fields.items():
+                setattr(pending, name, value)
+            return pending
+        try:
+            with transaction.atomic():
+                return OutboundDelivery.objects.create(
+                    coalesce_key=coalesce_key,
+                    next_attempt_at=timezone.now() + timedelta(seconds=get_setting("OUTBOX_COALESCE_SECONDS", 30)),
+                    **fields,
+                )
+        except IntegrityError:
+            # Outro save criou a entrega da mesma chave ao mesmo tempo: atualizar essa
+            continue
+    raise IntegrityError(f"Não foi possível agrupar a entrega {coalesce_key!r}")
+
+
+def backoff_delay(attempts):
+    """Espera (segundos) antes da próxima tentativa, com jitter."""
+    delay = min(get_setting("OUTBOX_BACKOFF_MAX", 3600), get_setting("OUTBOX_BACKOFF_BASE", 10) * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def release_expired():
+    """
+    Devolve à fila as entregas cuja reserva venceu (dispatcher interrompido).
+    A tentativa interrompida conta: a entrega não volta a ser agrupável.
+    """
+    return OutboundDelivery.objects.filter(
+        status=OutboundDelivery.STATUS_IN_PROGRESS, locked_until__lt=timezone.now()
+    ).update(status=OutboundDelivery.STATUS_PENDING, locked_until=None, attempts=F("attempts") + 1)
+
+
+def claim(limit):
+    """
+    Reserva até `limit` entregas vencidas, respeitando o limite de envios
+    simultâneos por destino. A reserva é um UPDATE condicional, então vários
+    dispatchers podem rodar ao mesmo tempo.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    max_per_destination = get_setting("OUTBOX_MAX_PER_DESTINATION", 2)
+    busy = Counter(dict(
+        OutboundDelivery.objects.filter(status=OutboundDelivery.STATUS_IN_PROGRESS)
+        .values_list("destination").annotate(total=Count("id")).order_by()
+    ))
+    candidates = (
+        OutboundDelivery.objects.filter(status=OutboundDelivery.STATUS_PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")[:limit * 4]
+    )
+    locked_until = now + timedelta(seconds=get_setting("OUTBOX_LEASE_SECONDS", 300))
+    claimed = []
+    for delivery in candidates:
+        if busy[delivery.destination] >= max_per_destination:
+            continue
+        updated = OutboundDelivery.objects.filter(pk=delivery.pk, status=OutboundDelivery.STATUS_PENDING).update(
+            status=OutboundDelivery.STATUS_IN_PROGRESS, locked_until=locked_until
+        )
+        if not updated:
+            # Outro dispatcher pegou antes
+            continue
+        delivery.status = OutboundDelivery.STATUS_IN_PROGRESS
+        delivery.locked_until = locked_until
+        busy[delivery.destination] += 1
+        claimed.append(delivery)
+        if len(claimed) >= limit:
+            break
+    return claimed
+
+
+def send(delivery):
+    """Faz a requisição da entrega (cliente HTTP compartilhado, integrations.http). Retorna a resposta."""
+    if delivery.kind == OutboundDelivery.KIND_AGENT_PDF:
+        from agents.models import Agent
+
+        agent = Agent.objects.filter(pk=delivery.payload.get("agent_id")).first()
+        if agent is None or not agent.knowledge_pdf:
+            raise PermanentError("Agente ou PDF não existe mais")
+        # O PDF é lido na hora do envio: vai a versão atual
+        with agent.knowledge_pdf.open("rb") as pdf_file:
+            return http_client.post(
+                delivery.url,
+                files={"file": (agent.knowledge_pdf.name, pdf_file, "application/pdf")},
+                data={"agent_slug": agent.slug, "agent_name": agent.name},
+            )
+    return http_client.post(delivery.url, json=delivery.payload)
+
+
+def deliver(delivery):
+    """Envia uma entrega reservada e grava o resultado. Retorna o status final."""
+    status_code = None
+    permanent = False
+    try:
+        response = send(delivery)
+        status_code = response.status_code
+        error = "" if 200 <= status_code < 300 else f"HTTP {status_code}"
+        permanent = 400 <= status_code < 500 and status_code not in RETRYABLE_STATUS
+    except PermanentError as e:
+        error = str(e)
+        permanent = True
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+
+    return _record_result(delivery, status_code, error, permanent)
+
+
+def _deliver_in_thread(delivery):
+    try:
+        return deliver(delivery)
+    finally:
+        # Threads do pool: não deixar conexões abertas entre entregas
+        connection.close()
+
+
+def _record_result(delivery, status_code, error, permanent):
+    now = timezone.now()
+    delivery.attempts += 1
+    delivery.last_status_code = status_code
+    delivery.last_error = error[:2000]
+    delivery.locked_until = None
+    if not error:
+        delivery.status = OutboundDelivery.STATUS_DELIVERED
+        delivery.delivered_at = now
+    elif permanent or delivery.attempts >= get_setting("OUTBOX_MAX_ATTEMPTS", 8):
+        delivery.status = OutboundDelivery.STATUS_DEAD
+        logger.error(f"Entrega {delivery.pk} para {delivery.destination} falhou de vez: {error}")
+    else:
+        delivery.status = OutboundDelivery.STATUS_PENDING
+        delivery.next_attempt_at = now + timedelta(seconds=backoff_delay(delivery.attempts))
+        logger.warning(f"Entrega {delivery.pk} para {delivery.destination} falhou ({error}); nova tentativa agendada")
+    delivery.save(update_fields=[
+        "attempts", "last_status_code", "last_error", "locked_until", "status", "delivered_at", "next_attempt_at",
+    ])
+    return delivery.status
+
+
+def retry_dead(**filters):
+    """
+    Devolve entregas em dead letter à fila. Retorna quantas. Elas perdem a
+    coalesce_key: com attempts zerado, colidiriam com a pendente da mesma chave.
+    """
+    return OutboundDelivery.objects.filter(status=OutboundDelivery.STATUS_DEAD, **filters).update(
+        status=OutboundDelivery.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(), coalesce_key=""
+    )
+
+
+def run(workers=4, once=False, poll=1.0, stop=None):
+    """
+    Laço do dispatcher: reserva entregas conforme há threads livres e as
+    envia em paralelo. Com once=True termina quando não há mais entregas
+    vencidas. Retorna {status: total} das entregas processadas.
+    """
+    stop = stop or threading.Event()
+    totals = Counter()
+    running = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox") as executor:
+        while not stop.is_set():
+            release_expired()
+            for delivery in claim(workers - len(running)):
+                running.add(executor.submit(_deliver_in_thread, delivery))
+            if not running:
+                if once:
+                    break
+                stop.wait(poll)
+                continue
+            done, running = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    totals[future.result()] += 1
+                except Exception as e:
+                    logger.error(f"Erro no dispatcher do outbox: {str(e)}")
+        for future in wait(running).done:
+            try:
+                totals[future.result()] += 1
+            except Exception as e:
+                logger.error(f"Erro no dispatcher do outbox: {str(e)}")
+    return dict(totals)
@@ -0,0 +1,230 @@
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+import requests
+from django.contrib.auth.models import User
+from django.db.models.query import QuerySet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from agents.models import Agent
+from organizations.models import Organization
+from .http import OutboundHttpClient
+from .models import OutboundDelivery
+from .outbox import claim, deliver, enqueue, release_expired, retry_dead
+
+
+@override_settings(
+    OUTBOX_MAX_ATTEMPTS=3, OUTBOX_BACKOFF_BASE=10, OUTBOX_MAX_PER_DESTINATION=2, OUTBOX_COALESCE_SECONDS=0
+)
+class OutboxTest(TestCase):
+    """Testes do outbox de notificações ao n8n."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.organization = Organization.objects.create(name="Test Org", owner=self.user)
+    
+    def _response(self, status_code):
+        return mock.Mock(status_code=status_code)
+    
+    def test_deliver_success(self):
+        """Entrega com 2xx fica como entregue."""
+        delivery = enqueue("https://n8n.example.com/webhook/memoria", {"agent_id": 1})
+        self.assertEqual(delivery.destination, "n8n.example.com")
+        
+        with mock.patch("integrations.outbox.http_client.post", return_value=self._response(200)) as post:
+            self.assertEqual(deliver(claim(10)[0]), OutboundDelivery.STATUS_DELIVERED)
+        
+        post.assert_called_once()
+        self.assertEqual(post.call_args.kwargs["json"], {"agent_id": 1})
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), (OutboundDelivery.STATUS_DELIVERED, 1))
+        self.assertIsNotNone(delivery.delivered_at)
+    
+    def test_retry_with_backoff_then_dead_letter(self):
+        """5xx/erro de rede: nova tentativa com backoff; após o máximo, dead letter."""
+        delivery = enqueue("https://n8n.example.com/webhook/memoria", {})
+        
+        with mock.patch("integrations.outbox.http_client.post", return_value=self._response(503)):
+            before = timezone.now()
+            self.assertEqual(deliver(claim(10)[0]), OutboundDelivery.STATUS_PENDING)
+        delivery.refresh_from_db()
+        # Primeira espera: entre 5 e 10 segundos (metade fixa + jitter)
+        self.assertGreaterEqual(delivery.next_attempt_at, before + timedelta(seconds=5))
+        self.assertLessEqual(delivery.next_attempt_at, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(claim(10), [])  # ainda não venceu
+        
+        refused = requests.exceptions.ConnectionError("refused")
+        with mock.patch("integrations.outbox.http_client.post", side_effect=refused):
+            for expected in (OutboundDelivery.STATUS_PENDING, OutboundDelivery.STATUS_DEAD):
+                OutboundDelivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+                self.assertEqual(deliver(claim(10)[0]), expected)
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.attempts, 3)
+        self.assertIn("refused", delivery.last_error)
+        
+        self.assertEqual(retry_dead(), 1)
+        self.assertEqual(len(claim(10)), 1)
+    
+    def test_client_error_goes_to_dead_letter(self):
+        """4xx (exceto 408/429) não melhora com nova tentativa."""
+        enqueue("https://n8n.example.com/webhook/memoria", {})
+        with mock.patch("integrations.outbox.http_client.post", return_value=self._response(404)):
+            self.assertEqual(deliver(claim(10)[0]), OutboundDelivery.STATUS_DEAD)
+    
+    def test_claim_respects_per_destination_limit(self):
+        """No máximo OUTBOX_MAX_PER_DESTINATION envios simultâneos por host."""
+        for _ in range(3):
+            enqueue("https://a.example.com/hook", {})
+        enqueue("https://b.example.com/hook", {})
+        
+        claimed = claim(10)
+        
+        self.assertEqual(sorted(delivery.destination for delivery in claimed), ["a.example.com", "a.example.com", "b.example.com"])
+        self.assertEqual(claim(10), [])
+    
+    def test_agent_save_enqueues_pdf_upload(self):
+        """Salvar um agente com PDF e webhook agenda o envio, sem chamar o n8n no save."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root), mock.patch("integrations.outbox.http_client.post") as post:
+            agent = Agent.objects.create(
+                padaria=self.organization,
+                name="Test Agent",
+                n8n_webhook_url="https://n8n.example.com/webhook/pdf",
+                knowledge_pdf=SimpleUploadedFile("base.pdf", b"%PDF-1.4", content_type="application/pdf"),
+            )
+            post.assert_not_called()
+            
+            delivery = OutboundDelivery.objects.get()
+            self.assertEqual(delivery.kind, OutboundDelivery.KIND_AGENT_PDF)
+            self.assertEqual(delivery.payload["agent_id"], agent.id)
+            
+            post.return_value = self._response(200)
+            self.assertEqual(deliver(claim(10)[0]), OutboundDelivery.STATUS_DELIVERED)
+            self.assertEqual(post.call_args.kwargs["data"]["agent_slug"], agent.slug)
+    
+    @override_settings(OUTBOX_COALESCE_SECONDS=30)
+    def test_enqueue_coalesces_pending_delivery(self):
+        """Mesma coalesce_key: atualiza a entrega pendente; depois de reservada, cria outra."""
+        before = timezone.now()
+        first = enqueue("https://n8n.example.com/webhook/memoria", {"version": 1}, coalesce_key="memory:1")
+        second = enqueue("https://n8n.example.com/webhook/memoria", {"version": 2}, coalesce_key="memory:1")
+        enqueue("https://n8n.example.com/webhook/memoria", {"version": 1}, coalesce_key="memory:2")
+        
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(OutboundDelivery.objects.count(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.payload, {"version": 2})
+        self.assertGreaterEqual(first.next_attempt_at, before + timedelta(seconds=30))
+        self.assertEqual(claim(10), [])  # janela de agrupamento ainda aberta
+        
+        OutboundDelivery.objects.update(next_attempt_at=timezone.now())
+        claim(10)
+        third = enqueue("https://n8n.example.com/webhook/memoria", {"version": 3}, coalesce_key="memory:1")
+        self.assertNotEqual(third.pk, first.pk)
+    
+    def test_concurrent_enqueue_keeps_one_pending_delivery(self):
+        """Dois saves simultâneos da mesma chave: a constraint barra a segunda e ela atualiza a primeira."""
+        url = "https://n8n.example.com/webhook/memoria"
+        first = enqueue(url, {"version": 1}, coalesce_key="memory:1")
+        # Simula o outro save: a busca não enxerga a pendente, o INSERT colide
+        lookups = [None]
+        real_first = QuerySet.first
+        with mock.patch.object(QuerySet, "first", lambda qs: lookups.pop() if lookups else real_first(qs)):
+            second = enqueue(url, {"version": 2}, coalesce_key="memory:1")
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(OutboundDelivery.objects.get().payload, {"version": 2})
+        
+        # Entregas devolvidas à fila não colidem com a nova pendente da mesma chave
+        OutboundDelivery.objects.update(next_attempt_at=timezone.now())
+        claim(10)
+        OutboundDelivery.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        third = enqueue(url, {"version": 3}, coalesce_key="memory:1")
+        self.assertEqual(release_expired(), 1)
+        OutboundDelivery.objects.filter(pk=first.pk).update(status=OutboundDelivery.STATUS_DEAD)
+        self.assertEqual(retry_dead(), 1)
+        first.refresh_from_db()
+        self.assertEqual((first.attempts, first.coalesce_key), (0, ""))
+        self.assertEqual(enqueue(url, {"version": 4}, coalesce_key="memory:1").pk, third.pk)
+    
+    def test_agent_pdf_upload_enqueued_only_when_content_changes(self):
+        """Saves sem mudança no PDF não agendam envio; o mesmo PDF enviado de novo também não."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            agent = Agent.objects.create(
+                padaria=self.organization,
+                name="Test Agent",
+                n8n_webhook_url="https://n8n.example.com/webhook/pdf",
+                knowledge_pdf=SimpleUploadedFile("base.pdf", b"%PDF-1.4 v1", content_type="application/pdf"),
+            )
+            self.assertEqual(OutboundDelivery.objects.count(), 1)
+            
+            agent.greeting = "Oi! Tudo bem?"
+            agent.save()
+            agent.knowledge_pdf = SimpleUploadedFile("base.pdf", b"%PDF-1.4 v1", content_type="application/pdf")
+            agent.save()
+            self.assertEqual(OutboundDelivery.objects.count(), 1)
+            
+            # PDF novo com a entrega anterior ainda pendente: agrupado na mesma entrega
+            agent.knowledge_pdf = SimpleUploadedFile("base.pdf", b"%PDF-1.4 v2", content_type="application/pdf")
+            agent.save()
+            self.assertEqual(OutboundDelivery.objects.count(), 1)
+            
+            claim(10)
+            agent.knowledge_pdf = SimpleUploadedFile("base.pdf", b"%PDF-1.4 v3", content_type="application/pdf")
+            agent.save()
+            self.assertEqual(OutboundDelivery.objects.filter(status=OutboundDelivery.STATUS_PENDING).count(), 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.peers.append(self.client_address)
+        status = 200 if self.path == "/ok" else 500
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+class OutboundHttpClientTest(SimpleTestCase):
+    """Testes do cliente HTTP de saída (keep-alive e métricas por destino)."""
+    
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.peers = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.client = OutboundHttpClient()
+        self.addCleanup(self.client.close)
+    
+    def test_reuses_connection_and_records_stats(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post(f"{self.base_url}/ok", json={}).status_code, 200)
+        self.assertEqual(self.client.post(f"{self.base_url}/fail", json={}).status_code, 500)
+        
+        # Mesma conexão (mesma porta de origem) para todas as requisições
+        self.assertEqual(len(set(self.server.peers)), 1)
+        
+        stats = self.client.stats()[f"127.0.0.1:{self.server.server_port}"]
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["errors"], {"5xx": 1})
+        self.assertEqual(sum(stats["latency_ms"].values()), 4)
+    
+    def test_connection_error_is_recorded(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post(f"{self.base_url}/ok", json={})
+        self.assertEqual(self.client.stats()[f"127.0.0.1:{self.server.server_port}"]["errors"], {"connection": 1})
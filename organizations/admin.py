@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Padaria, PadariaUser, ApiKey
+from .models import Padaria, PadariaUser, ApiKey, QuotaPlan
 
 
 class PadariaUserInline(admin.TabularInline):
@@ -11,8 +11,8 @@ class PadariaUserInline(admin.TabularInline):
 class ApiKeyInline(admin.TabularInline):
     model = ApiKey
     extra = 0
-    readonly_fields = ['key', 'created_at', 'last_used_at']
-    fields = ['key', 'agent', 'name', 'is_active', 'created_at', 'last_used_at']
+    readonly_fields = ['key', 'created_at', 'last_used_at', 'usage_count']
+    fields = ['key', 'agent', 'name', 'quota_plan', 'is_active', 'created_at', 'last_used_at', 'usage_count']
     autocomplete_fields = ['agent']
 
 
@@ -27,7 +27,7 @@ class PadariaAdmin(admin.ModelAdmin):
     
     fieldsets = (
         (None, {
-            'fields': ('name', 'slug', 'owner', 'is_active')
+            'fields': ('name', 'slug', 'owner', 'is_active', 'quota_plan')
         }),
         ('Contato', {
             'fields': ('phone', 'email', 'address'),
@@ -50,12 +50,22 @@ class PadariaUserAdmin(admin.ModelAdmin):
 
 @admin.register(ApiKey)
 class ApiKeyAdmin(admin.ModelAdmin):
-    list_display = ['padaria', 'agent', 'name', 'key_preview', 'is_active', 'last_used_at']
-    list_filter = ['is_active', 'padaria', 'agent']
+    list_display = ['padaria', 'agent', 'name', 'key_preview', 'is_active', 'last_used_at', 'usage_count']
+    list_filter = ['is_active', 'padaria', 'agent', 'quota_plan']
     search_fields = ['padaria__name', 'agent__name', 'name']
-    readonly_fields = ['key', 'created_at', 'last_used_at']
+    readonly_fields = ['key', 'created_at', 'last_used_at', 'usage_count']
     autocomplete_fields = ['agent']
     
     def key_preview(self, obj):
         return f"{obj.key[:12]}..."
     key_preview.short_description = "Chave"
+
+
+@admin.register(QuotaPlan)
+class QuotaPlanAdmin(admin.ModelAdmin):
+    list_display = [
+        'name', 'requests_per_second', 'burst', 'requests_per_minute', 'requests_per_day',
+        'knowledge_per_minute', 'webhook_per_minute'
+    ]
+    search_fields = ['name']
+    readonly_fields = ['created_at', 'updated_at']
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0002_add_agent_to_apikey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='usage_count',
+            field=models.PositiveBigIntegerField(default=0, help_text='Total de requisições autenticadas com esta chave (gravado em lote)', verbose_name='Requisições'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0003_apikey_usage_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Nome')),
+                ('requests_per_second', models.PositiveIntegerField(default=10, help_text='Taxa sustentada (por worker)', verbose_name='Requisições por segundo')),
+                ('burst', models.PositiveIntegerField(default=20, help_text='Requisições seguidas permitidas acima da taxa por segundo', verbose_name='Rajada')),
+                ('requests_per_minute', models.PositiveIntegerField(default=300, verbose_name='Requisições por minuto')),
+                ('requests_per_day', models.PositiveIntegerField(default=50000, verbose_name='Requisições por dia')),
+                ('knowledge_per_minute', models.PositiveIntegerField(default=60, help_text='Orçamento separado para os endpoints de conhecimento (busca, chunks, contexto)', verbose_name='Conhecimento por minuto')),
+                ('webhook_per_minute', models.PositiveIntegerField(default=600, help_text='Orçamento separado para os eventos recebidos via webhook', verbose_name='Webhooks por minuto')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Plano de Cota',
+                'verbose_name_plural': 'Planos de Cota',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='quota_plan',
+            field=models.ForeignKey(blank=True, help_text='Se definido, substitui o plano da padaria e a cota é contada só para esta chave', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='api_keys', to='organizations.quotaplan', verbose_name='Plano de Cota'),
+        ),
+        migrations.AddField(
+            model_name='padaria',
+            name='quota_plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='padarias', to='organizations.quotaplan', verbose_name='Plano de Cota'),
+        ),
+    ]
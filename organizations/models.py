@@ -4,6 +4,47 @@ from django.contrib.auth.models import User
 from django.utils.text import slugify
 
 
+class QuotaPlan(models.Model):
+    """
+    Plano de cota de requisições para a API do n8n e os webhooks.
+    Atribuído à padaria e, opcionalmente, sobrescrito por API key.
+    Limites com valor 0 são ilimitados.
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name="Nome")
+    requests_per_second = models.PositiveIntegerField(
+        default=10,
+        verbose_name="Requisições por segundo",
+        help_text="Taxa sustentada (por worker)"
+    )
+    burst = models.PositiveIntegerField(
+        default=20,
+        verbose_name="Rajada",
+        help_text="Requisições seguidas permitidas acima da taxa por segundo"
+    )
+    requests_per_minute = models.PositiveIntegerField(default=300, verbose_name="Requisições por minuto")
+    requests_per_day = models.PositiveIntegerField(default=50000, verbose_name="Requisições por dia")
+    knowledge_per_minute = models.PositiveIntegerField(
+        default=60,
+        verbose_name="Conhecimento por minuto",
+        help_text="Orçamento separado para os endpoints de conhecimento (busca, chunks, contexto)"
+    )
+    webhook_per_minute = models.PositiveIntegerField(
+        default=600,
+        verbose_name="Webhooks por minuto",
+        help_text="Orçamento separado para os eventos recebidos via webhook"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    class Meta:
+        verbose_name = "Plano de Cota"
+        verbose_name_plural = "Planos de Cota"
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
 class Padaria(models.Model):
     """
     Padaria (tenant principal do sistema).
@@ -26,6 +67,16 @@ class Padaria(models.Model):
     # Status
     is_active = models.BooleanField(default=True, verbose_name="Ativa")
     
+    # Cota de requisições (sem plano: QUOTA_DEFAULT_PLAN das settings)
+    quota_plan = models.ForeignKey(
+        QuotaPlan,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="padarias",
+        verbose_name="Plano de Cota"
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
@@ -129,8 +180,22 @@ class ApiKey(models.Model):
     )
     is_active = models.BooleanField(default=True, verbose_name="Ativa")
     name = models.CharField(max_length=100, blank=True, verbose_name="Nome/Descrição")
+    quota_plan = models.ForeignKey(
+        QuotaPlan,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="api_keys",
+        verbose_name="Plano de Cota",
+        help_text="Se definido, substitui o plano da padaria e a cota é contada só para esta chave"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
     last_used_at = models.DateTimeField(null=True, blank=True, verbose_name="Último uso")
+    usage_count = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Requisições",
+        help_text="Total de requisições autenticadas com esta chave (gravado em lote)"
+    )
 
     class Meta:
         verbose_name = "Chave de API"
@@ -156,10 +221,11 @@ class ApiKey(models.Model):
         Verifica se esta API Key tem acesso ao agente especificado.
         """
         # Se não tem agente específico, tem acesso a todos da padaria
-        if not self.agent:
-            return agent.padaria == self.padaria
+        # (compara ids para não carregar os objetos relacionados)
+        if not self.agent_id:
+            return agent.padaria_id == self.padaria_id
         # Se tem agente específico, só acessa esse
-        return self.agent == agent
+        return self.agent_id == agent.pk
 
 
 # Alias para compatibilidade durante migração
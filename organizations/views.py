@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import Padaria, PadariaUser, ApiKey
 from audit.models import AuditLog
+from core.pagination import KeysetPaginator
 
 
 def get_user_padarias(user):
@@ -189,6 +190,7 @@ def apikey_list(request):
         user_agents = Agent.objects.filter(padaria__in=padarias)
         api_keys = ApiKey.objects.filter(agent__in=user_agents)
     
+    api_keys = KeysetPaginator(api_keys.select_related("agent"), 50, count=None).get_page(request.GET.get("cursor"))
     return render(request, "organizations/apikey_list.html", {"api_keys": api_keys})
 
 
@@ -2,10 +2,11 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from organizations.models import Padaria, PadariaUser, ApiKey
 from agents.models import Agent
-from audit.models import AuditLog
-from django.db.models import Count, Q
+from audit.queries import recent_activity
+from audit.rollups import activity_by_day, summarize
+from django.db.models import Q
 from django.utils import timezone
-from datetime import timedelta
+from datetime import timedelta, timezone as dt_timezone
 
 
 @login_required
@@ -17,8 +18,9 @@ def dashboard(request):
     if user.is_superuser:
         padarias = Padaria.objects.all()
         agents = Agent.objects.all()
-        logs = AuditLog.objects.all().order_by("-created_at")[:10]
+        logs = recent_activity(limit=10)
         api_keys = ApiKey.objects.all()
+        filtros = {}
     else:
         # Padarias onde o usuário é membro
         user_padaria_ids = PadariaUser.objects.filter(user=user).values_list('padaria_id', flat=True)
@@ -31,57 +33,18 @@ def dashboard(request):
         api_keys = ApiKey.objects.filter(padaria__in=padarias)
         
         # Logs recentes das padarias do usuário
-        logs = AuditLog.objects.filter(padaria__in=padarias).order_by("-created_at")[:10]
+        logs = recent_activity(limit=10, padaria__in=padarias)
+        filtros = {"padaria__in": padarias}
     
-    # Estatísticas para clientes
-    hoje = timezone.now()
-    dias_30 = hoje - timedelta(days=30)
-    dias_7 = hoje - timedelta(days=7)
-    
-    # Atividade nos últimos 30 dias
-    atividade_30_dias = AuditLog.objects.filter(
-        padaria__in=padarias,
-        created_at__gte=dias_30
-    ).count()
-    
-    # Atividade nos últimos 7 dias
-    atividade_7_dias = AuditLog.objects.filter(
-        padaria__in=padarias,
-        created_at__gte=dias_7
-    ).count()
-    
-    # Chamadas de API nos últimos 30 dias
-    api_calls_30_dias = AuditLog.objects.filter(
-        padaria__in=padarias,
-        created_at__gte=dias_30,
-        action='api_call'
-    ).count()
+    # Estatísticas para clientes (resumos de atividade por dia UTC, uma consulta)
+    hoje = timezone.now().astimezone(dt_timezone.utc).date()
+    atividade = summarize(activity_by_day(hoje - timedelta(days=29), **filtros), hoje, chart_days=7)
     
     # Gráfico de atividade por dia (últimos 7 dias)
-    atividade_diaria = []
-    for i in range(6, -1, -1):
-        dia = hoje - timedelta(days=i)
-        dia_inicio = dia.replace(hour=0, minute=0, second=0, microsecond=0)
-        dia_fim = dia_inicio + timedelta(days=1)
-        
-        count = AuditLog.objects.filter(
-            padaria__in=padarias,
-            created_at__gte=dia_inicio,
-            created_at__lt=dia_fim
-        ).count()
-        
-        atividade_diaria.append({
-            'dia': dia.strftime('%d/%m'),
-            'count': count
-        })
-    
-    # Ações mais frequentes
-    acoes_frequentes = AuditLog.objects.filter(
-        padaria__in=padarias,
-        created_at__gte=dias_30
-    ).values('action').annotate(
-        total=Count('id')
-    ).order_by('-total')[:5]
+    atividade_diaria = [
+        {'dia': dia.strftime('%d/%m'), 'count': count}
+        for dia, count in atividade["daily"]
+    ]
     
     # Status do agente (se existe)
     agente = agents.first() if agents.exists() else None
@@ -94,11 +57,11 @@ def dashboard(request):
         "logs": logs,
         "api_keys": api_keys,
         "api_keys_count": api_keys.count(),
-        "atividade_30_dias": atividade_30_dias,
-        "atividade_7_dias": atividade_7_dias,
-        "api_calls_30_dias": api_calls_30_dias,
+        "atividade_30_dias": atividade["total"],
+        "atividade_7_dias": atividade["recent"],
+        "api_calls_30_dias": atividade["api_calls"],
         "atividade_diaria": atividade_diaria,
-        "acoes_frequentes": acoes_frequentes,
+        "acoes_frequentes": atividade["top_actions"],
     }
     
     return render(request, "ui/dashboard.html", context)
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from .models import ConversationEvent
+
+
+@admin.register(ConversationEvent)
+class ConversationEventAdmin(admin.ModelAdmin):
+    list_display = ("ts", "padaria", "agent_slug", "session_id", "type")
+    list_filter = ("type",)
+    search_fields = ("session_id", "agent_slug")
+    list_select_related = ("padaria",)
+    readonly_fields = ("padaria", "agent", "agent_slug", "session_id", "type", "ts", "payload", "created_at")
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
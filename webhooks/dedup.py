@@ -0,0 +1,53 @@
+"""
+Idempotência dos webhooks: eventos reenviados pelo n8n (retry após timeout)
+não são gravados de novo.
+
+O evento é identificado pelo header Idempotency-Key ou pelo campo event_id
+(no lote, só o campo). Cada worker guarda em memória os ids vistos na
+última WEBHOOK_DEDUP_WINDOW_SECONDS (no máximo WEBHOOK_DEDUP_SIZE, LRU) com
+a resposta original; fora da memória, a constraint única
+(padaria, event_id) do ConversationEvent garante a deduplicação entre os
+workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class RecentEvents:
+    """Índice em memória (por processo) dos event_ids recentes, com janela de tempo e LRU."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, padaria_id, event_id):
+        """Resposta original do evento, ou None se não foi visto na janela."""
+        key = (padaria_id, event_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def add(self, padaria_id, event_id, response):
+        window = getattr(settings, "WEBHOOK_DEDUP_WINDOW_SECONDS", 3600)
+        with self._lock:
+            self._entries[(padaria_id, event_id)] = (time.monotonic() + window, response)
+            self._entries.move_to_end((padaria_id, event_id))
+            while len(self._entries) > getattr(settings, "WEBHOOK_DEDUP_SIZE", 10000):
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+recent_events = RecentEvents()
@@ -0,0 +1,93 @@
+"""
+Validação dos eventos do n8n recebidos pelos webhooks.
+"""
+import json
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+REQUIRED_FIELDS = ("type", "agent_slug", "session_id")
+# Tamanho máximo de cada campo (colunas do ConversationEvent)
+FIELD_MAX_LENGTHS = {"type": 50, "agent_slug": 120, "session_id": 100}
+EVENT_ID_MAX_LENGTH = 100
+
+
+class BatchError(ValueError):
+    """Corpo do lote inválido como um todo (responde 400/413)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_event(data, event_id=None):
+    """
+    Retorna (evento, None) ou (None, mensagem de erro).
+    event_id: Idempotency-Key do request (tem precedência sobre o campo).
+    """
+    if not isinstance(data, dict):
+        return None, "Event must be a JSON object"
+    if not all(data.get(field) for field in REQUIRED_FIELDS):
+        return None, "Missing required fields: type, agent_slug, session_id"
+    for field, max_length in FIELD_MAX_LENGTHS.items():
+        if not isinstance(data[field], str) or len(data[field]) > max_length:
+            return None, f"Invalid {field} (string up to {max_length} characters)"
+
+    # ts opcional (ISO 8601); sem ele vale o horário do recebimento
+    ts = None
+    if data.get("ts"):
+        try:
+            ts = parse_datetime(data["ts"]) if isinstance(data["ts"], str) else None
+        except ValueError:
+            ts = None
+        if ts is None:
+            return None, "Invalid ts (ISO 8601 datetime)"
+        if timezone.is_naive(ts):
+            ts = timezone.make_aware(ts, dt_timezone.utc)
+
+    event_id = event_id or data.get("event_id") or None
+    if event_id is not None and (not isinstance(event_id, str) or len(event_id) > EVENT_ID_MAX_LENGTH):
+        return None, f"Invalid event_id (string up to {EVENT_ID_MAX_LENGTH} characters)"
+    return {
+        "type": data["type"],
+        "agent_slug": data["agent_slug"],
+        "session_id": data["session_id"],
+        "ts": ts,
+        "payload": data.get("payload", {}),
+        "event_id": event_id,
+    }, None
+
+
+def log_extra(event):
+    """Resumo do evento para o AccessLog (o payload fica no ConversationEvent)."""
+    return {field: event[field] for field in REQUIRED_FIELDS}
+
+
+def parse_batch(body, content_type, max_events):
+    """
+    Lê o corpo de um lote: array JSON ou NDJSON (um evento por linha).
+    Retorna [(evento, erro)] na ordem recebida; uma linha NDJSON inválida
+    vira erro só daquele evento.
+    """
+    text = body.decode("utf-8")
+    if content_type != "application/x-ndjson" and text.lstrip().startswith("["):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError:
+            raise BatchError("Invalid JSON")
+        parsed = [(item, None) for item in items]
+    else:
+        parsed = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                parsed.append((json.loads(line), None))
+            except json.JSONDecodeError:
+                parsed.append((None, "Invalid JSON"))
+
+    if not parsed:
+        raise BatchError("Empty batch")
+    if len(parsed) > max_events:
+        raise BatchError(f"Too many events (max {max_events})", status=413)
+    return [validate_event(item) if error is None else (None, error) for item, error in parsed]
@@ -0,0 +1,147 @@
+"""
+Gravação dos eventos de webhook: ConversationEvent + AccessLog em lote.
+
+Usado pelo webhook em lote (síncrono) e pelo drain da fila local
+(webhooks.queue). Cada registro é um dict com padaria_id, api_key_id, ip,
+user_agent, received_at (opcional) e event (validado por webhooks.events).
+"""
+import logging
+from collections import defaultdict
+from django.conf import settings
+from django.db import OperationalError, InterfaceError, connection, transaction
+from django.utils.dateparse import parse_datetime
+from audit.models import AccessLog
+from audit.writer import audit_writer
+from core.utils import get_client_ip
+from .events import log_extra
+from .models import ConversationEvent
+
+logger = logging.getLogger(__name__)
+
+
+def build_record(request, event, received_at=None):
+    return {
+        "padaria_id": request.api_key.padaria_id,
+        "api_key_id": request.api_key.pk,
+        "ip": get_client_ip(request),
+        "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+        "received_at": received_at,
+        "event": event,
+    }
+
+
+def save_events(records):
+    """
+    Grava os eventos com um bulk_create e os logs de acesso com outro, na
+    mesma transação (ou os dois ou nenhum). Eventos com event_id já gravado
+    (ou repetido no lote) são descartados antes, sem log de acesso: um
+    reenvio não conta como webhook novo nos resumos de atividade. Retorna
+    os eventos gravados.
+    """
+    by_padaria = defaultdict(list)
+    for record in records:
+        by_padaria[record["padaria_id"]].append(record)
+
+    conversation_events = []
+    entries = []
+    with transaction.atomic():
+        for padaria_id, rows in by_padaria.items():
+            rows = _new_events(padaria_id, rows)
+            events = ConversationEvent.from_events(padaria_id, [row["event"] for row in rows])
+            for row, conversation_event in zip(rows, events):
+                entry = AccessLog.build(
+                    "webhook_received",
+                    agent_id=conversation_event.agent_id,
+                    ref=row["event"]["session_id"],
+                    extra=log_extra(row["event"]),
+                    ip=row["ip"],
+                    user_agent=row["user_agent"]
+                )
+                entry.padaria_id = padaria_id
+                entry.api_key_id = row["api_key_id"]
+                if row.get("received_at"):
+                    entry.created_at = row["received_at"]
+                entries.append(entry)
+            conversation_events.extend(events)
+
+        # ignore_conflicts só cobre a corrida com outro worker gravando o mesmo event_id
+        has_ids = any(event.event_id for event in conversation_events)
+        ConversationEvent.objects.bulk_create(conversation_events, ignore_conflicts=has_ids)
+        if entries:
+            audit_writer.write_many(entries)
+    return conversation_events
+
+
+def _new_events(padaria_id, rows):
+    """Registros cujo event_id ainda não foi gravado nem aparece antes no lote."""
+    event_ids = {row["event"].get("event_id") for row in rows} - {None, ""}
+    if not event_ids:
+        return rows
+    seen = set(
+        ConversationEvent.objects.filter(padaria_id=padaria_id, event_id__in=event_ids)
+        .values_list("event_id", flat=True)
+    )
+    new_rows = []
+    for row in rows:
+        event_id = row["event"].get("event_id")
+        if event_id:
+            if event_id in seen:
+                continue
+            seen.add(event_id)
+        new_rows.append(row)
+    return new_rows
+
+
+def decode_record(record):
+    """Registro lido da fila: datas de volta a datetime."""
+    if isinstance(record.get("received_at"), str):
+        record["received_at"] = parse_datetime(record["received_at"])
+    event = record.get("event") or {}
+    if isinstance(event.get("ts"), str):
+        event["ts"] = parse_datetime(event["ts"])
+    return record
+
+
+def drain_once(queue, batch_size=None):
+    """
+    Retira um lote da fila e grava. Retorna o número de itens gravados.
+
+    Se o lote falhar por um erro do próprio conteúdo (ex.: padaria removida),
+    os itens são gravados um a um: os bons são confirmados e cada um que
+    falha conta uma tentativa (ver WebhookQueue.fail). Se o banco estiver
+    fora (OperationalError), o lote volta inteiro à fila sem contar
+    tentativa.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "WEBHOOK_QUEUE_BATCH_SIZE", 500)
+    items = queue.claim(batch_size)
+    if not items:
+        return 0
+    try:
+        save_events([decode_record(record) for _, record in items])
+    except (OperationalError, InterfaceError) as e:
+        logger.error(f"Erro ao gravar {len(items)} evento(s) da fila de webhooks: {str(e)}")
+        # Conexão possivelmente quebrada: a próxima tentativa abre outra
+        connection.close()
+        queue.release([pk for pk, _ in items], getattr(settings, "WEBHOOK_QUEUE_LEASE_SECONDS", 60))
+        return 0
+    except Exception as e:
+        if len(items) > 1:
+            logger.warning(f"Lote de {len(items)} evento(s) da fila falhou ({str(e)}); gravando um a um")
+        return _drain_one_by_one(queue, items)
+    queue.ack(pk for pk, _ in items)
+    return len(items)
+
+
+def _drain_one_by_one(queue, items):
+    saved = 0
+    for pk, record in items:
+        try:
+            save_events([decode_record(record)])
+        except Exception as e:
+            if queue.fail(pk, e):
+                logger.error(f"Item {pk} da fila de webhooks foi para o dead letter: {str(e)}")
+            continue
+        queue.ack([pk])
+        saved += 1
+    return saved
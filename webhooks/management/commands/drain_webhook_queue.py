@@ -0,0 +1,94 @@
+import json
+import signal
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from webhooks.ingest import drain_once
+from webhooks.queue import webhook_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava no banco os eventos da fila local dos webhooks (modo WEBHOOK_ASYNC), "
+        "com um pool de workers que retiram lotes da fila."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Threads gravando em paralelo (padrão: 2)")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Eventos por lote (padrão: WEBHOOK_QUEUE_BATCH_SIZE)",
+        )
+        parser.add_argument("--poll", type=float, default=0.5, help="Espera com a fila vazia, em segundos")
+        parser.add_argument("--once", action="store_true", help="Esvazia a fila e termina")
+        parser.add_argument(
+            "--stats-interval",
+            type=float,
+            default=60,
+            help="Intervalo entre as linhas de métricas (profundidade e atraso), em segundos; 0 desliga",
+        )
+        parser.add_argument("--stats", action="store_true", help="Só mostra as métricas da fila (JSON)")
+        parser.add_argument(
+            "--retry-dead",
+            action="store_true",
+            help="Devolve à fila os itens em dead letter (tentativas esgotadas) e termina",
+        )
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(webhook_queue.stats()))
+            return
+        if options["retry_dead"]:
+            total = webhook_queue.retry_dead()
+            self.stdout.write(self.style.SUCCESS(f"{total} item(ns) devolvido(s) à fila de webhooks."))
+            return
+
+        batch_size = options["batch_size"] or getattr(settings, "WEBHOOK_QUEUE_BATCH_SIZE", 500)
+        stop = threading.Event()
+        totals = [0] * options["workers"]
+
+        def work(index):
+            try:
+                while not stop.is_set():
+                    saved = drain_once(webhook_queue, batch_size)
+                    totals[index] += saved
+                    if not saved:
+                        if options["once"]:
+                            break
+                        stop.wait(options["poll"])
+            finally:
+                connection.close()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        threads = [
+            threading.Thread(target=work, args=(index,), name=f"webhook-drain-{index}", daemon=True)
+            for index in range(options["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_stats = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+                interval = options["stats_interval"]
+                if interval and time.monotonic() - last_stats >= interval:
+                    last_stats = time.monotonic()
+                    stats = webhook_queue.stats()
+                    self.stdout.write(
+                        f"fila: {stats['depth']} evento(s), {stats['in_flight']} em processamento, "
+                        f"{stats['dead']} em dead letter, atraso {stats['lag_seconds']:.1f}s; gravados: {sum(totals)}"
+                    )
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"{sum(totals)} evento(s) gravado(s) da fila de webhooks."))
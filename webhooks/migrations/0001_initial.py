@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('agents', '0011_knowledgechunk_tokens'),
+        ('organizations', '0004_quotaplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_slug', models.CharField(max_length=120, verbose_name='Slug do Agente')),
+                ('session_id', models.CharField(max_length=100, verbose_name='Sessão')),
+                ('type', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('ts', models.DateTimeField(default=django.utils.timezone.now, help_text='Horário do evento (campo ts do evento, ou o do recebimento)', verbose_name='Momento')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Recebido em')),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conversation_events', to='agents.agent', verbose_name='Agente')),
+                ('padaria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_events', to='organizations.padaria', verbose_name='Padaria')),
+            ],
+            options={
+                'verbose_name': 'Evento de Conversa',
+                'verbose_name_plural': 'Eventos de Conversa',
+                'ordering': ['ts', 'id'],
+                'indexes': [models.Index(fields=['agent', 'session_id', 'ts'], name='webhooks_co_agent_i_915036_idx'), models.Index(fields=['agent', 'type', 'ts'], name='webhooks_co_agent_i_73a63c_idx'), models.Index(fields=['padaria', 'session_id', 'ts'], name='webhooks_co_padaria_8d575d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0011_knowledgechunk_tokens'),
+        ('organizations', '0004_quotaplan'),
+        ('webhooks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationevent',
+            name='event_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='ID do Evento'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationevent',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_id__isnull', False)), fields=('padaria', 'event_id'), name='unique_conversation_event_id'),
+        ),
+    ]
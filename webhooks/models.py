@@ -1,3 +1,92 @@
 from django.db import models
+from django.utils import timezone
+from agents.models import Agent
+from organizations.models import Padaria
 
-# Webhooks não tem models
+
+class ConversationEvent(models.Model):
+    """
+    Evento de conversa recebido do n8n (mensagens, handoffs etc.), com
+    colunas próprias para as consultas por sessão e por agente. O AccessLog
+    continua registrando a chamada do webhook; o payload fica só aqui.
+    """
+    padaria = models.ForeignKey(
+        Padaria,
+        on_delete=models.CASCADE,
+        related_name="conversation_events",
+        verbose_name="Padaria"
+    )
+    # Nulo se o slug enviado não corresponde a um agente da padaria
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="conversation_events",
+        verbose_name="Agente"
+    )
+    agent_slug = models.CharField(max_length=120, verbose_name="Slug do Agente")
+    session_id = models.CharField(max_length=100, verbose_name="Sessão")
+    type = models.CharField(max_length=50, verbose_name="Tipo")
+    ts = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Momento",
+        help_text="Horário do evento (campo ts do evento, ou o do recebimento)"
+    )
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Payload")
+    # Idempotency-Key / event_id enviado pelo n8n (ver webhooks.dedup)
+    event_id = models.CharField(max_length=100, null=True, blank=True, verbose_name="ID do Evento")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Recebido em")
+
+    class Meta:
+        verbose_name = "Evento de Conversa"
+        verbose_name_plural = "Eventos de Conversa"
+        ordering = ["ts", "id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["padaria", "event_id"],
+                condition=models.Q(event_id__isnull=False),
+                name="unique_conversation_event_id",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["agent", "session_id", "ts"]),
+            models.Index(fields=["agent", "type", "ts"]),
+            # Linha do tempo da sessão na API (escopo da padaria da API key)
+            models.Index(fields=["padaria", "session_id", "ts"]),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} - {self.type} ({self.ts})"
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "agent_slug": self.agent_slug,
+            "session_id": self.session_id,
+            "type": self.type,
+            "ts": self.ts.isoformat(),
+            "payload": self.payload,
+        }
+
+    @classmethod
+    def from_events(cls, padaria_id, events):
+        """
+        Monta (sem gravar) os eventos validados por webhooks.events,
+        resolvendo os agentes da padaria em uma consulta.
+        """
+        slugs = {event["agent_slug"] for event in events}
+        agent_ids = dict(Agent.objects.filter(padaria_id=padaria_id, slug__in=slugs).values_list("slug", "id"))
+        return [
+            cls(
+                padaria_id=padaria_id,
+                agent_id=agent_ids.get(event["agent_slug"]),
+                agent_slug=event["agent_slug"],
+                session_id=event["session_id"],
+                type=event["type"],
+                ts=event["ts"] or timezone.now(),
+                payload=event["payload"],
+                event_id=event["event_id"],
+            )
+            for event in events
+        ]
@@ -0,0 +1,251 @@
+"""
+Fila local durável dos webhooks (modo 202, WEBHOOK_ASYNC).
+
+Com WEBHOOK_ASYNC ligado, os webhooks validam o evento, o acrescentam a esta
+fila (um arquivo SQLite local em modo WAL, WEBHOOK_QUEUE_PATH) e respondem
+202 sem tocar no banco principal. `python manage.py drain_webhook_queue`
+roda um pool de workers que retiram lotes da fila e gravam os eventos
+(webhooks.ingest). A fila é da máquina: os workers do gunicorn e o comando
+precisam ver o mesmo arquivo.
+
+Entrega "pelo menos uma vez": um lote retirado fica reservado por
+WEBHOOK_QUEUE_LEASE_SECONDS e só sai da fila depois de gravado; se o worker
+morrer antes, o lote volta para a fila. Eventos com event_id não são
+duplicados (constraint única do ConversationEvent).
+
+Falhas: se um lote não grava, o drain tenta item a item (webhooks.ingest);
+cada item que falha conta uma tentativa e volta à fila depois de
+WEBHOOK_QUEUE_LEASE_SECONDS × tentativas. Com WEBHOOK_QUEUE_MAX_ATTEMPTS
+tentativas ele sai da fila para a tabela dead_items (dead letter), com o
+último erro, e não segura mais os outros; `drain_webhook_queue --retry-dead`
+devolve esses itens à fila.
+
+Contrapressão: com WEBHOOK_QUEUE_HIGH_WATERMARK itens ou mais na fila, os
+webhooks respondem 503 com Retry-After. A profundidade usada nessa decisão é
+relida no máximo uma vez por segundo em cada processo.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS items ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " enqueued_at REAL NOT NULL,"
+    " claimed_until REAL NOT NULL DEFAULT 0,"
+    " body TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS items_claimed ON items (claimed_until, id)",
+    "CREATE TABLE IF NOT EXISTS dead_items ("
+    " id INTEGER PRIMARY KEY,"
+    " enqueued_at REAL NOT NULL,"
+    " failed_at REAL NOT NULL,"
+    " attempts INTEGER NOT NULL,"
+    " error TEXT NOT NULL,"
+    " body TEXT NOT NULL)",
+)
+# Colunas acrescentadas depois da primeira versão do arquivo da fila
+ITEM_COLUMNS = {
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "last_error": "TEXT NOT NULL DEFAULT ''",
+}
+# Limite de parâmetros por comando do SQLite
+SQLITE_MAX_PARAMS = 500
+
+
+def queue_enabled():
+    return getattr(settings, "WEBHOOK_ASYNC", False)
+
+
+class WebhookQueue:
+    """Fila em um arquivo SQLite; uma conexão por thread (e por processo)."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+        self._depth_lock = threading.Lock()
+        self._depth = (0.0, None, 0)  # (lida em, caminho, profundidade)
+
+    def get_path(self):
+        return str(self.path or getattr(settings, "WEBHOOK_QUEUE_PATH", "webhook_queue.sqlite3"))
+
+    def _connection(self):
+        path = self.get_path()
+        local = self._local
+        if getattr(local, "key", None) != (os.getpid(), path):
+            # autocommit: as transações são abertas explicitamente (BEGIN IMMEDIATE)
+            local.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: sobrevive à queda do processo sem um fsync por evento
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                local.connection.execute(statement)
+            self._add_columns(local.connection)
+            local.key = (os.getpid(), path)
+        return local.connection
+
+    @staticmethod
+    def _add_columns(connection):
+        existing = {row[1] for row in connection.execute("PRAGMA table_info(items)")}
+        for name, definition in ITEM_COLUMNS.items():
+            if name not in existing:
+                try:
+                    connection.execute(f"ALTER TABLE items ADD COLUMN {name} {definition}")
+                except sqlite3.OperationalError:
+                    # Outra conexão acrescentou a coluna ao mesmo tempo
+                    pass
+
+    def put_many(self, records):
+        """Acrescenta registros (dicts serializáveis em JSON) à fila."""
+        now = time.time()
+        rows = [(now, json.dumps(record, cls=DjangoJSONEncoder)) for record in records]
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT INTO items (enqueued_at, body) VALUES (?, ?)", rows)
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def claim(self, limit, lease_seconds=None):
+        """
+        Reserva até `limit` itens (os mais antigos livres ou com reserva
+        vencida). Retorna [(id, registro)].
+        """
+        if lease_seconds is None:
+            lease_seconds = getattr(settings, "WEBHOOK_QUEUE_LEASE_SECONDS", 60)
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, body FROM items WHERE claimed_until < ? ORDER BY id LIMIT ?", (now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE items SET claimed_until = ? WHERE id = ?", [(now + lease_seconds, pk) for pk, _ in rows]
+            )
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return [(pk, json.loads(body)) for pk, body in rows]
+
+    def ack(self, ids):
+        """Remove da fila os itens já gravados."""
+        ids = list(ids)
+        connection = self._connection()
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            chunk = ids[start:start + SQLITE_MAX_PARAMS]
+            connection.execute(f"DELETE FROM items WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+    def release(self, ids, delay=0):
+        """Devolve itens reservados à fila (disponíveis de novo em `delay` segundos), sem contar tentativa."""
+        until = time.time() + delay
+        self._connection().executemany("UPDATE items SET claimed_until = ? WHERE id = ?", [(until, pk) for pk in ids])
+
+    def fail(self, pk, error, max_attempts=None, retry_delay=None):
+        """
+        Registra uma falha do item: volta à fila depois de retry_delay ×
+        tentativas ou, ao chegar a max_attempts, vai para dead_items.
+        Retorna True se foi para o dead letter.
+        """
+        if max_attempts is None:
+            max_attempts = getattr(settings, "WEBHOOK_QUEUE_MAX_ATTEMPTS", 5)
+        if retry_delay is None:
+            retry_delay = getattr(settings, "WEBHOOK_QUEUE_LEASE_SECONDS", 60)
+        now = time.time()
+        error = str(error)[:2000]
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT attempts FROM items WHERE id = ?", (pk,)).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return False
+            attempts = row[0] + 1
+            dead = attempts >= max_attempts
+            if dead:
+                connection.execute(
+                    "INSERT OR REPLACE INTO dead_items (id, enqueued_at, failed_at, attempts, error, body)"
+                    " SELECT id, enqueued_at, ?, ?, ?, body FROM items WHERE id = ?",
+                    (now, attempts, error, pk),
+                )
+                connection.execute("DELETE FROM items WHERE id = ?", (pk,))
+            else:
+                connection.execute(
+                    "UPDATE items SET attempts = ?, last_error = ?, claimed_until = ? WHERE id = ?",
+                    (attempts, error, now + retry_delay * attempts, pk),
+                )
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return dead
+
+    def dead_items(self, limit=100):
+        """Itens em dead letter: [{id, attempts, error, failed_at, record}]."""
+        rows = self._connection().execute(
+            "SELECT id, attempts, error, failed_at, body FROM dead_items ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        return [
+            {"id": pk, "attempts": attempts, "error": error, "failed_at": failed_at, "record": json.loads(body)}
+            for pk, attempts, error, failed_at, body in rows
+        ]
+
+    def retry_dead(self):
+        """Devolve os itens em dead letter à fila (tentativas zeradas). Retorna quantos."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            total = connection.execute(
+                "INSERT INTO items (id, enqueued_at, body) SELECT id, enqueued_at, body FROM dead_items"
+            ).rowcount
+            connection.execute("DELETE FROM dead_items")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return total
+
+    def stats(self):
+        """Profundidade, itens reservados, dead letter e atraso (idade do item mais antigo, em segundos)."""
+        now = time.time()
+        connection = self._connection()
+        depth, in_flight, oldest = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(claimed_until >= ?), 0), MIN(enqueued_at) FROM items", (now,)
+        ).fetchone()
+        dead = connection.execute("SELECT COUNT(*) FROM dead_items").fetchone()[0]
+        return {
+            "depth": depth,
+            "in_flight": in_flight,
+            "dead": dead,
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "high_watermark": getattr(settings, "WEBHOOK_QUEUE_HIGH_WATERMARK", 50000),
+        }
+
+    def depth(self, max_age=1.0):
+        """Profundidade da fila, relida no máximo a cada `max_age` segundos."""
+        now = time.monotonic()
+        path = self.get_path()
+        read_at, cached_path, depth = self._depth
+        if cached_path == path and now - read_at < max_age:
+            return depth
+        with self._depth_lock:
+            depth = self._connection().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            self._depth = (now, path, depth)
+        return depth
+
+    def is_full(self):
+        return self.depth() >= getattr(settings, "WEBHOOK_QUEUE_HIGH_WATERMARK", 50000)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM items")
+        self._connection().execute("DELETE FROM dead_items")
+        self._depth = (0.0, None, 0)
+
+
+webhook_queue = WebhookQueue()
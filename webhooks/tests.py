@@ -1,17 +1,31 @@
 import json
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from organizations.models import Organization, ApiKey
-from audit.models import AuditLog
+from agents.models import Agent
+from audit.models import AccessLog
+from .dedup import recent_events
+from .ingest import drain_once
+from .models import ConversationEvent
+from .queue import webhook_queue
 
 
+@override_settings(API_KEY_USAGE_FLUSH_SECONDS=0)
 class WebhookTest(TestCase):
     """Testes para webhooks."""
     
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="12345")
         self.organization = Organization.objects.create(name="Test Org", owner=self.user)
-        self.api_key = ApiKey.objects.create(organization=self.organization)
+        self.api_key = ApiKey.objects.create(padaria=self.organization)
+        # Memória do processo sobrevive ao rollback dos testes
+        recent_events.clear()
     
     def test_receive_event_success(self):
         """Testa recebimento de evento válido."""
@@ -37,9 +51,18 @@ class WebhookTest(TestCase):
         self.assertEqual(data["status"], "ok")
         
         # Verificar que foi logado
-        log = AuditLog.objects.filter(action="webhook_received").first()
+        log = AccessLog.objects.first()
         self.assertIsNotNone(log)
+        self.assertEqual(log.action, "webhook_received")
+        self.assertEqual(log.ref, "session123")
         self.assertEqual(log.diff["session_id"], "session123")
+        
+        # Evento gravado com colunas próprias (agente inexistente: agent nulo)
+        event = ConversationEvent.objects.get()
+        self.assertEqual(event.session_id, "session123")
+        self.assertEqual(event.type, "message")
+        self.assertIsNone(event.agent)
+        self.assertEqual(event.payload["text"], "Olá")
     
     def test_receive_event_no_api_key(self):
         """Testa webhook sem API key."""
@@ -81,3 +104,247 @@ class WebhookTest(TestCase):
         )
         
         self.assertEqual(response.status_code, 400)
+    
+    def _event(self, session_id="session123"):
+        return {"type": "message", "agent_slug": "test-agent", "session_id": session_id, "payload": {"text": "Olá"}}
+    
+    def test_receive_batch_json_array(self):
+        """Lote em array JSON: válidos gravados em um INSERT, inválidos reportados."""
+        events = [self._event("s1"), {"type": "message"}, self._event("s2")]
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/webhooks/n8n/events/batch",
+                data=json.dumps(events),
+                content_type="application/json",
+                HTTP_X_API_KEY=self.api_key.key
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["accepted"], 2)
+        self.assertEqual(data["rejected"], 1)
+        self.assertEqual([item["status"] for item in data["results"]], ["ok", "error", "ok"])
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "audit_accesslog"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(AccessLog.objects.values_list("ref", flat=True)), {"s1", "s2"})
+        self.assertEqual(set(ConversationEvent.objects.values_list("session_id", flat=True)), {"s1", "s2"})
+    
+    def test_receive_event_resolves_agent(self):
+        """Evento com slug de um agente da padaria fica ligado ao agente."""
+        agent = Agent.objects.create(padaria=self.organization, name="Atendente")
+        payload = {"type": "message", "agent_slug": agent.slug, "session_id": "s1", "ts": "2026-01-01T10:00:00"}
+        
+        response = self.client.post(
+            "/webhooks/n8n/events",
+            data=json.dumps(payload),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        event = ConversationEvent.objects.get()
+        self.assertEqual(event.agent, agent)
+        self.assertEqual(event.ts.isoformat(), "2026-01-01T10:00:00+00:00")
+        self.assertEqual(AccessLog.objects.get().agent_id, agent.id)
+    
+    def test_receive_batch_ndjson(self):
+        """Lote NDJSON: uma linha inválida não impede as demais."""
+        body = "\n".join([json.dumps(self._event("s1")), "{not json", json.dumps(self._event("s2")), ""])
+        
+        response = self.client.post(
+            "/webhooks/n8n/events/batch",
+            data=body,
+            content_type="application/x-ndjson",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["accepted"], 2)
+        self.assertEqual(data["results"][1], {"index": 1, "status": "error", "error": "Invalid JSON"})
+        self.assertEqual(AccessLog.objects.count(), 2)
+    
+    @override_settings(WEBHOOK_BATCH_MAX_EVENTS=2)
+    def test_receive_batch_too_large(self):
+        """Lote acima do limite é recusado sem gravar nada."""
+        response = self.client.post(
+            "/webhooks/n8n/events/batch",
+            data=json.dumps([self._event()] * 3),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(AccessLog.objects.count(), 0)
+    
+    def test_receive_batch_empty(self):
+        """Lote vazio é inválido."""
+        response = self.client.post(
+            "/webhooks/n8n/events/batch",
+            data="[]",
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_receive_event_idempotency_key(self):
+        """Evento repetido com Idempotency-Key recebe a resposta original sem nova gravação."""
+        def send():
+            return self.client.post(
+                "/webhooks/n8n/events",
+                data=json.dumps(self._event()),
+                content_type="application/json",
+                HTTP_X_API_KEY=self.api_key.key,
+                HTTP_IDEMPOTENCY_KEY="evt-1"
+            )
+        
+        self.assertEqual(send().json(), {"status": "ok"})
+        response = send()
+        self.assertEqual(response.json(), {"status": "ok"})
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        
+        # Outro worker (sem o id na memória): a constraint única deduplica
+        recent_events.clear()
+        self.assertEqual(send().status_code, 200)
+        
+        self.assertEqual(ConversationEvent.objects.get().event_id, "evt-1")
+        self.assertEqual(AccessLog.objects.count(), 1)
+    
+    def test_receive_batch_event_id_dedup(self):
+        """No lote, event_ids repetidos (no lote ou já gravados) não são gravados de novo."""
+        first = dict(self._event("s1"), event_id="a")
+        self.client.post(
+            "/webhooks/n8n/events/batch",
+            data=json.dumps([first]),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        recent_events.clear()
+        
+        events = [first, dict(self._event("s2"), event_id="b"), dict(self._event("s2"), event_id="b")]
+        response = self.client.post(
+            "/webhooks/n8n/events/batch",
+            data=json.dumps(events),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key
+        )
+        
+        data = response.json()
+        self.assertEqual((data["accepted"], data["duplicates"], data["rejected"]), (1, 2, 0))
+        self.assertEqual([result.get("duplicate", False) for result in data["results"]], [True, False, True])
+        self.assertEqual(ConversationEvent.objects.count(), 2)
+        self.assertEqual(AccessLog.objects.count(), 2)
+
+
+@override_settings(API_KEY_USAGE_FLUSH_SECONDS=0, WEBHOOK_ASYNC=True)
+class WebhookQueueTest(TestCase):
+    """Testes do modo 202 (fila local dos webhooks)."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.organization = Organization.objects.create(name="Test Org", owner=self.user)
+        self.api_key = ApiKey.objects.create(padaria=self.organization)
+        recent_events.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = self.settings(WEBHOOK_QUEUE_PATH=os.path.join(directory, "queue.sqlite3"))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+    
+    def _post(self, **headers):
+        payload = {"type": "message", "agent_slug": "test-agent", "session_id": "s1", "payload": {}}
+        return self.client.post(
+            "/webhooks/n8n/events",
+            data=json.dumps(payload),
+            content_type="application/json",
+            HTTP_X_API_KEY=self.api_key.key,
+            **headers
+        )
+    
+    def test_event_is_queued_and_drained(self):
+        """Evento vai para a fila (202) e o drain grava evento e log de acesso."""
+        response = self._post(HTTP_IDEMPOTENCY_KEY="evt-1")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"status": "queued"})
+        self.assertEqual(ConversationEvent.objects.count(), 0)
+        
+        # Retry antes do drain: resposta original, nada novo na fila
+        response = self._post(HTTP_IDEMPOTENCY_KEY="evt-1")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(webhook_queue.stats()["depth"], 1)
+        
+        self.assertEqual(drain_once(webhook_queue), 1)
+        event = ConversationEvent.objects.get()
+        self.assertEqual((event.session_id, event.event_id), ("s1", "evt-1"))
+        log = AccessLog.objects.get()
+        self.assertEqual(log.api_key_id, self.api_key.id)
+        self.assertEqual(log.padaria_id, self.organization.id)
+        self.assertEqual(webhook_queue.stats()["depth"], 0)
+        self.assertEqual(drain_once(webhook_queue), 0)
+    
+    def test_redelivered_event_is_not_logged_again(self):
+        """event_id já gravado (fora da memória de dedup): sai da fila sem novo evento nem log."""
+        self._post(HTTP_IDEMPOTENCY_KEY="evt-1")
+        drain_once(webhook_queue)
+        recent_events.clear()
+        self._post(HTTP_IDEMPOTENCY_KEY="evt-1")
+        
+        self.assertEqual(drain_once(webhook_queue), 1)
+        self.assertEqual(ConversationEvent.objects.count(), 1)
+        self.assertEqual(AccessLog.objects.count(), 1)
+        self.assertEqual(webhook_queue.stats()["depth"], 0)
+    
+    @override_settings(WEBHOOK_QUEUE_MAX_ATTEMPTS=2)
+    def test_failing_item_does_not_block_batch(self):
+        """Item que sempre falha: os outros são gravados e ele vai para o dead letter."""
+        self._post()
+        webhook_queue.put_many([{"padaria_id": self.organization.id, "broken": True}])
+        self._post()
+        
+        self.assertEqual(drain_once(webhook_queue), 2)
+        self.assertEqual(ConversationEvent.objects.count(), 2)
+        self.assertEqual(AccessLog.objects.count(), 2)
+        stats = webhook_queue.stats()
+        self.assertEqual((stats["depth"], stats["dead"]), (1, 0))
+        
+        # Segunda falha: dead letter, e a fila fica livre
+        webhook_queue._connection().execute("UPDATE items SET claimed_until = 0")
+        self.assertEqual(drain_once(webhook_queue), 0)
+        stats = webhook_queue.stats()
+        self.assertEqual((stats["depth"], stats["dead"]), (0, 1))
+        self.assertEqual(webhook_queue.dead_items()[0]["attempts"], 2)
+        
+        self.assertEqual(webhook_queue.retry_dead(), 1)
+        self.assertEqual(webhook_queue.stats()["depth"], 1)
+    
+    def test_access_log_failure_rolls_back_events(self):
+        """Eventos e logs na mesma transação: se o log falha, nada é gravado e o item fica na fila."""
+        self._post()
+        with mock.patch("webhooks.ingest.audit_writer.write_many", side_effect=RuntimeError("falhou")):
+            self.assertEqual(drain_once(webhook_queue), 0)
+        self.assertEqual(ConversationEvent.objects.count(), 0)
+        self.assertEqual(webhook_queue.stats()["depth"], 1)
+    
+    @override_settings(WEBHOOK_QUEUE_HIGH_WATERMARK=2)
+    def test_queue_full_returns_503(self):
+        """Fila acima do high watermark: 503 com Retry-After."""
+        webhook_queue.put_many([{"backlog": index} for index in range(2)])
+        
+        response = self._post()
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+    
+    def test_queue_stats(self):
+        """Métricas da fila para o admin master."""
+        webhook_queue.put_many([{"backlog": 1}])
+        admin = User.objects.create_superuser(username="admin", password="12345")
+        self.client.force_login(admin)
+        
+        data = self.client.get("/admin-panel/webhook-queue/").json()
+        
+        self.assertTrue(data["enabled"])
+        self.assertEqual(data["depth"], 1)
+        self.assertGreaterEqual(data["lag_seconds"], 0)
@@ -5,4 +5,5 @@ app_name = "webhooks"
 
 urlpatterns = [
     path("n8n/events", views.receive_event, name="n8n_events"),
+    path("n8n/events/batch", views.receive_events_batch, name="n8n_events_batch"),
 ]
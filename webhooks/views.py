@@ -1,9 +1,18 @@
 import json
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from audit.models import AuditLog
-from core.utils import require_api_key, get_client_ip
+from audit.models import AccessLog
+from core.quotas import charge_quota
+from core.utils import require_api_key, get_client_ip, rate_limit_response
+from .dedup import recent_events
+from .events import BatchError, parse_batch, validate_event, log_extra
+from .ingest import build_record, save_events
+from .models import ConversationEvent
+from .queue import webhook_queue, queue_enabled
 
 
 @csrf_exempt
@@ -14,6 +23,11 @@ def receive_event(request):
     Recebe eventos do n8n via webhook.
     CSRF exempt pois é chamado externamente.
     Requer autenticação via API key.
+    
+    Idempotência: com Idempotency-Key (header) ou event_id (campo), um
+    evento repetido recebe a resposta original e não é gravado de novo.
+    Com WEBHOOK_ASYNC o evento vai para a fila local e a resposta é 202
+    (ver webhooks.queue).
     """
     try:
         # Parse JSON body
@@ -22,31 +36,145 @@ def receive_event(request):
         return JsonResponse({"error": "Invalid JSON"}, status=400)
     
     # Validar campos obrigatórios
-    event_type = data.get("type")
-    agent_slug = data.get("agent_slug")
-    session_id = data.get("session_id")
-    payload = data.get("payload", {})
+    event, error = validate_event(data, request.headers.get("Idempotency-Key"))
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    
+    padaria = request.api_key.padaria
+    event_id = event["event_id"]
+    if event_id:
+        original = recent_events.get(padaria.pk, event_id)
+        if original is not None:
+            return _replayed(original)
     
-    if not all([event_type, agent_slug, session_id]):
-        return JsonResponse({
-            "error": "Missing required fields: type, agent_slug, session_id"
-        }, status=400)
+    if queue_enabled():
+        if webhook_queue.is_full():
+            return _queue_full_response()
+        # Horário do evento = recebimento, não o da gravação pelo drain
+        received_at = timezone.now()
+        event["ts"] = event["ts"] or received_at
+        webhook_queue.put_many([build_record(request, event, received_at)])
+        response = (202, {"status": "queued"})
+    else:
+        conversation_event = ConversationEvent.from_events(padaria.pk, [event])[0]
+        response = (200, {"status": "ok"})
+        if event_id:
+            try:
+                with transaction.atomic():
+                    conversation_event.save()
+            except IntegrityError:
+                # Gravado por outro worker, ou antes da janela da memória
+                recent_events.add(padaria.pk, event_id, response)
+                return _replayed(response)
+        else:
+            conversation_event.save()
+        
+        # Log do evento
+        AccessLog.log(
+            "webhook_received",
+            api_key=request.api_key,
+            agent_id=conversation_event.agent_id,
+            ref=event["session_id"],
+            extra=log_extra(event),
+            ip=get_client_ip(request),
+            user_agent=request.META.get("HTTP_USER_AGENT", "")
+        )
+    
+    if event_id:
+        recent_events.add(padaria.pk, event_id, response)
+    status, response_data = response
+    return JsonResponse(response_data, status=status)
+
+
+def _replayed(original):
+    status, response_data = original
+    response = JsonResponse(response_data, status=status)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _queue_full_response():
+    response = JsonResponse({"error": "Webhook queue is full, retry later"}, status=503)
+    response["Retry-After"] = str(getattr(settings, "WEBHOOK_QUEUE_RETRY_AFTER", 5))
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@require_api_key
+def receive_events_batch(request):
+    """
+    Recebe um lote de eventos do n8n: array JSON ou NDJSON (um por linha),
+    até WEBHOOK_BATCH_MAX_EVENTS eventos. Os válidos são gravados juntos
+    (um bulk_create de eventos e um de logs); a resposta traz o status de
+    cada evento, na ordem. Eventos com event_id já recebido voltam como
+    "ok" com "duplicate": true, sem nova gravação.
+    Com WEBHOOK_ASYNC os válidos vão para a fila local ("queued", 202).
+    Cada evento conta um na cota de webhooks (o middleware já cobrou um).
+    """
+    max_events = getattr(settings, "WEBHOOK_BATCH_MAX_EVENTS", 500)
+    try:
+        items = parse_batch(request.body, request.content_type, max_events)
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "Invalid encoding"}, status=400)
+    except BatchError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    
+    quota = charge_quota(request.api_key, "webhook", len(items) - 1)
+    if quota is not None and not quota:
+        return rate_limit_response(quota, f"Quota exceeded ({quota.name})")
+    
+    queued = queue_enabled()
+    if queued and webhook_queue.is_full():
+        return _queue_full_response()
     
-    # Log do evento
     padaria = request.api_key.padaria
-    AuditLog.log(
-        action="webhook_received",
-        entity="n8n_event",
-        organization=padaria,
-        entity_id=session_id,
-        diff={
-            "type": event_type,
-            "agent_slug": agent_slug,
-            "session_id": session_id,
-            "payload": payload
-        },
-        ip=get_client_ip(request),
-        user_agent=request.META.get("HTTP_USER_AGENT", "")
-    )
-    
-    return JsonResponse({"status": "ok"})
+    pending = []
+    results = []
+    batch_ids = set()
+    for index, (event, error) in enumerate(items):
+        if error:
+            results.append({"index": index, "status": "error", "error": error})
+            continue
+        result = {"index": index, "status": "queued" if queued else "ok"}
+        event_id = event["event_id"]
+        if event_id and (event_id in batch_ids or recent_events.get(padaria.pk, event_id) is not None):
+            result["status"] = "ok"
+            result["duplicate"] = True
+        else:
+            if event_id:
+                batch_ids.add(event_id)
+            pending.append((event, result))
+        results.append(result)
+    
+    # event_ids já gravados (outros workers ou fora da janela da memória);
+    # no modo fila quem confere é o drain, pela constraint única
+    if batch_ids and not queued:
+        stored = set(
+            ConversationEvent.objects.filter(padaria=padaria, event_id__in=batch_ids)
+            .values_list("event_id", flat=True)
+        )
+        for event, result in pending:
+            if event["event_id"] in stored:
+                result["duplicate"] = True
+    events = [event for event, result in pending if not result.get("duplicate")]
+    
+    if events:
+        received_at = timezone.now()
+        if queued:
+            for event in events:
+                event["ts"] = event["ts"] or received_at
+            webhook_queue.put_many([build_record(request, event, received_at) for event in events])
+        else:
+            save_events([build_record(request, event) for event in events])
+        for event in events:
+            if event["event_id"]:
+                recent_events.add(padaria.pk, event["event_id"], (200, {"status": "ok"}))
+    
+    rejected = sum(1 for result in results if result["status"] == "error")
+    return JsonResponse({
+        "accepted": len(events),
+        "duplicates": len(results) - rejected - len(events),
+        "rejected": rejected,
+        "results": results,
+    }, status=202 if queued and events else 200)